@@ -1,2 +1,53 @@
 # AI Analysis package for Vispectra
-# This package contains modules for analyzing websites and generating insights
\ No newline at end of file
+# This package contains modules for analyzing websites and generating insights
+
+import importlib
+from types import ModuleType
+from typing import Dict, Optional
+
+# Analyzer modules, imported on first use: saliency alone pulls in cv2, numpy and PIL,
+# which API processes that only serve stored results never need
+ANALYZERS = {
+    "saliency": "app.ai_analysis.saliency",
+    "readability": "app.ai_analysis.readability",
+    "contrast": "app.ai_analysis.contrast",
+    "summarizer": "app.ai_analysis.summarizer",
+    "phash": "app.ai_analysis.phash",
+    "prompt_tester": "app.ai_analysis.prompt_tester",
+    "citation_extractor": "app.ai_analysis.citation_extractor",
+    "website_analyzer": "app.ai_analysis.website_analyzer",
+}
+
+
+def load_analyzer(name: str) -> ModuleType:
+    """Import a registered analyzer module (cached by Python after the first call)."""
+    return importlib.import_module(ANALYZERS[name])
+
+
+class LazyAnalyzer:
+    """Stands in for an analyzer module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        if name not in ANALYZERS:
+            raise KeyError(f"Unknown analyzer: {name}")
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = load_analyzer(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyAnalyzer {self._name} ({state})>"
+
+
+_analyzers: Dict[str, LazyAnalyzer] = {}
+
+
+def analyzer(name: str) -> LazyAnalyzer:
+    """The shared lazy handle of a registered analyzer."""
+    if name not in _analyzers:
+        _analyzers[name] = LazyAnalyzer(name)
+    return _analyzers[name]
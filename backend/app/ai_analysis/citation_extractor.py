@@ -1,7 +1,128 @@
 # Purpose: Extract domain mentions from LLM responses
+# A CitationMatcher compiles a set of domains / brand aliases once into a single
+# alternation regex and scans each response in one pass. Matchers are cached per
+# term set, so repeated audits against the same domains never recompile.
 
 import re
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, Iterable, Mapping, Tuple, Union
+
+Terms = Union[Iterable[str], Mapping[str, Iterable[str]]]
+
+
+def _normalize_term(term: str) -> str:
+    """Lowercase a domain/alias and drop scheme, leading 'www.' and any path."""
+    term = term.strip().lower()
+    if "//" in term:
+        term = term.split("//", 1)[1]
+    if term.startswith("www."):
+        term = term[4:]
+    # Only domains carry a path; brand aliases may legitimately contain spaces
+    if " " not in term:
+        term = term.split("/", 1)[0]
+    return term
+
+
+def _terms_key(terms: Terms) -> Tuple[Tuple[str, str], ...]:
+    """
+    Turn the caller's terms into a hashable, order-independent cache key of
+    (label, alias) pairs. A plain list of strings labels every term with itself;
+    a mapping groups aliases under one label (e.g. {"acme.com": ["Acme", "ACME Corp"]}).
+    An alias may belong to one label only: a mention can't be credited to two.
+    """
+    pairs = set()
+    if isinstance(terms, Mapping):
+        for label, aliases in terms.items():
+            label_norm = _normalize_term(label)
+            pairs.add((label_norm, label_norm))
+            for alias in aliases:
+                alias_norm = _normalize_term(alias)
+                if alias_norm:
+                    pairs.add((label_norm, alias_norm))
+    else:
+        for term in terms:
+            term_norm = _normalize_term(term)
+            if term_norm:
+                pairs.add((term_norm, term_norm))
+    owners: Dict[str, str] = {}
+    for label, alias in sorted(pairs):
+        if alias in owners:
+            raise ValueError(f"Alias '{alias}' is listed under both '{owners[alias]}' and '{label}'")
+        owners[alias] = label
+    return tuple(sorted(pairs))
+
+
+class CitationMatcher:
+    """Single-pass matcher for a fixed set of domains and aliases."""
+
+    def __init__(self, pairs: Tuple[Tuple[str, str], ...], context_chars: int = 50):
+        self.context_chars = context_chars
+        self.labels = sorted({label for label, _ in pairs})
+        # Longest alias first so "shop.acme.com" wins over "acme.com" at the same offset
+        ordered = sorted(pairs, key=lambda pair: (-len(pair[1]), pair[1]))
+        # One named group per alias: the group that matched names the label, even when
+        # case-insensitive matching hits text that lower() doesn't map back (e.g. "ſite.com")
+        self._group_labels = {f"a{i}": label for i, (label, _) in enumerate(ordered)}
+        alternation = "|".join(f"(?P<a{i}>{re.escape(alias)})" for i, (_, alias) in enumerate(ordered)) or r"(?!x)x"
+        # Word-boundary lookarounds instead of \b so aliases ending in punctuation still match
+        self.pattern = re.compile(r"(?<!\w)(?:" + alternation + r")(?!\w)", re.IGNORECASE)
+
+    def scan(self, text: str) -> Dict[str, Any]:
+        """
+        Scan one response. Returns the total count, per-label counts and the list
+        of mentions with surrounding context.
+        """
+        counts = {label: 0 for label in self.labels}
+        mentions = []
+        if not text:
+            return {"count": 0, "counts": counts, "mentions": mentions}
+
+        for match in self.pattern.finditer(text):
+            label = self._group_labels[match.lastgroup]
+            counts[label] += 1
+
+            start = max(0, match.start() - self.context_chars)
+            end = min(len(text), match.end() + self.context_chars)
+            mentions.append({
+                "term": label,
+                "text": match.group(),
+                "context": text[start:end],
+                "start": match.start(),
+                "end": match.end()
+            })
+
+        return {"count": len(mentions), "counts": counts, "mentions": mentions}
+
+    def scan_batch(self, texts: Iterable[str]) -> Dict[str, Any]:
+        """
+        Scan a list of responses. Returns the per-response results plus aggregate
+        per-label counts and the number of responses mentioning each label.
+        """
+        results = [self.scan(text) for text in texts]
+        totals = {label: 0 for label in self.labels}
+        responses_with_mention = {label: 0 for label in self.labels}
+        for result in results:
+            for label, n in result["counts"].items():
+                totals[label] += n
+                if n:
+                    responses_with_mention[label] += 1
+
+        return {
+            "responses": results,
+            "counts": totals,
+            "responses_with_mention": responses_with_mention,
+            "total": sum(totals.values())
+        }
+
+
+@lru_cache(maxsize=256)
+def _compiled_matcher(pairs: Tuple[Tuple[str, str], ...], context_chars: int) -> CitationMatcher:
+    return CitationMatcher(pairs, context_chars)
+
+
+def get_citation_matcher(terms: Terms, context_chars: int = 50) -> CitationMatcher:
+    """Return a (cached) matcher for a list of domains or a {label: aliases} mapping."""
+    return _compiled_matcher(_terms_key(terms), context_chars)
 
 
 def extract_citations(text: str, domain: str) -> Dict[str, Any]:
@@ -9,26 +130,16 @@ def extract_citations(text: str, domain: str) -> Dict[str, Any]:
     Extract mentions of a domain from text.
     Returns count and list of mentions with context.
     """
-    # Clean domain for matching
-    clean_domain = domain.lower().replace("www.", "")
-    
-    # Find all mentions of the domain
-    pattern = re.compile(r'\b' + re.escape(clean_domain) + r'\b', re.IGNORECASE)
-    matches = list(pattern.finditer(text))
-    
-    # Extract mentions with context
-    mentions = []
-    for match in matches:
-        start = max(0, match.start() - 50)
-        end = min(len(text), match.end() + 50)
-        context = text[start:end]
-        
-        mentions.append({
-            "text": match.group(),
-            "context": context
-        })
-    
+    result = get_citation_matcher([domain]).scan(text)
     return {
-        "count": len(mentions),
-        "mentions": mentions
-    }
\ No newline at end of file
+        "count": result["count"],
+        "mentions": [{"text": m["text"], "context": m["context"]} for m in result["mentions"]]
+    }
+
+
+def extract_citations_batch(texts: List[str], terms: Terms) -> Dict[str, Any]:
+    """
+    Count mentions of several domains/aliases (client + competitors) across many
+    responses in one pass per response.
+    """
+    return get_citation_matcher(terms).scan_batch(texts)
@@ -1,7 +1,7 @@
 # Purpose: compute WCAG contrast ratio for foreground/background colors.
 # Input: colors as hex strings like '#ffffff' or rgb tuples.
 
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Any
 
 
 def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
@@ -53,4 +53,49 @@ def wcag_pass_level(ratio: float) -> Dict[str, str]:
         result['large_text'] = 'AAA'
     elif ratio >= 3.0:
         result['large_text'] = 'AA'
-    return result
\ No newline at end of file
+    return result
+
+
+def rgba_to_hex(rgba: str) -> str:
+    """Convert a CSS rgb()/rgba() string to a hex color."""
+    try:
+        rgba = rgba.strip().lower()
+        if rgba.startswith("rgba"):
+            rgba = rgba.replace("rgba(", "").replace(")", "")
+            r, g, b, a = [float(x.strip()) for x in rgba.split(",")]
+            r, g, b = int(r), int(g), int(b)
+        elif rgba.startswith("rgb"):
+            rgba = rgba.replace("rgb(", "").replace(")", "")
+            r, g, b = [int(x.strip()) for x in rgba.split(",")]
+        else:
+            # Assume it's already hex
+            return rgba
+        return f"#{r:02x}{g:02x}{b:02x}"
+    except Exception:
+        return "#000000"  # Default to black on error
+
+
+def find_contrast_issues(styles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Check computed styles ({selector, text, fg, bg} per element) and return the
+    elements whose contrast fails WCAG AA for normal text.
+    """
+    issues = []
+    for style in styles:
+        fg = style.get("fg")
+        bg = style.get("bg")
+        # Transparent backgrounds inherit from ancestors we don't know about
+        if not fg or not bg or fg == "rgba(0, 0, 0, 0)" or bg == "rgba(0, 0, 0, 0)":
+            continue
+        fg_hex = rgba_to_hex(fg)
+        bg_hex = rgba_to_hex(bg)
+        ratio = contrast_ratio(fg_hex, bg_hex)
+        if wcag_pass_level(ratio)["normal_text"] == "fail":
+            issues.append({
+                "selector": style.get("selector") or "element",
+                "text": style.get("text"),
+                "foreground": fg_hex,
+                "background": bg_hex,
+                "ratio": ratio
+            })
+    return issues
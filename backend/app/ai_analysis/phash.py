@@ -0,0 +1,128 @@
+# Purpose: perceptual hashing of screenshots to find near-duplicate pages (same template).
+# dHash over the above-the-fold region: each row of a downsampled grayscale strip
+# contributes one bit per horizontal gradient. Near-identical pages differ in few bits.
+# Requirements: pillow
+
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+# PIL is imported where pixels are read: the BK-tree and hex helpers load in every API process
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Height of the first viewport captured by the screenshot stage
+FOLD_HEIGHT = 800
+
+
+def dhash(image_path: str, hash_width: int = 16, hash_rows: int = 16, fold_height: int = FOLD_HEIGHT) -> int:
+    """
+    Difference hash of the above-the-fold part of a screenshot.
+    The crop is downsampled to hash_rows strips of (hash_width + 1) pixels and
+    each bit records whether brightness increases left-to-right.
+    Returns an integer of hash_width * hash_rows bits.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img = img.convert("L")
+        img = img.crop((0, 0, img.width, min(img.height, fold_height)))
+        return _gradient_bits(img, hash_width, hash_rows)
+
+
+def _gradient_bits(gray: "Image.Image", hash_width: int, hash_rows: int) -> int:
+    from PIL import Image
+
+    small = gray.resize((hash_width + 1, hash_rows), Image.BILINEAR)
+    pixels = list(small.getdata())
+
+    value = 0
+    stride = hash_width + 1
+    for row in range(hash_rows):
+        offset = row * stride
+        for col in range(hash_width):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def dhash_frame(frame, hash_width: int = 16, hash_rows: int = 16, fold_height: int = FOLD_HEIGHT) -> int:
+    """dhash() of a screenshot held in shared memory (a shared_frames.FrameDescriptor of RGB pixels)."""
+    from PIL import Image
+    from .shared_frames import open_frame
+
+    with open_frame(frame) as rgb:
+        # Only the fold is copied out of shared memory
+        img = Image.fromarray(rgb[:fold_height]).convert("L")
+    return _gradient_bits(img, hash_width, hash_rows)
+
+
+def hash_to_hex(value: int, bits: int = 256) -> str:
+    return format(value, f"0{bits // 4}x")
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance: finds every hash within a
+    distance threshold without comparing against all stored hashes.
+    """
+
+    def __init__(self):
+        # Node: [hash, items, {distance: child}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item: Any):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def remove(self, value: int, item: Any) -> bool:
+        """Remove one item added under value; its node stays behind to route searches."""
+        node = self._root
+        while node is not None:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                if item not in node[1]:
+                    return False
+                node[1].remove(item)
+                self.size -= 1
+                return True
+            node = node[2].get(distance)
+        return False
+
+    def search(self, value: int, threshold: int) -> List[Tuple[int, Any]]:
+        """Return (distance, item) pairs within threshold, closest first."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= threshold:
+                matches.extend((distance, item) for item in node[1])
+            # Triangle inequality: only children in [d - t, d + t] can match
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        matches.sort(key=lambda m: m[0])
+        return matches
+
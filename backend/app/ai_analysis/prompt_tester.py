@@ -5,6 +5,8 @@ import httpx
 import json
 from typing import Dict, Any, List
 
+from app import tracing
+
 
 async def test_prompts(prompt: str) -> str:
     """
@@ -38,11 +40,14 @@ async def test_with_groq(prompt: str, api_key: str) -> str:
                 "max_tokens": 500
             }
             
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
+            with tracing.span("llm.http", provider="groq", model=payload["model"]) as span:
+                response = await client.post(
+                    "https://api.groq.com/openai/v1/chat/completions",
+                    headers=headers,
+                    json=payload
+                )
+                if span:
+                    span.set(status_code=response.status_code)
             
             if response.status_code == 200:
                 data = response.json()
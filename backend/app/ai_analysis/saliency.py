@@ -7,6 +7,8 @@ import numpy as np
 from PIL import Image
 import os
 
+from .phash import FOLD_HEIGHT
+
 
 def generate_spectral_residual_saliency(img_bgr: np.ndarray) -> np.ndarray:
     """
@@ -80,14 +82,7 @@ def generate_overlay_from_file(screenshot_path: str, out_overlay_path: str, out_
         if img is None or img.size == 0:
             raise RuntimeError(f"Failed to open image: {screenshot_path}")
 
-        salmap = generate_spectral_residual_saliency(img)
-        overlay = overlay_heatmap(img, salmap)
-
-        cv2.imwrite(out_overlay_path, overlay)
-        if out_salmap_path:
-            sal_gray = (salmap * 255).astype(np.uint8)
-            cv2.imwrite(out_salmap_path, sal_gray)
-        return out_overlay_path
+        return generate_overlay_from_array(img, out_overlay_path, out_salmap_path)
     except Exception as e:
         # Create a simple placeholder image for demo purposes
         h, w = 300, 400
@@ -98,4 +93,69 @@ def generate_overlay_from_file(screenshot_path: str, out_overlay_path: str, out_
         if out_salmap_path:
             cv2.imwrite(out_salmap_path, placeholder[:,:,0])
         print(f"Warning: Created placeholder image due to error: {e}")
-        return out_overlay_path
\ No newline at end of file
+        return out_overlay_path
+
+
+def generate_overlay_from_array(img_bgr: np.ndarray, out_overlay_path: str, out_salmap_path: str = None):
+    """Compute saliency of a decoded BGR image and save the overlay (and saliency map)."""
+    salmap = generate_spectral_residual_saliency(img_bgr)
+    cv2.imwrite(out_overlay_path, overlay_heatmap(img_bgr, salmap))
+    if out_salmap_path:
+        cv2.imwrite(out_salmap_path, (salmap * 255).astype(np.uint8))
+    return out_overlay_path
+
+
+def generate_overlay_from_frame(frame, out_overlay_path: str, out_salmap_path: str = None,
+                                source_salmap_path: str = None):
+    """
+    Same as the file-based entry points, for a screenshot held in shared memory
+    (a shared_frames.FrameDescriptor of an RGB array), so analyzer processes get
+    the pixels without the image being pickled to them.
+    """
+    from .shared_frames import open_frame
+
+    with open_frame(frame) as rgb:
+        img = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    if source_salmap_path:
+        return render_from_salmap(img, source_salmap_path, out_overlay_path, out_salmap_path)
+    return generate_overlay_from_array(img, out_overlay_path, out_salmap_path)
+
+
+def generate_overlay_from_salmap(screenshot_path: str, source_salmap_path: str, out_overlay_path: str,
+                                 out_salmap_path: str = None):
+    """
+    Reuse the saliency map computed for a near-identical screenshot (same page
+    template) for the fold, compute the rest of this page, and render the overlay.
+    """
+    img = cv2.imread(screenshot_path)
+    if img is None:
+        raise RuntimeError(f"Failed to open image: {screenshot_path}")
+    return render_from_salmap(img, source_salmap_path, out_overlay_path, out_salmap_path)
+
+
+def render_from_salmap(img: np.ndarray, source_salmap_path: str, out_overlay_path: str,
+                       out_salmap_path: str = None):
+    """
+    Render the overlay of a BGR image from a saliency map stored for a near-duplicate.
+    Near-duplicates are matched on the fold only, so only the fold of the stored map
+    is borrowed, and only when it lines up pixel for pixel; rows below the fold
+    (which may differ in content and height) are computed from this image.
+    """
+    source = cv2.imread(source_salmap_path, cv2.IMREAD_GRAYSCALE)
+    if source is None:
+        raise RuntimeError(f"Failed to open image: {source_salmap_path}")
+
+    h, w = img.shape[:2]
+    fold = min(FOLD_HEIGHT, h)
+    if source.shape[1] != w or source.shape[0] < fold:
+        return generate_overlay_from_array(img, out_overlay_path, out_salmap_path)
+
+    salmap = np.empty((h, w), dtype=np.float32)
+    salmap[:fold] = source[:fold].astype(np.float32) / 255.0
+    if h > fold:
+        salmap[fold:] = generate_spectral_residual_saliency(img[fold:])
+
+    cv2.imwrite(out_overlay_path, overlay_heatmap(img, salmap))
+    if out_salmap_path:
+        cv2.imwrite(out_salmap_path, (salmap * 255).astype(np.uint8))
+    return out_overlay_path
@@ -0,0 +1,158 @@
+# Purpose: hand decoded screenshots to analyzer processes without copying them.
+# The owner process decodes a screenshot once into a named shared-memory segment
+# and passes only a FrameDescriptor (name, shape, dtype); analyzers attach and
+# read the same pixels concurrently. Segments are reference counted by the owner
+# and unlinked on release, on exit, or by sweep_orphans() after a crash.
+# Requirements: numpy
+
+import atexit
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Any, Dict, Iterator, NamedTuple, Tuple
+
+# numpy is imported where frames are touched, so importing the store stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+
+# Segment names carry the owner's pid so orphans of a dead owner can be found
+SEGMENT_PREFIX = "vispectra_"
+SHM_DIR = "/dev/shm"
+
+
+class FrameDescriptor(NamedTuple):
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _owner_pid(name: str) -> int:
+    try:
+        return int(name[len(SEGMENT_PREFIX):].split("_", 1)[0])
+    except ValueError:
+        return -1
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without making this process responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Older Pythons register the attach with the resource tracker; analyzer
+        # processes share the owner's tracker, where the name is already registered
+        return shared_memory.SharedMemory(name=name)
+
+
+@contextmanager
+def open_frame(descriptor: FrameDescriptor) -> Iterator["np.ndarray"]:
+    """Read-only array view of a shared frame, valid inside the with-block."""
+    import numpy as np
+
+    shm = _attach(descriptor.name)
+    try:
+        view = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=shm.buf)
+        view.flags.writeable = False
+        yield view
+        del view
+    finally:
+        shm.close()
+
+
+class SharedFrameStore:
+    """Owner side: creates segments and unlinks each once its last reference is released."""
+
+    def __init__(self):
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def put(self, array: "np.ndarray") -> FrameDescriptor:
+        """Copy `array` into a new segment; the caller holds its first reference."""
+        import numpy as np
+
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        with self._lock:
+            self._segments[name] = shm
+            self._refs[name] = 1
+        return FrameDescriptor(name, tuple(array.shape), array.dtype.str)
+
+    def put_image(self, path: str) -> FrameDescriptor:
+        """Decode an image file to an RGB frame."""
+        import numpy as np
+        from PIL import Image
+
+        with Image.open(path) as img:
+            return self.put(np.asarray(img.convert("RGB")))
+
+    def acquire(self, descriptor: FrameDescriptor):
+        with self._lock:
+            self._refs[descriptor.name] += 1
+
+    def release(self, descriptor: FrameDescriptor):
+        with self._lock:
+            self._refs[descriptor.name] -= 1
+            if self._refs[descriptor.name] > 0:
+                return
+            del self._refs[descriptor.name]
+            shm = self._segments.pop(descriptor.name)
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            segments = list(self._segments.values())
+            self._segments.clear()
+            self._refs.clear()
+        for shm in segments:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(shm.size for shm in self._segments.values()),
+                "references": sum(self._refs.values())
+            }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_orphans() -> int:
+    """Unlink segments left behind by owner processes that no longer exist. Returns the count."""
+    if not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    for entry in os.listdir(SHM_DIR):
+        if not entry.startswith(SEGMENT_PREFIX):
+            continue
+        pid = _owner_pid(entry)
+        if pid > 0 and pid != os.getpid() and not _pid_alive(pid):
+            try:
+                os.unlink(os.path.join(SHM_DIR, entry))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+frame_store = SharedFrameStore()
+atexit.register(frame_store.close_all)
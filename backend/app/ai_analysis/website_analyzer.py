@@ -2,10 +2,13 @@
 
 import os
 import json
-import subprocess
+import asyncio
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+# Seconds a Lighthouse run may take before the process is killed
+LIGHTHOUSE_TIMEOUT = float(os.getenv("LIGHTHOUSE_TIMEOUT", "90"))
+
 
 async def analyze_website(url: str, results_dir: Path) -> Dict[str, Any]:
     """
@@ -23,6 +26,28 @@ async def analyze_website(url: str, results_dir: Path) -> Dict[str, Any]:
     return result
 
 
+async def run_lighthouse(url: str, timeout: float = LIGHTHOUSE_TIMEOUT) -> Dict[str, Any]:
+    """
+    Run the Lighthouse CLI without blocking the event loop. The process is
+    killed on timeout or when the calling task is cancelled.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "lighthouse", url, "--output=json", "--quiet", "--chrome-flags=--headless",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if proc.returncode != 0:
+        print(f"Lighthouse error: {stderr.decode('utf-8', 'replace')}")
+        return {}
+    return json.loads(stdout)
+
+
 async def analyze_with_playwright(url: str) -> Dict[str, Any]:
     """
     Use Playwright to analyze a website directly.
@@ -35,12 +60,9 @@ async def analyze_with_playwright(url: str) -> Dict[str, Any]:
         # Run Lighthouse via subprocess (requires Node.js and Lighthouse)
         lighthouse_data = {}
         try:
-            cmd = ["lighthouse", url, "--output=json", "--quiet", "--chrome-flags='--headless'"]
-            proc = subprocess.run(cmd, capture_output=True, text=True)
-            if proc.returncode == 0:
-                lighthouse_data = json.loads(proc.stdout)
-            else:
-                print(f"Lighthouse error: {proc.stderr}")
+            lighthouse_data = await run_lighthouse(url)
+        except asyncio.TimeoutError:
+            print(f"Lighthouse timed out after {LIGHTHOUSE_TIMEOUT}s")
         except Exception as e:
             print(f"Lighthouse execution error: {e}")
         
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy.orm import Session
+
+from app.database import Analysis
+from app.result_cache import result_cache
+from app.artifact_store import RESULTS_DIR, artifact_exists, copy_artifact, link_or_copy, read_artifact
+
+# Default max_age (seconds) when /api/analyze doesn't pass one; 0 disables the cache
+DEFAULT_MAX_AGE = int(os.getenv("ANALYSIS_CACHE_MAX_AGE", "0"))
+
+# Query parameters that never change page content
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid")
+
+# Derived artifacts reused as-is when a result is cloned (the new capture
+# already wrote its own screenshot, text and styles)
+CLONED_ARTIFACTS = ("overlay.png", "salmap.png")
+
+_stats = {"lookups": 0, "hits": 0, "misses": 0, "bytes_saved": 0}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for cache lookups: lowercase scheme and host, no
+    default port, no fragment, no tracking parameters, sorted query string.
+    """
+    parts = urlsplit(url.strip() if "//" in url else f"http://{url.strip()}")
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if path != "/" and path.endswith("/"):
+        path = path.rstrip("/")
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(TRACKING_PARAMS)]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_fingerprint(text: str, styles: List[Dict[str, Any]], screenshot_path: str,
+                        options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Fingerprint of what the analysis stages consume: DOM text, computed styles,
+    screenshot and the request options (prompts) that shape the result.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(options or {}, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8", "replace"))
+    digest.update(b"\0")
+    digest.update(json.dumps(styles, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(file_sha256(screenshot_path).encode("ascii") if os.path.exists(screenshot_path) else b"")
+    return digest.hexdigest()
+
+
+def find_cached_analysis(db: Session, url_key: str, fingerprint: str, max_age: int,
+                         exclude_job_id: Optional[str] = None) -> Optional[Analysis]:
+    """Most recent completed analysis of the same content within max_age seconds."""
+    _stats["lookups"] += 1
+    query = db.query(Analysis).filter(
+        Analysis.url_key == url_key,
+        Analysis.fingerprint == fingerprint,
+        Analysis.status == "completed",
+        Analysis.completed_at >= datetime.utcnow() - timedelta(seconds=max_age)
+    )
+    if exclude_job_id:
+        query = query.filter(Analysis.job_id != exclude_job_id)
+    cached = query.order_by(Analysis.completed_at.desc()).first()
+
+    # The row alone isn't enough; the stored result and its artifacts must still exist
+    if cached and not all(
+        artifact_exists(os.path.join(RESULTS_DIR, cached.job_id, name)) for name in ("result.json",) + CLONED_ARTIFACTS
+    ):
+        cached = None
+    _stats["hits" if cached else "misses"] += 1
+    return cached
+
+
+def clone_analysis_result(source: Analysis, target: Analysis, output_dir: str) -> int:
+    """
+    Reuse source's artifacts and result for target. Returns the number of bytes
+    of stored output that did not have to be recomputed.
+    """
+    source_dir = os.path.join(RESULTS_DIR, source.job_id)
+    bytes_saved = 0
+    for name in CLONED_ARTIFACTS:
+        bytes_saved += copy_artifact(os.path.join(source_dir, name), os.path.join(output_dir, name)) or 0
+
+    # result.json embeds the job's own paths, so rewrite it rather than link it
+    result_text = read_artifact(os.path.join(source_dir, "result.json")).decode("utf-8")
+    bytes_saved += len(result_text)
+    with open(os.path.join(output_dir, "result.json"), "w") as f:
+        f.write(result_text.replace(source.job_id, target.job_id))
+    result_cache.invalidate(target.job_id)
+
+    target.readability_score = source.readability_score
+    target.contrast_score = source.contrast_score
+    target.saliency_score = source.saliency_score
+    target.geo_score = source.geo_score
+    target.result_json = f"/static/results/{target.job_id}/result.json"
+    target.overlay_path = f"/static/results/{target.job_id}/overlay.png"
+    target.salmap_path = f"/static/results/{target.job_id}/salmap.png"
+    target.cached_from = source.job_id
+
+    _stats["bytes_saved"] += bytes_saved
+    return bytes_saved
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    lookups = _stats["lookups"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "default_max_age": DEFAULT_MAX_AGE
+    }
@@ -0,0 +1,539 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app import tracing
+from app.database import Analysis, Artifact, ArtifactRef, session_scope
+
+try:
+    import zstandard
+except ImportError:  # gzip is used instead
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # no br variants; clients get gzip
+    brotli = None
+
+# Per-job working directories; a finished job's files move from here into the store
+RESULTS_DIR = os.path.join("app", "static", "results")
+
+# Where artifacts are kept: local (sharded directory), s3 (S3 / MinIO) or memory (tests)
+ARTIFACT_BACKEND = os.getenv("ARTIFACT_BACKEND", "local")
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", os.path.join("app", "artifacts"))
+ARTIFACT_S3_BUCKET = os.getenv("ARTIFACT_S3_BUCKET", "")
+ARTIFACT_S3_PREFIX = os.getenv("ARTIFACT_S3_PREFIX", "artifacts")
+ARTIFACT_S3_ENDPOINT = os.getenv("ARTIFACT_S3_ENDPOINT")  # e.g. http://minio:9000
+
+# Move finished jobs' files into the store (false keeps the per-job directories)
+ARTIFACT_STORE_ENABLED = os.getenv("ARTIFACT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Text formats stored compressed, and the size below which compressing isn't worth it
+COMPRESSED_SUFFIXES = (".json", ".txt", ".csv", ".html", ".svg")
+MIN_COMPRESS_BYTES = 512
+
+ENCODING_SUFFIXES = {None: "", "zstd": ".zst", "gzip": ".gz", "br": ".br"}
+
+# Seconds a reader waits for the blobs of an artifact whose row is committed but still being written
+ARTIFACT_PENDING_WAIT_SECONDS = float(os.getenv("ARTIFACT_PENDING_WAIT_SECONDS", "5"))
+
+# Job manifests kept in memory (they change only when retention evicts a file)
+MANIFEST_CACHE_SIZE = 4096
+
+# Kind of each job file, which selects its retention policy
+ARTIFACT_KINDS = {
+    "screenshot.png": "screenshot",
+    "overlay.png": "overlay",
+    "salmap.png": "overlay",
+    "text.txt": "capture",
+    "styles.json": "capture",
+}
+
+
+def artifact_kind(name: str) -> str:
+    """screenshot, overlay, capture, summary (result and stage JSON) or other."""
+    return ARTIFACT_KINDS.get(name, "summary" if name.endswith(".json") else "other")
+
+
+def compress(data: bytes, encoding: Optional[str] = None) -> Tuple[bytes, str]:
+    """Compress with `encoding`, by default zstd when installed, else gzip."""
+    encoding = encoding or ("zstd" if zstandard is not None else "gzip")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd artifact found but the zstandard package is not installed")
+        return zstandard.ZstdCompressor(level=10).compress(data), "zstd"
+    return gzip.compress(data, compresslevel=6, mtime=0), "gzip"
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding is None:
+        return data
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd artifact found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown artifact encoding: {encoding}")
+
+
+def web_variants(data: bytes, primary: str) -> Dict[str, bytes]:
+    """
+    Extra encodings stored next to a compressed blob so HTTP clients can be
+    sent it without recompressing: gzip (understood everywhere) and br when
+    the brotli package is installed.
+    """
+    variants = {}
+    if primary != "gzip":
+        variants["gzip"] = gzip.compress(data, compresslevel=6, mtime=0)
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=9)
+    return variants
+
+
+def blob_key(digest: str, encoding: Optional[str]) -> str:
+    """Two levels of fan-out, so no directory (or S3 prefix) grows past 65536 entries."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ENCODING_SUFFIXES[encoding]}"
+
+
+class LocalBackend:
+    """Blobs as files under a sharded directory tree."""
+
+    def __init__(self, root: str = ARTIFACT_ROOT):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial blob
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self.local_path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class MemoryBackend:
+    """In-process stand-in for an object store, for tests and throwaway runs."""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self.objects[key] = data
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            if key not in self.objects:
+                raise FileNotFoundError(key)
+            return self.objects[key]
+
+    def delete(self, key: str):
+        with self._lock:
+            self.objects.pop(key, None)
+
+
+class S3Backend:
+    """Blobs as objects in an S3-compatible bucket (AWS S3, MinIO, R2)."""
+
+    def __init__(self, bucket: str = ARTIFACT_S3_BUCKET, prefix: str = ARTIFACT_S3_PREFIX,
+                 endpoint_url: Optional[str] = ARTIFACT_S3_ENDPOINT):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("ARTIFACT_BACKEND=s3 requires the boto3 package") from e
+        if not bucket:
+            raise RuntimeError("ARTIFACT_BACKEND=s3 requires ARTIFACT_S3_BUCKET")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def get(self, key: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.NoSuchKey as e:
+            raise FileNotFoundError(key) from e
+        return response["Body"].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+def make_backend(name: str = ARTIFACT_BACKEND):
+    if name == "local":
+        return LocalBackend()
+    if name == "s3":
+        return S3Backend()
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown ARTIFACT_BACKEND: {name}")
+
+
+class ArtifactStore:
+    """
+    Content-addressed, deduplicated store for job artifacts. Blobs are keyed
+    by the sha256 of their bytes; text formats are stored compressed (zstd
+    when installed, else gzip) and decompressed on read. The artifacts table
+    counts the job files referencing each blob, and a blob is deleted when
+    its last reference is released. A row is committed before its blobs are
+    written and marked pending until they are; readers wait for those.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._manifests: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Access times buffered by touch() until flush_touches() writes them
+        self._touched: Dict[str, datetime] = {}
+
+    @property
+    def backend(self):
+        # Created on first use so that importing the store never needs boto3 or S3 credentials
+        if self._backend is None:
+            self._backend = make_backend()
+        return self._backend
+
+    def put(self, data: bytes, name: str = "") -> str:
+        """Store bytes (or add a reference to identical stored bytes). Returns the digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        encoded = None
+        while True:
+            row = self._add_reference(digest)
+            if row is not None:
+                if row.pending:
+                    # Its first publisher is still writing the blobs (or failed to): write them
+                    # too, so this reference never points at nothing
+                    self._store_blobs(digest, *self._encode(data, name, row))
+                return digest
+            if encoded is None:
+                encoded = self._encode(data, name)
+            blob, encoding, variants = encoded
+            try:
+                with session_scope() as db:
+                    db.add(Artifact(
+                        digest=digest, size=len(data),
+                        stored_size=len(blob) + sum(len(b) for b in variants.values()),
+                        encoding=encoding, variants=",".join(variants) or None,
+                        media_type=mimetypes.guess_type(name)[0], refcount=1, pending=True
+                    ))
+                break
+            except IntegrityError:
+                # Another publisher stored the same bytes first; reference its row (unless already released)
+                continue
+        # Written once the row exists: a release() of an earlier row of these bytes
+        # has already deleted its blobs, so nothing removes these (and stale files are replaced)
+        self._store_blobs(digest, *encoded)
+        return digest
+
+    @staticmethod
+    def _encode(data: bytes, name: str, row: Optional[Artifact] = None) -> Tuple[bytes, Optional[str], Dict[str, bytes]]:
+        """(blob, encoding, variants) to store: chosen by name and size, or the ones an existing row records."""
+        if row is not None:
+            if row.encoding is None:
+                return data, None, {}
+            stored = stored_encodings(row)
+            variants = {variant: blob for variant, blob in web_variants(data, row.encoding).items() if variant in stored}
+            return compress(data, row.encoding)[0], row.encoding, variants
+        if name.endswith(COMPRESSED_SUFFIXES) and len(data) >= MIN_COMPRESS_BYTES:
+            packed, encoding = compress(data)
+            if len(packed) < len(data):
+                return packed, encoding, web_variants(data, encoding)
+        return data, None, {}
+
+    def _store_blobs(self, digest: str, blob: bytes, encoding: Optional[str], variants: Dict[str, bytes]):
+        """Write the blobs behind a reference this put() holds; if that fails the reference is dropped."""
+        try:
+            self.backend.put(blob_key(digest, encoding), blob)
+            for variant, variant_blob in variants.items():
+                self.backend.put(blob_key(digest, variant), variant_blob)
+        except Exception:
+            self.release(digest)
+            raise
+        with session_scope() as db:
+            db.query(Artifact).filter(Artifact.digest == digest).update(
+                {Artifact.pending: False}, synchronize_session=False
+            )
+
+    def _add_reference(self, digest: str) -> Optional[Artifact]:
+        """Count one more reference to stored bytes; returns their row, or None if they aren't stored."""
+        with session_scope() as db:
+            if not db.query(Artifact).filter(Artifact.digest == digest).update(
+                {Artifact.refcount: Artifact.refcount + 1}, synchronize_session=False
+            ):
+                return None
+            return db.query(Artifact).filter(Artifact.digest == digest).first()
+
+    def info(self, digest: str) -> Optional[Artifact]:
+        with session_scope() as db:
+            return db.query(Artifact).filter(Artifact.digest == digest).first()
+
+    def wait_stored(self, digest: str, timeout: float = ARTIFACT_PENDING_WAIT_SECONDS) -> Optional[Artifact]:
+        """The row of an artifact once its blobs are written; None if it is gone or still pending after timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self.info(digest)
+            if row is None or not row.pending:
+                return row
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def get_encoded(self, row: Artifact, encoding: Optional[str]) -> bytes:
+        """Stored bytes of one encoding of an artifact (None: the original bytes)."""
+        try:
+            if encoding is None:
+                return decompress(self.backend.get(blob_key(row.digest, row.encoding)), row.encoding)
+            return self.backend.get(blob_key(row.digest, encoding))
+        except FileNotFoundError as e:
+            # A pending artifact isn't gone: its blobs are being written
+            stored = self.wait_stored(row.digest) if row.pending else None
+            if stored is None:
+                raise KeyError(row.digest) from e
+            return self.get_encoded(stored, encoding)
+
+    def local_path(self, row: Artifact, encoding: Optional[str]) -> Optional[str]:
+        """Path of a stored encoding on local disk, for zero-copy and ranged responses."""
+        path = self.backend.local_path(blob_key(row.digest, encoding))
+        return path if path and os.path.exists(path) else None
+
+    def get(self, digest: str) -> bytes:
+        """The original bytes of an artifact. Raises KeyError if it isn't stored."""
+        row = self.info(digest)
+        if row is None:
+            raise KeyError(digest)
+        return self.get_encoded(row, None)
+
+    def release(self, digest: str):
+        """Drop one reference; the blob is deleted with its last one."""
+        with session_scope() as db:
+            # The decrement locks the row: a put() of the same bytes waits for this transaction
+            db.query(Artifact).filter(Artifact.digest == digest).update(
+                {Artifact.refcount: Artifact.refcount - 1}, synchronize_session=False
+            )
+            row = db.query(Artifact).filter(Artifact.digest == digest).first()
+            if row is None or row.refcount > 0:
+                return
+            # Delete the blobs before the row, while it's still locked, so they can't outlive a fresh put()
+            for encoding in stored_encodings(row):
+                self.backend.delete(blob_key(digest, encoding))
+            db.delete(row)
+
+    def publish_job(self, job_id: str, output_dir: str) -> Dict[str, str]:
+        """Store every file of a job's working directory. Returns the manifest {name: digest}."""
+        manifest = {}
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            if not os.path.isfile(path):
+                continue
+            with tracing.span("artifact.put", file=name):
+                with open(path, "rb") as f:
+                    manifest[name] = self.put(f.read(), name)
+        with session_scope() as db:
+            db.add_all(
+                ArtifactRef(job_id=job_id, name=name, digest=digest, kind=artifact_kind(name))
+                for name, digest in manifest.items()
+            )
+        return manifest
+
+    def add_job_file(self, job_id: str, name: str, data: bytes) -> str:
+        """Add (or replace) one file of an already published job."""
+        self.drop_job_file(job_id, name)
+        digest = self.put(data, name)
+        with session_scope() as db:
+            db.add(ArtifactRef(job_id=job_id, name=name, digest=digest, kind=artifact_kind(name)))
+            analysis = db.query(Analysis).filter(Analysis.job_id == job_id).first()
+            if analysis is not None:
+                manifest = json.loads(analysis.artifacts or "{}")
+                manifest[name] = digest
+                analysis.artifacts = json.dumps(manifest)
+        self.forget(job_id)
+        return digest
+
+    def drop_job_file(self, job_id: str, name: str) -> bool:
+        """Remove a file from a published job and release its blob. False if it wasn't there."""
+        with session_scope() as db:
+            ref = db.query(ArtifactRef).filter(ArtifactRef.job_id == job_id, ArtifactRef.name == name).first()
+            if ref is None:
+                return False
+            digest = ref.digest
+            # Only the process whose delete wins releases the blob
+            deleted = db.query(ArtifactRef).filter(ArtifactRef.id == ref.id).delete(synchronize_session=False)
+            analysis = db.query(Analysis).filter(Analysis.job_id == job_id).first()
+            if deleted and analysis is not None and analysis.artifacts:
+                manifest = json.loads(analysis.artifacts)
+                manifest.pop(name, None)
+                analysis.artifacts = json.dumps(manifest)
+        self.forget(job_id)
+        if deleted:
+            self.release(digest)
+        return bool(deleted)
+
+    def touch(self, digest: str):
+        """Record an access for LRU eviction; buffered so serving a file never writes to the database."""
+        with self._lock:
+            self._touched[digest] = datetime.utcnow()
+
+    def flush_touches(self) -> int:
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with session_scope() as db:
+                for digest, accessed in touched.items():
+                    db.query(Artifact).filter(Artifact.digest == digest).update(
+                        {Artifact.last_accessed: accessed}, synchronize_session=False
+                    )
+        return len(touched)
+
+    def retire_job_dir(self, job_id: str, output_dir: str, manifest: Dict[str, str]):
+        """Once the manifest is committed, the working directory is no longer needed."""
+        self._remember(job_id, manifest)
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    def _remember(self, job_id: str, manifest: Dict[str, str]):
+        with self._lock:
+            self._manifests[job_id] = manifest
+            self._manifests.move_to_end(job_id)
+            while len(self._manifests) > MANIFEST_CACHE_SIZE:
+                self._manifests.popitem(last=False)
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._manifests.pop(job_id, None)
+
+    def manifest(self, job_id: str) -> Dict[str, str]:
+        """{name: digest} of a published job; empty while the job's files are still on disk."""
+        with self._lock:
+            if job_id in self._manifests:
+                self._manifests.move_to_end(job_id)
+                return self._manifests[job_id]
+        with session_scope() as db:
+            row = db.query(Analysis.artifacts).filter(Analysis.job_id == job_id).first()
+        if not row or not row[0]:
+            return {}
+        manifest = json.loads(row[0])
+        self._remember(job_id, manifest)
+        return manifest
+
+    def stats(self) -> Dict[str, Any]:
+        with session_scope() as db:
+            blobs, size, stored_size, references = db.query(
+                func.count(Artifact.id), func.sum(Artifact.size), func.sum(Artifact.stored_size),
+                func.sum(Artifact.refcount)
+            ).one()
+        return {
+            "backend": ARTIFACT_BACKEND,
+            "blobs": blobs,
+            "references": references or 0,
+            "bytes": size or 0,
+            "stored_bytes": stored_size or 0,
+            "compression_ratio": round((size or 0) / stored_size, 2) if stored_size else 1.0
+        }
+
+
+artifact_store = ArtifactStore()
+
+
+def stored_encodings(row: Artifact) -> List[Optional[str]]:
+    """Every encoding stored for an artifact: its primary blob, then its HTTP variants."""
+    return [row.encoding] + (row.variants.split(",") if row.variants else [])
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-link unchanged artifacts so a cache hit costs no extra disk."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _job_file(path: str) -> Optional[Tuple[str, str]]:
+    """(job_id, name) of a path inside RESULTS_DIR, or None."""
+    relative = os.path.relpath(os.path.normpath(path), RESULTS_DIR)
+    parts = relative.split(os.sep)
+    if len(parts) != 2 or parts[0] in (os.curdir, os.pardir):
+        return None
+    return parts[0], parts[1]
+
+
+def read_artifact(path: str) -> Optional[bytes]:
+    """
+    Bytes of a job file by its results path: from the job's working directory
+    while it exists, otherwise from the artifact store. None if it's gone.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    job_file = _job_file(path)
+    if job_file is None:
+        return None
+    digest = artifact_store.manifest(job_file[0]).get(job_file[1])
+    if digest is None:
+        return None
+    try:
+        data = artifact_store.get(digest)
+    except KeyError:
+        return None
+    artifact_store.touch(digest)
+    return data
+
+
+def artifact_exists(path: str) -> bool:
+    if os.path.exists(path):
+        return True
+    job_file = _job_file(path)
+    return job_file is not None and job_file[1] in artifact_store.manifest(job_file[0])
+
+
+def copy_artifact(src: str, dst: str) -> Optional[int]:
+    """Copy a job file (hard-linked when it's still on disk). Returns its size, or None if it's gone."""
+    if os.path.exists(src):
+        link_or_copy(src, dst)
+        return os.path.getsize(dst)
+    data = read_artifact(src)
+    if data is None:
+        return None
+    with open(dst, "wb") as f:
+        f.write(data)
+    return len(data)
@@ -1,70 +1,322 @@
 import asyncio
 import os
 import json
+import time
 import uuid
-import numpy
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+from typing import Dict, Any, Awaitable, List, Optional, Set, Tuple
 
-from sqlalchemy.orm import Session
-from playwright.async_api import async_playwright
-
-from app.database import Analysis
-from app.ai_analysis import saliency, readability, contrast, summarizer
+from app import analysis_cache, tracing
+from app.database import Analysis, session_scope
+from app.db_writer import db_writer
+from app.result_cache import result_cache
+from app.artifact_store import ARTIFACT_STORE_ENABLED, artifact_store, copy_artifact
+from app.ai_analysis import analyzer
 from app.ai_analysis.schemas import AnalysisResult, SaliencyResult, ReadabilityResult
-from app.ai_analysis.prompt_tester import test_prompts
-from app.ai_analysis.citation_extractor import extract_citations
+from app.events import publish_event
+from app.browser_pool import browser_pool
+from app.scheduler import scheduler
+from app.metrics import JOB_SECONDS, track_stage
+from app.stages import Fallback, StageRunner, hash_frame_pixels, hash_image_pixels, hash_json, hash_text
+from app.ai_analysis.shared_frames import FrameDescriptor, frame_store
+from app.cpu_pool import CPU_WORKERS, cpu_pool
+from app.near_duplicates import saliency_index
 
+# Time budget (seconds) of each pipeline stage, and of the whole job
+STAGE_TIMEOUTS = {
+    "capture": float(os.getenv("STAGE_TIMEOUT_CAPTURE", "60")),
+    "saliency": float(os.getenv("STAGE_TIMEOUT_SALIENCY", "60")),
+    "readability": float(os.getenv("STAGE_TIMEOUT_READABILITY", "15")),
+    "contrast": float(os.getenv("STAGE_TIMEOUT_CONTRAST", "15")),
+    "prompts": float(os.getenv("STAGE_TIMEOUT_PROMPTS", "120")),
+}
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE_SECONDS", "300"))
+# Seconds another job's LLM answers to the same prompts stay reusable. LLM answers
+# (and so citation counts) change over time, so by default every job asks again
+PROMPTS_REUSE_SECONDS = float(os.getenv("PROMPTS_REUSE_SECONDS", "0"))
 
-async def process_analysis_job(job_id: str, url: str, db: Session):
-    """Process an analysis job in the background"""
-    # Update job status to processing
-    analysis = db.query(Analysis).filter(Analysis.job_id == job_id).first()
+# Analyzers load on the first job, not at import: processes that never run one skip cv2 and numpy
+saliency = analyzer("saliency")
+readability = analyzer("readability")
+contrast = analyzer("contrast")
+summarizer = analyzer("summarizer")
+phash = analyzer("phash")
+prompt_tester = analyzer("prompt_tester")
+citation_extractor = analyzer("citation_extractor")
+
+
+# Jobs being cancelled because this process lost their lease: another worker
+# runs them now, so their unwinding must not record or announce an outcome
+_handed_over: Set[str] = set()
+
+
+def hand_over(job_id: str):
+    """Mark a running job as owned elsewhere before cancelling its task."""
+    _handed_over.add(job_id)
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Stage '{stage}' exceeded its time budget ({seconds:g}s)")
+        self.stage = stage
+
+
+class JobDeadline:
+    """Runs each stage under min(stage budget, time left before the job deadline)."""
+
+    def __init__(self, analysis: Analysis, seconds: float = JOB_DEADLINE):
+        self.analysis = analysis
+        self.expires = time.monotonic() + seconds
+
+    async def run(self, stage: str, awaitable: Awaitable[Any]) -> Any:
+        # The current stage is recorded so a stopped job says where it stopped
+        self.analysis.stage = stage
+        budget = min(STAGE_TIMEOUTS.get(stage, JOB_DEADLINE), self.expires - time.monotonic())
+        try:
+            with track_stage(stage):
+                return await asyncio.wait_for(awaitable, max(budget, 0))
+        except asyncio.TimeoutError:
+            raise StageTimeout(stage, max(budget, 0))
+
+
+# Score and artifact columns copied from the source job on a result-cache hit
+RESULT_COLUMNS = (
+    "readability_score", "contrast_score", "saliency_score", "geo_score",
+    "grade_level", "total_mentions", "contrast_issue_count", "suggestion_count",
+    "result_json", "overlay_path", "salmap_path"
+)
+
+# Computed foreground/background colors of text elements, used for contrast checks
+EXTRACT_STYLES_JS = """
+    () => {
+        const textElements = Array.from(document.querySelectorAll('h1, h2, h3, p, a, button, li'));
+        return textElements.map(el => {
+            const style = window.getComputedStyle(el);
+            return {
+                selector: el.tagName.toLowerCase() + (el.id ? '#' + el.id : '') +
+                         (typeof el.className === 'string' && el.className ? '.' + el.className.trim().replace(/\\s+/g, '.') : ''),
+                text: el.innerText.substring(0, 50),
+                fg: style.color,
+                bg: style.backgroundColor
+            };
+        });
+    }
+"""
+
+
+async def process_analysis_job(job_id: str, url: str, prompts: Optional[List[str]] = None,
+                               max_age: Optional[int] = None, force: bool = False):
+    """
+    Process an analysis job in the background.
+    With max_age > 0, a completed analysis of identical content captured within
+    the last max_age seconds is cloned instead of rerunning the stages. Otherwise
+    each stage whose inputs are unchanged since the last run of this URL reuses
+    that run's output. force=True recomputes everything.
+    Every stage runs under its STAGE_TIMEOUTS budget and the job under
+    JOB_DEADLINE; a timed-out or cancelled job records the stage it stopped in.
+    The job holds no database session while it runs: reads use short
+    session_scope() blocks and bookkeeping writes go through db_writer.
+    Returns the outcome ("completed", "cached" or "failed"; None for an unknown
+    job); a cancelled job raises CancelledError.
+    """
+    # `analysis` is a detached snapshot that tracks this run's state
+    with session_scope() as db:
+        analysis = db.query(Analysis).filter(Analysis.job_id == job_id).first()
     if not analysis:
         return
     
+    # Update job status to processing
     analysis.status = "processing"
-    db.commit()
+    analysis.attempts = (analysis.attempts or 0) + 1
+    db_writer.update_job(job_id, status="processing", attempts=analysis.attempts)
+    await publish_event(job_id, "processing", url=url, attempt=analysis.attempts)
+    deadline = JobDeadline(analysis)
+    frame = None
+    started = time.perf_counter()
+    outcome = "failed"
+    # Always set, so an untraced job never adopts the span of the request that started the scheduler
+    job_span = _start_job_span(analysis)
+    trace_token = tracing.attach(job_span)
     
     try:
         # Create output directory if it doesn't exist
         output_dir = os.path.join("app", "static", "results", job_id)
         os.makedirs(output_dir, exist_ok=True)
         
-        # Capture screenshot
+        # Capture screenshot, unless an interrupted run of this job already did
         screenshot_path = os.path.join(output_dir, "screenshot.png")
-        text_content = await capture_screenshot(url, screenshot_path)
+        text_path = os.path.join(output_dir, "text.txt")
+        styles_path = os.path.join(output_dir, "styles.json")
+        if analysis.checkpoint and all(os.path.exists(p) for p in (screenshot_path, text_path, styles_path)):
+            with open(text_path, "r") as f:
+                text_content = f.read()
+            with open(styles_path, "r") as f:
+                styles = json.load(f)
+            await publish_event(job_id, "resumed", checkpoint=analysis.checkpoint)
+        else:
+            text_content, styles = await deadline.run("capture", capture_screenshot(url, screenshot_path))
+            with tracing.span("file.write", file="text.txt", bytes=len(text_content)):
+                with open(text_path, "w") as f:
+                    f.write(text_content)
+            with tracing.span("file.write", file="styles.json"):
+                with open(styles_path, "w") as f:
+                    json.dump(styles, f)
+            analysis.checkpoint = "capture"
+            await publish_event(job_id, "captured", text_length=len(text_content))
+        
+        # With analyzer processes, decode the screenshot once into shared memory; they read that single copy
+        if CPU_WORKERS > 0:
+            try:
+                frame = await asyncio.to_thread(frame_store.put_image, screenshot_path)
+            except Exception as e:
+                print(f"Error loading screenshot into shared memory: {e}")
+        
+        # Reuse a previous result when the page content hasn't changed
+        prompts = prompts or [f"Analyze this website: {url}"]
+        analysis.url_key = analysis_cache.normalize_url(url)
+        analysis.fingerprint = analysis_cache.content_fingerprint(
+            text_content, styles, screenshot_path, {"prompts": prompts}
+        )
+        try:
+            with track_stage("phash"):
+                if frame:
+                    value = await cpu_pool.run(phash.dhash_frame, frame)
+                else:
+                    value = await asyncio.to_thread(phash.dhash, screenshot_path)
+            analysis.phash = phash.hash_to_hex(value)
+        except Exception as e:
+            print(f"Error computing perceptual hash: {e}")
+        db_writer.update_job(
+            job_id, url_key=analysis.url_key, fingerprint=analysis.fingerprint, phash=analysis.phash,
+            checkpoint=analysis.checkpoint
+        )
+        
+        max_age = analysis_cache.DEFAULT_MAX_AGE if max_age is None else max_age
+        cached = None
+        if max_age > 0 and not force:
+            with session_scope() as db:
+                cached = analysis_cache.find_cached_analysis(
+                    db, analysis.url_key, analysis.fingerprint, max_age, exclude_job_id=job_id
+                )
+        if cached:
+            with track_stage("clone"):
+                # Copies (possibly from S3) run in a thread so other jobs' events keep flowing
+                bytes_saved = await asyncio.to_thread(analysis_cache.clone_analysis_result, cached, analysis, output_dir)
+            manifest = await _publish_artifacts(job_id, output_dir)
+            await db_writer.update_job(
+                job_id, status="completed", stage=None, completed_at=datetime.utcnow(),
+                **{column: getattr(analysis, column) for column in RESULT_COLUMNS}, cached_from=analysis.cached_from,
+                artifacts=json.dumps(manifest) if manifest else None
+            )
+            _retire_output_dir(job_id, output_dir, manifest)
+            await publish_event(job_id, "cache_hit", source_job_id=cached.job_id, bytes_saved=bytes_saved)
+            await publish_event(job_id, "completed", geo_score=analysis.geo_score)
+            outcome = "cached"
+            return outcome
+        
+        stages = StageRunner(analysis, output_dir, force=force)
         
-        # Process saliency
+        # Process saliency (reused when the screenshot pixels are unchanged)
         overlay_path = os.path.join(output_dir, "overlay.png")
         salmap_path = os.path.join(output_dir, "salmap.png")
-        saliency_result = await process_saliency(screenshot_path, overlay_path, salmap_path)
         
-        # Process readability
-        readability_result = process_readability(text_content)
+        near_duplicate = None
         
-        # Process contrast (mock data for now)
-        contrast_issues = []
+        async def compute_saliency():
+            nonlocal near_duplicate
+            # Pages built from the same template can share the fold of a saliency map
+            if analysis.phash and not force:
+                with session_scope() as db:
+                    near_duplicate = saliency_index.find(db, analysis.phash, exclude_job_id=job_id)
+            source_salmap_path = None
+            if near_duplicate:
+                # Analyzers read files; bring a stored saliency map into the working directory
+                source_salmap_path = os.path.join(output_dir, "source_salmap.png")
+                if not await asyncio.to_thread(copy_artifact, near_duplicate[1], source_salmap_path):
+                    source_salmap_path = None
+            try:
+                return (await process_saliency(
+                    screenshot_path, overlay_path, salmap_path, source_salmap_path, frame
+                )).dict()
+            except Exception as e:
+                # Score the page with a neutral value, but don't let other jobs reuse it
+                print(f"Error processing saliency: {e}")
+                return Fallback(SaliencyResult(
+                    saliency_png=overlay_path, salmap_png=salmap_path, cta_saliency=0.5, dominant_regions=[]
+                ).dict())
+            finally:
+                if source_salmap_path and os.path.exists(source_salmap_path):
+                    os.remove(source_salmap_path)
         
-        # Generate suggestions
-        suggestions = summarizer.generate_suggestions(
-            saliency_summary=saliency_result,
-            contrast_issues=contrast_issues,
-            readability_result=readability_result
+        if frame:
+            pixels_hash = await asyncio.to_thread(hash_frame_pixels, frame)
+        else:
+            pixels_hash = await asyncio.to_thread(hash_image_pixels, screenshot_path)
+        saliency_output, reused = await deadline.run("saliency", stages.run(
+            "saliency", pixels_hash, compute_saliency, artifacts=("overlay.png", "salmap.png")
+        ))
+        # The pixel stages are done; give the shared-memory segment back now rather than at job end
+        if frame is not None:
+            frame_store.release(frame)
+            frame = None
+        saliency_result = SaliencyResult(**saliency_output)
+        if analysis.phash and "saliency" not in stages.fallbacks:
+            saliency_index.add(analysis.phash, job_id)
+        await publish_event(
+            job_id, "saliency", cta_saliency=saliency_result.cta_saliency, reused=reused,
+            near_duplicate_of=near_duplicate[0] if near_duplicate else None
         )
         
-        # Test prompt with LLM
-        prompt_result = await test_prompts(url)
+        # Process readability (reused when the text is unchanged)
+        readability_output, reused = await deadline.run("readability", stages.run(
+            "readability", hash_text(text_content),
+            lambda: asyncio.to_thread(_readability_output, text_content)
+        ))
+        readability_result = ReadabilityResult(**readability_output)
+        await publish_event(job_id, "readability", flesch_reading_ease=readability_result.flesch_reading_ease,
+                            reused=reused)
+        
+        # Process contrast (reused when the computed styles are unchanged)
+        contrast_issues, reused = await deadline.run("contrast", stages.run(
+            "contrast", hash_json(styles), lambda: asyncio.to_thread(contrast.find_contrast_issues, styles)
+        ))
+        await publish_event(job_id, "contrast", issues=len(contrast_issues), reused=reused)
+        
+        # Generate suggestions
+        with track_stage("suggestions"):
+            suggestions = summarizer.generate_suggestions(
+                saliency_summary=saliency_result.dict(),
+                contrast_issues=contrast_issues,
+                readability=readability_result.dict()
+            )
+        
+        # Test prompts with LLM (reused when the prompts are unchanged, within PROMPTS_REUSE_SECONDS)
+        async def compute_prompts():
+            responses = []
+            for i, prompt in enumerate(prompts, 1):
+                with tracing.span("llm.prompt", index=i, prompt_chars=len(prompt)):
+                    responses.append(await prompt_tester.test_prompts(prompt))
+                await publish_event(job_id, "prompts", done=i, total=len(prompts))
+            return responses
+        
+        responses, reused = await deadline.run("prompts", stages.run(
+            "prompts", hash_json(prompts), compute_prompts, max_age=PROMPTS_REUSE_SECONDS
+        ))
+        if reused:
+            await publish_event(job_id, "prompts", done=len(prompts), total=len(prompts), reused=True)
         
         # Extract citations
         domain = url.split("//")[-1].split("/")[0]
-        citation_result = extract_citations(prompt_result.get("response", ""), domain)
+        with track_stage("citations"):
+            citation_result = citation_extractor.extract_citations_batch(responses, [domain])
+        await publish_event(job_id, "citations", total_mentions=citation_result["total"])
         
         # Calculate GEO score
+        saliency_score = saliency_result.cta_saliency * 100 if saliency_result.cta_saliency else 70
         geo_score = calculate_geo_score(
             readability_score=readability_result.flesch_reading_ease,
             contrast_score=100 if not contrast_issues else 80,
-            saliency_score=saliency_result.cta_saliency * 100 if saliency_result.cta_saliency else 70
+            saliency_score=saliency_score
         )
         
         # Create analysis result
@@ -76,120 +328,232 @@ async def process_analysis_job(job_id: str, url: str, db: Session):
             contrast_issues=contrast_issues,
             suggestions=suggestions,
             prompt_details=[{
-                "prompt": "Analyze this website",
-                "response": prompt_result.get("response", ""),
-                "citation_count": len(citation_result.get("mentions", [])),
-                "citations": citation_result.get("mentions", [])
-            }],
+                "prompt": prompt,
+                "response": response,
+                "citation_count": scan["count"],
+                "citations": [{"text": m["text"], "context": m["context"]} for m in scan["mentions"]]
+            } for prompt, response, scan in zip(prompts, responses, citation_result["responses"])],
             geo_summary={
                 "geo_score": geo_score,
-                "total_mentions": len(citation_result.get("mentions", []))
+                "total_mentions": citation_result["total"]
             },
             axe_violations=[]
         )
         
         # Save result to JSON file
         result_path = os.path.join(output_dir, "result.json")
-        with open(result_path, "w") as f:
-            f.write(result.json())
-        
-        # Update database record
-        analysis.status = "completed"
-        analysis.completed_at = datetime.utcnow()
-        analysis.readability_score = readability_result.flesch_reading_ease
-        analysis.contrast_score = 100 if not contrast_issues else 80
-        analysis.saliency_score = saliency_result.cta_saliency * 100 if saliency_result.cta_saliency else 70
-        analysis.geo_score = geo_score
-        analysis.result_json = f"/static/results/{job_id}/result.json"
-        analysis.overlay_path = f"/static/results/{job_id}/overlay.png"
-        analysis.salmap_path = f"/static/results/{job_id}/salmap.png"
-        db.commit()
+        with track_stage("encode"):
+            encoded = result.json()
+            with tracing.span("file.write", file="result.json", bytes=len(encoded)):
+                with open(result_path, "w") as f:
+                    f.write(encoded)
+        result_cache.invalidate(job_id)
+        with track_stage("publish"):
+            manifest = await _publish_artifacts(job_id, output_dir)
         
+        # Update database record (awaited: the job only counts as done once this is durable)
+        with tracing.span("db.commit"):
+            await db_writer.update_job(
+                job_id,
+                status="completed",
+                stage=None,
+                completed_at=datetime.utcnow(),
+                readability_score=readability_result.flesch_reading_ease,
+                contrast_score=100 if not contrast_issues else 80,
+                saliency_score=saliency_score,
+                geo_score=geo_score,
+                grade_level=readability_result.flesch_kincaid_grade,
+                total_mentions=citation_result["total"],
+                contrast_issue_count=len(contrast_issues),
+                suggestion_count=len(suggestions),
+                result_json=f"/static/results/{job_id}/result.json",
+                overlay_path=f"/static/results/{job_id}/overlay.png",
+                salmap_path=f"/static/results/{job_id}/salmap.png",
+                artifacts=json.dumps(manifest) if manifest else None
+            )
+        _retire_output_dir(job_id, output_dir, manifest)
+        await publish_event(job_id, "completed", geo_score=geo_score)
+        outcome = "completed"
+        
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        if job_id in _handed_over:
+            # The lease expired and the job was re-queued; its new run owns the status
+            outcome = "handed_over"
+            raise
+        if scheduler.draining:
+            # Server shutdown: leave the job pending so recovery resumes it from its checkpoint
+            outcome = "interrupted"
+            analysis.status = "pending"
+            await db_writer.update_job(job_id, status="pending", stage=analysis.stage)
+            await publish_event(job_id, "interrupted", during=analysis.stage)
+            raise
+        # DELETE /api/job/{id} or the scheduler's hard timeout: keep what is known, then unwind
+        await _record_stop(analysis, "cancelled", f"Cancelled during stage '{analysis.stage}'")
+        await publish_event(job_id, "cancelled", during=analysis.stage)
+        raise
     except Exception as e:
         # Update job status to failed
-        analysis.status = "failed"
-        analysis.error = str(e)
-        db.commit()
+        await _record_stop(analysis, "failed", str(e))
+        await publish_event(job_id, "failed", error=str(e), during=analysis.stage)
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        _handed_over.discard(job_id)
+        tracing.detach(trace_token)
+        if job_span is not None:
+            job_span.set(outcome=outcome)
+            if outcome not in ("completed", "cached"):
+                job_span.set(stage=analysis.stage)
+            if outcome == "failed":
+                job_span.status, job_span.error = "error", analysis.error
+            elif outcome in ("cancelled", "interrupted", "handed_over"):
+                job_span.status = "cancelled"
+            job_span.finish()
+        if frame is not None:
+            frame_store.release(frame)
+    return outcome
 
 
-async def capture_screenshot(url: str, output_path: str) -> str:
-    """Capture a screenshot of a URL and extract text content"""
+def _start_job_span(analysis: Analysis) -> Optional[tracing.Span]:
+    """Open the span of this run of a sampled job, after recording how long its first run waited in the queue."""
+    if not analysis.trace_id:
+        return None
+    now = time.time()
+    if analysis.attempts == 1 and analysis.created_at:
+        queued = tracing.Span(
+            "queue", analysis.trace_id, analysis.trace_parent_id,
+            start=analysis.created_at.replace(tzinfo=timezone.utc).timestamp()
+        )
+        queued.finish(end=now)
+    return tracing.Span(
+        "job", analysis.trace_id, analysis.trace_parent_id,
+        {"job_id": analysis.job_id, "url": analysis.url, "attempt": analysis.attempts}, start=now
+    )
+
+
+async def _publish_artifacts(job_id: str, output_dir: str) -> Optional[Dict[str, str]]:
+    """Move a finished job's files into the artifact store; on failure they stay on disk."""
+    if not ARTIFACT_STORE_ENABLED:
+        return None
+    try:
+        return await asyncio.to_thread(artifact_store.publish_job, job_id, output_dir)
+    except Exception as e:
+        print(f"Error publishing artifacts of job {job_id}: {e}")
+        return None
+
+
+def _retire_output_dir(job_id: str, output_dir: str, manifest: Optional[Dict[str, str]]):
+    # Only after the manifest is committed, so readers always find the files somewhere
+    if manifest:
+        artifact_store.retire_job_dir(job_id, output_dir, manifest)
+
+
+async def _record_stop(analysis: Analysis, status: str, error: str):
+    """Persist the outcome of a job that stopped early, including the stage it stopped in."""
+    analysis.status = status
+    analysis.error = error
+    await db_writer.update_job(
+        analysis.job_id, status=status, stage=analysis.stage, error=error, completed_at=datetime.utcnow()
+    )
+
+
+async def run_analysis_job(job_id: str, url: str, prompts: Optional[List[str]] = None,
+                           max_age: Optional[int] = None, force: bool = False):
+    """Run a job outside any request (scheduler, batches, workers); returns its outcome."""
+    return await process_analysis_job(job_id, url, prompts, max_age, force)
+
+
+async def capture_screenshot(url: str, output_path: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Capture a screenshot of a URL and extract text content and computed text styles"""
     text_content = ""
-    async with async_playwright() as p:
-        browser_type = os.getenv("PLAYWRIGHT_BROWSERTYPE", "chromium")
-        browser = await getattr(p, browser_type).launch()
-        page = await browser.new_page()
-        
-        # Set viewport size
-        await page.set_viewport_size({"width": 1280, "height": 800})
-        
-        try:
-            # Navigate to URL
+    styles = []
+    async with browser_pool.page(viewport={"width": 1280, "height": 800}) as page:
+        # Navigate to URL
+        with tracing.span("browser.goto", url=url):
             await page.goto(url, wait_until="networkidle")
-            
-            # Extract text content
+        
+        # Extract text content
+        with tracing.span("browser.evaluate", script="inner_text"):
             text_content = await page.evaluate("() => document.body.innerText")
-            
-            # Take screenshot
+        
+        # Extract styles for contrast
+        with tracing.span("browser.evaluate", script="extract_styles") as s:
+            styles = await page.evaluate(EXTRACT_STYLES_JS)
+            if s:
+                s.set(elements=len(styles))
+        
+        # Take screenshot
+        with tracing.span("browser.screenshot"):
             await page.screenshot(path=output_path, full_page=True)
-        finally:
-            await browser.close()
     
-    return text_content
+    return text_content, styles
 
 
-async def process_saliency(screenshot_path: str, overlay_path: str, salmap_path: str) -> SaliencyResult:
-    """Process saliency for a screenshot"""
-    try:
-        # Generate saliency map and overlay
-        saliency_map = saliency.spectral_residual_saliency(screenshot_path)
-        saliency.save_heatmap_overlay(screenshot_path, saliency_map, overlay_path, salmap_path)
-        
-        # Calculate CTA saliency (heuristic)
-        # Assuming bottom 1/3 of the image is where CTAs typically are
-        height = saliency_map.shape[0]
-        cta_region = saliency_map[int(height * 2/3):, :]
-        cta_saliency = float(cta_region.mean())
-        
-        # Identify dominant regions (simple heuristic)
-        # Top 20% of saliency values are considered dominant
-        threshold = saliency_map.max() * 0.8
-        dominant_regions = [(int(y), int(x)) for y, x in zip(*numpy.where(saliency_map > threshold))]
-        
-        return SaliencyResult(
-            saliency_path=salmap_path,
-            overlay_path=overlay_path,
-            cta_saliency=cta_saliency,
-            dominant_regions=dominant_regions[:10]  # Limit to 10 regions
-        )
-    except Exception as e:
-        # Return a default result with error
-        return SaliencyResult(
-            saliency_path=salmap_path,
-            overlay_path=overlay_path,
-            cta_saliency=0.5,  # Default value
-            dominant_regions=[],
-            error=str(e)
+async def process_saliency(screenshot_path: str, overlay_path: str, salmap_path: str,
+                           source_salmap_path: Optional[str] = None,
+                           frame: Optional[FrameDescriptor] = None) -> SaliencyResult:
+    """
+    Process saliency for a screenshot. When source_salmap_path points at the
+    saliency map of a near-duplicate screenshot, adapt it instead of recomputing.
+    With a shared-memory frame of the screenshot, the work runs on the CPU pool.
+    Raises on failure; the caller decides on a stand-in result.
+    """
+    import numpy
+    from PIL import Image
+    
+    # Generate saliency map and overlay
+    # Runs off the event loop so it (and the stage timeout) stays responsive
+    if frame is not None:
+        await cpu_pool.run(saliency.generate_overlay_from_frame, frame, overlay_path, salmap_path, source_salmap_path)
+    elif source_salmap_path:
+        await asyncio.to_thread(
+            saliency.generate_overlay_from_salmap, screenshot_path, source_salmap_path, overlay_path, salmap_path
         )
+    else:
+        await asyncio.to_thread(saliency.generate_overlay_from_file, screenshot_path, overlay_path, salmap_path)
+    saliency_map = numpy.asarray(Image.open(salmap_path).convert("L"), dtype=numpy.float32) / 255.0
+    
+    # Calculate CTA saliency (heuristic)
+    # Assuming bottom 1/3 of the image is where CTAs typically are
+    height = saliency_map.shape[0]
+    cta_region = saliency_map[int(height * 2/3):, :]
+    cta_saliency = float(cta_region.mean()) if cta_region.size else 0.0
+    
+    # Identify dominant regions (simple heuristic)
+    # Rank top/middle/bottom bands of the page by mean saliency
+    bands = numpy.array_split(saliency_map, 3, axis=0)
+    band_scores = [(float(band.mean()) if band.size else 0.0, name)
+                   for band, name in zip(bands, ("top", "middle", "bottom"))]
+    dominant_regions = [name for _, name in sorted(band_scores, reverse=True)]
+    
+    return SaliencyResult(
+        saliency_png=overlay_path,
+        salmap_png=salmap_path,
+        cta_saliency=cta_saliency,
+        dominant_regions=dominant_regions
+    )
+
+
+def _readability_output(text_content: str):
+    result = process_readability(text_content)
+    # A default result after an error is not worth reusing
+    return Fallback(result.dict()) if result.error else result.dict()
 
 
 def process_readability(text_content: str) -> ReadabilityResult:
     """Process readability for text content"""
     try:
         # Calculate readability scores
-        fk_grade, fre = readability.flesch_kincaid_readability(text_content)
-        
-        return ReadabilityResult(
-            flesch_kincaid_grade=fk_grade,
-            flesch_reading_ease=fre,
-            text_length=len(text_content)
-        )
+        return ReadabilityResult(**readability.flesch_kincaid_readability(text_content))
     except Exception as e:
         # Return a default result with error
+        words = len(text_content.split()) if text_content else 0
         return ReadabilityResult(
             flesch_kincaid_grade=10.0,  # Default value
             flesch_reading_ease=50.0,   # Default value
-            text_length=len(text_content) if text_content else 0,
+            sentences=1,
+            words=words,
+            syllables=words,
             error=str(e)
         )
 
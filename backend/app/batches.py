@@ -0,0 +1,237 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import tracing
+from app.database import Analysis, Batch, session_scope
+from app.db_writer import db_writer
+from app.analysis_cache import normalize_url
+from app.worker import run_job
+from app.scheduler import Reservation, scheduler, PRIORITY_BULK
+from app.crawler import SiteCrawler, POLITENESS_DELAY
+from app.recovery import owner_fields
+
+# Jobs of one batch running at the same time, unless the request asks otherwise
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("MAX_BATCH_CONCURRENCY", "16"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+
+
+def parse_url_list(content: str) -> List[str]:
+    """
+    URLs from an uploaded file: one per line, or the first column of a CSV.
+    Blank lines, '#' comments and a header row without a URL are skipped.
+    """
+    urls = []
+    for row in csv.reader(io.StringIO(content)):
+        if not row:
+            continue
+        value = row[0].strip()
+        if not value or value.startswith("#"):
+            continue
+        if "." not in value and "//" not in value:
+            continue  # header such as "url"
+        urls.append(value)
+    return urls
+
+
+def dedupe_urls(urls: List[str]) -> List[str]:
+    """Drop URLs that normalize to one already in the list, keeping the first spelling."""
+    seen = set()
+    unique = []
+    for url in urls:
+        url = url.strip()
+        if not url:
+            continue
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+
+def create_batch(db: Session, urls: List[str], concurrency: int, options: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str]]]:
+    """Insert the batch row and all of its Analysis rows in one transaction."""
+    batch_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    jobs = [(str(uuid.uuid4()), url) for url in urls]
+
+    db.add(Batch(
+        batch_id=batch_id,
+        created_at=now,
+        total=len(jobs),
+        concurrency=concurrency,
+        options=json.dumps(options)
+    ))
+    db.bulk_insert_mappings(Analysis, [
+        {"job_id": job_id, "url": url, "status": "pending", "batch_id": batch_id, "created_at": now,
+         "trace_id": tracing.sample_trace_id(), **owner_fields()}
+        for job_id, url in jobs
+    ])
+    db.commit()
+    return batch_id, jobs
+
+
+def clamp_concurrency(concurrency: Optional[int]) -> int:
+    return max(1, min(concurrency or BATCH_CONCURRENCY, MAX_BATCH_CONCURRENCY))
+
+
+class BatchRunner:
+    """
+    Submits a batch's jobs to the scheduler as bulk work, with at most
+    `concurrency` of them running at once. Jobs can be submitted while earlier
+    ones run (the crawler feeds pages as it finds them).
+    """
+
+    def __init__(self, batch_id: str, options: Dict[str, Any], concurrency: int, customer: str = "anonymous",
+                 reservation: Optional[Reservation] = None):
+        self.batch_id = batch_id
+        self.options = options
+        self.concurrency = concurrency
+        self.customer = customer
+        # Queue room held at admission; each queued job takes its place
+        self.reservation = reservation
+        self._futures: List[asyncio.Future] = []
+
+    def submit(self, job_id: str, url: str):
+        self._futures.append(scheduler.submit(
+            job_id, url,
+            lambda: run_job(
+                job_id, url, self.options.get("prompts"), self.options.get("max_age"), self.options.get("force", False),
+                PRIORITY_BULK
+            ),
+            priority=PRIORITY_BULK,
+            customer=self.customer,
+            group=self.batch_id,
+            group_limit=self.concurrency
+        ))
+        if self.reservation is not None:
+            self.reservation.consume()
+
+    async def wait(self):
+        await asyncio.gather(*self._futures, return_exceptions=True)
+
+
+async def run_batch(batch_id: str, jobs: List[Tuple[str, str]], options: Dict[str, Any], concurrency: int,
+                    customer: str = "anonymous", reservation: Optional[Reservation] = None):
+    """Run every job of a batch created by create_batch()."""
+    runner = BatchRunner(batch_id, options, concurrency, customer, reservation)
+    try:
+        for job_id, url in jobs:
+            runner.submit(job_id, url)
+    finally:
+        if reservation is not None:
+            reservation.release()
+    await runner.wait()
+
+
+def create_crawl_batch(db: Session, source_url: str, concurrency: int, options: Dict[str, Any]) -> str:
+    """Create an empty batch that the crawler fills as it discovers pages."""
+    batch_id = str(uuid.uuid4())
+    db.add(Batch(
+        batch_id=batch_id,
+        total=0,
+        concurrency=concurrency,
+        options=json.dumps(options),
+        source_url=source_url,
+        discovering=True
+    ))
+    db.commit()
+    return batch_id
+
+
+async def run_crawl(batch_id: str, source_url: str, options: Dict[str, Any], concurrency: int,
+                    max_pages: int, politeness_delay: Optional[float] = None, same_host_only: bool = True,
+                    customer: str = "anonymous", reservation: Optional[Reservation] = None):
+    """Crawl a site and analyze each discovered page as soon as it is found."""
+    runner = BatchRunner(batch_id, options, concurrency, customer, reservation)
+
+    async def on_page(url: str):
+        job_id = str(uuid.uuid4())
+
+        def insert(db: Session):
+            db.add(Analysis(job_id=job_id, url=url, status="pending", batch_id=batch_id,
+                            trace_id=tracing.sample_trace_id(), **owner_fields()))
+            db.query(Batch).filter(Batch.batch_id == batch_id).update(
+                {"total": Batch.total + 1}, synchronize_session=False
+            )
+
+        # Pages found close together share one commit; the row must exist before the job runs
+        await db_writer.submit(insert)
+        runner.submit(job_id, url)
+
+    crawler = SiteCrawler(
+        source_url, on_page, max_pages=max_pages, same_host_only=same_host_only,
+        politeness_delay=POLITENESS_DELAY if politeness_delay is None else politeness_delay
+    )
+    try:
+        await crawler.run()
+    except Exception as e:
+        print(f"Error crawling {source_url} for batch {batch_id}: {e}")
+    finally:
+        # Pages the crawl didn't find (up to max_pages) give their queue room back
+        if reservation is not None:
+            reservation.release()
+        with session_scope() as db:
+            db.query(Batch).filter(Batch.batch_id == batch_id).update(
+                {"discovering": False}, synchronize_session=False
+            )
+    await runner.wait()
+
+
+def batch_progress(db: Session, batch: Batch) -> Dict[str, Any]:
+    """Aggregate status counts and score summary for a batch."""
+    counts = dict(
+        db.query(Analysis.status, func.count(Analysis.id))
+        .filter(Analysis.batch_id == batch.batch_id)
+        .group_by(Analysis.status)
+        .all()
+    )
+    finished = counts.get("completed", 0) + counts.get("failed", 0) + counts.get("cancelled", 0)
+    discovering = bool(batch.discovering)
+
+    scores = {}
+    for name, column in (
+        ("geo_score", Analysis.geo_score),
+        ("readability_score", Analysis.readability_score),
+        ("contrast_score", Analysis.contrast_score),
+        ("saliency_score", Analysis.saliency_score),
+    ):
+        avg, low, high = db.query(func.avg(column), func.min(column), func.max(column)).filter(
+            Analysis.batch_id == batch.batch_id,
+            Analysis.status == "completed"
+        ).one()
+        scores[name] = {
+            "avg": round(avg, 1) if avg is not None else None,
+            "min": round(low, 1) if low is not None else None,
+            "max": round(high, 1) if high is not None else None
+        }
+
+    lowest = db.query(Analysis.job_id, Analysis.url, Analysis.geo_score).filter(
+        Analysis.batch_id == batch.batch_id,
+        Analysis.status == "completed"
+    ).order_by(Analysis.geo_score.asc()).limit(10).all()
+
+    return {
+        "batch_id": batch.batch_id,
+        "created_at": batch.created_at,
+        "total": batch.total,
+        "concurrency": batch.concurrency,
+        "counts": counts,
+        "source_url": batch.source_url,
+        "discovering": discovering,
+        "progress": round(finished / batch.total, 4) if batch.total else (0.0 if discovering else 1.0),
+        "done": not discovering and finished >= (batch.total or 0),
+        "scores": scores,
+        "lowest_geo_scores": [
+            {"job_id": job_id, "url": url, "geo_score": geo_score} for job_id, url, geo_score in lowest
+        ]
+    }
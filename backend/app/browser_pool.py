@@ -0,0 +1,93 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from app import tracing
+
+# Concurrent pages (one browser context each) allowed on the shared browser
+MAX_PAGES = int(os.getenv("BROWSER_POOL_MAX_PAGES", "4"))
+# Seconds to wait for a browser context to close before giving up on it
+CONTEXT_CLOSE_TIMEOUT = 10.0
+
+
+class BrowserPool:
+    """
+    One Playwright browser per process, shared by every capture. Each capture
+    gets its own isolated browser context, and the number of open pages is
+    bounded so a big batch can't launch unbounded browser memory.
+    """
+
+    def __init__(self, browser_type: Optional[str] = None, max_pages: int = MAX_PAGES):
+        self.browser_type = browser_type or os.getenv("PLAYWRIGHT_BROWSERTYPE", "chromium")
+        self.max_pages = max_pages
+        # Created on first use so they bind to the server's event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._playwright = None
+        self._browser = None
+        self.in_use = 0
+        self.launches = 0
+
+    def _ensure_primitives(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+
+    async def _get_browser(self):
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                # Import here so modules that never capture don't need playwright
+                from playwright.async_api import async_playwright
+
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await getattr(self._playwright, self.browser_type).launch()
+                self.launches += 1
+            return self._browser
+
+    @asynccontextmanager
+    async def page(self, viewport: Optional[Dict[str, int]] = None):
+        """Yield a fresh page in its own browser context, closed on exit."""
+        self._ensure_primitives()
+        # Waiting for a free page slot shows up in a slow job's trace
+        with tracing.span("browser.acquire", pages_in_use=self.in_use):
+            await self._semaphore.acquire()
+        try:
+            with tracing.span("browser.new_context"):
+                browser = await self._get_browser()
+                context = await browser.new_context(viewport=viewport or {"width": 1280, "height": 800})
+            self.in_use += 1
+            try:
+                yield await context.new_page()
+            finally:
+                self.in_use -= 1
+                # Also runs when the capture is cancelled; a wedged context must not hold the slot
+                try:
+                    await asyncio.wait_for(context.close(), CONTEXT_CLOSE_TIMEOUT)
+                except Exception as e:
+                    print(f"Error closing browser context: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        self._ensure_primitives()
+        async with self._lock:
+            if self._browser is not None:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "browser_type": self.browser_type,
+            "max_pages": self.max_pages,
+            "in_use": self.in_use,
+            "launches": self.launches,
+            "connected": bool(self._browser and self._browser.is_connected())
+        }
+
+
+browser_pool = BrowserPool()
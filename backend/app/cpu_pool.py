@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from app.ai_analysis.shared_frames import frame_store, sweep_orphans, FrameDescriptor
+
+# Analyzer processes for CPU-bound stages; 0 runs them in threads of this process
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0"))
+
+
+class CPUPool:
+    """
+    Runs CPU-bound analyzers (saliency, perceptual hash) on a shared-memory
+    screenshot. Only the frame descriptor crosses the process boundary; the
+    owner keeps a reference per running call, so a crashed analyzer process
+    can't leak or prematurely free the segment.
+    """
+
+    def __init__(self, workers: int = CPU_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and browser threads isn't safe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], frame: FrameDescriptor, *args) -> Any:
+        """Call fn(frame, *args) in an analyzer process (or a thread when CPU_WORKERS is 0)."""
+        frame_store.acquire(frame)
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return await asyncio.to_thread(fn, frame, *args)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, frame, *args)
+            except BrokenProcessPool:
+                # An analyzer process died (OOM, segfault in native code); start a fresh pool
+                self.restarts += 1
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        finally:
+            frame_store.release(frame)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        frame_store.close_all()
+
+    def stats(self):
+        return dict(frame_store.stats(), workers=self.workers, restarts=self.restarts)
+
+
+def startup_sweep():
+    """Remove shared-memory segments orphaned by a process that crashed."""
+    removed = sweep_orphans()
+    if removed:
+        print(f"Removed {removed} orphaned shared-memory frames")
+
+
+cpu_pool = CPUPool()
@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import os
+import time
+import zlib
+from collections import deque
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urljoin, urlsplit
+from xml.etree.ElementTree import XMLPullParser
+
+import httpx
+
+from app.analysis_cache import normalize_url
+
+# Seconds between two requests to the same host
+POLITENESS_DELAY = float(os.getenv("CRAWL_POLITENESS_DELAY", "1.0"))
+# Floor for a caller-supplied politeness delay, so a crawl request can't hammer a site
+MIN_POLITENESS_DELAY = float(os.getenv("CRAWL_MIN_POLITENESS_DELAY", "0.25"))
+# Upper bound on pages discovered by one crawl
+MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "2000"))
+# Concurrent fetches across all hosts
+FETCH_CONCURRENCY = int(os.getenv("CRAWL_FETCH_CONCURRENCY", "4"))
+# Links waiting to be fetched by the link crawl; further links are dropped
+MAX_LINK_QUEUE = int(os.getenv("CRAWL_MAX_LINK_QUEUE", "10000"))
+# HTML pages larger than this are truncated when extracting links
+MAX_HTML_BYTES = 2 * 1024 * 1024
+
+USER_AGENT = "VispectraCrawler/0.1 (+https://github.com/sajjad939/ai-aspectra)"
+
+# File extensions that are never pages worth analyzing
+SKIPPED_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip", ".gz",
+    ".css", ".js", ".json", ".xml", ".mp4", ".mp3", ".woff", ".woff2"
+)
+
+
+class SeenSet:
+    """Compact set of normalized URLs: stores a 64-bit digest instead of the string."""
+
+    def __init__(self):
+        self._digests: Set[int] = set()
+
+    @staticmethod
+    def _digest(url: str) -> int:
+        return int.from_bytes(hashlib.blake2b(normalize_url(url).encode("utf-8"), digest_size=8).digest(), "big")
+
+    def add(self, url: str) -> bool:
+        """Add url; return False if it (or an equivalent spelling) was already seen."""
+        digest = self._digest(url)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+
+class HostThrottle:
+    """Serializes requests per host and spaces them at least `delay` seconds apart."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last: Dict[str, float] = {}
+
+    async def wait(self, url: str) -> asyncio.Lock:
+        host = urlsplit(url).netloc.lower()
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        await lock.acquire()
+        elapsed = time.monotonic() - self._last.get(host, 0.0)
+        if elapsed < self.delay:
+            await asyncio.sleep(self.delay - elapsed)
+        return lock
+
+    def release(self, url: str, lock: asyncio.Lock):
+        self._last[urlsplit(url).netloc.lower()] = time.monotonic()
+        lock.release()
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+
+def _local_name(tag: str) -> str:
+    """Strip the XML namespace: '{http://www.sitemaps.org/...}loc' -> 'loc'."""
+    return tag.rsplit("}", 1)[-1]
+
+
+class SitemapStreamParser:
+    """
+    Incremental sitemap parser: feed raw (optionally gzipped) bytes chunk by
+    chunk and collect page URLs and nested sitemap URLs as their elements close,
+    without holding the whole document in memory.
+    """
+
+    def __init__(self, gzipped: Optional[bool] = None):
+        self._parser = XMLPullParser(events=("end",))
+        self._gzipped = gzipped
+        self._inflater = None
+        self.pages: List[str] = []
+        self.sitemaps: List[str] = []
+        self._loc: Optional[str] = None
+
+    def feed(self, chunk: bytes):
+        if self._gzipped is None:
+            self._gzipped = chunk[:2] == b"\x1f\x8b"
+        if self._gzipped:
+            if self._inflater is None:
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk = self._inflater.decompress(chunk)
+        self._parser.feed(chunk)
+        self._drain()
+
+    def close(self):
+        if self._inflater is not None:
+            self._parser.feed(self._inflater.flush())
+        self._parser.close()
+        self._drain()
+
+    def _drain(self):
+        for _, element in self._parser.read_events():
+            name = _local_name(element.tag)
+            if name == "loc":
+                self._loc = (element.text or "").strip()
+            elif name == "url" and self._loc:
+                self.pages.append(self._loc)
+                self._loc = None
+            elif name == "sitemap" and self._loc:
+                self.sitemaps.append(self._loc)
+                self._loc = None
+            if name in ("url", "sitemap"):
+                # Free finished elements so memory stays flat on huge sitemaps
+                element.clear()
+
+    def take(self) -> List[str]:
+        """Return and forget the page URLs collected so far."""
+        pages, self.pages = self.pages, []
+        return pages
+
+
+class SiteCrawler:
+    """
+    Discover pages of a site from its sitemap(s) - including sitemap indexes and
+    gzipped sitemaps - falling back to following same-host links from the root
+    page. Each new page URL is handed to `on_page` as soon as it is found.
+    """
+
+    def __init__(self, start_url: str, on_page: Callable[[str], Awaitable[None]],
+                 max_pages: int = MAX_PAGES, politeness_delay: float = POLITENESS_DELAY,
+                 same_host_only: bool = True, fetch_concurrency: int = FETCH_CONCURRENCY,
+                 client: Optional[httpx.AsyncClient] = None):
+        self.start_url = start_url if "//" in start_url else f"https://{start_url}"
+        self.on_page = on_page
+        self.max_pages = max_pages
+        self.same_host_only = same_host_only
+        self.throttle = HostThrottle(max(politeness_delay, MIN_POLITENESS_DELAY))
+        self.seen_pages = SeenSet()
+        self.seen_sitemaps = SeenSet()
+        self.discovered = 0
+        self._fetch_slots = asyncio.Semaphore(fetch_concurrency)
+        self._client = client
+        self._host = urlsplit(self.start_url).netloc.lower()
+
+    @property
+    def budget_left(self) -> int:
+        return self.max_pages - self.discovered
+
+    def _allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        if self.same_host_only and parts.netloc.lower() != self._host:
+            return False
+        return not parts.path.lower().endswith(SKIPPED_EXTENSIONS)
+
+    async def _emit(self, url: str) -> bool:
+        """Report a page if it's new and in budget; return False once the budget is spent."""
+        if self.budget_left <= 0:
+            return False
+        url = url.split("#", 1)[0]
+        if self._allowed(url) and self.seen_pages.add(url):
+            self.discovered += 1
+            await self.on_page(url)
+        return self.budget_left > 0
+
+    @asynccontextmanager
+    async def _fetch(self, client: httpx.AsyncClient, url: str):
+        """Streamed GET that respects the fetch concurrency and per-host politeness delay."""
+        async with self._fetch_slots:
+            lock = await self.throttle.wait(url)
+            try:
+                async with client.stream("GET", url) as response:
+                    yield response
+            finally:
+                self.throttle.release(url, lock)
+
+    async def _crawl_sitemap(self, client: httpx.AsyncClient, sitemap_url: str) -> bool:
+        """Stream one sitemap; recurse into nested sitemaps. Returns False if nothing was readable."""
+        if not self.seen_sitemaps.add(sitemap_url) or self.budget_left <= 0:
+            return True
+        nested = []
+        try:
+            async with self._fetch(client, sitemap_url) as response:
+                if response.status_code != 200:
+                    return False
+                # Plain and gzipped (.xml.gz) sitemaps are told apart by their magic bytes
+                parser = SitemapStreamParser()
+                async for chunk in response.aiter_bytes():
+                    parser.feed(chunk)
+                    for page in parser.take():
+                        if not await self._emit(page):
+                            return True
+                parser.close()
+                for page in parser.take():
+                    if not await self._emit(page):
+                        return True
+                nested = parser.sitemaps
+        except Exception as e:
+            print(f"Error reading sitemap {sitemap_url}: {e}")
+            return False
+
+        for child in nested:
+            if self.budget_left <= 0:
+                break
+            await self._crawl_sitemap(client, child)
+        return True
+
+    async def _sitemaps_from_robots(self, client: httpx.AsyncClient) -> List[str]:
+        robots_url = urljoin(self.start_url, "/robots.txt")
+        sitemaps = []
+        try:
+            async with self._fetch(client, robots_url) as response:
+                if response.status_code == 200:
+                    text = (await response.aread()).decode("utf-8", "replace")
+                    for line in text.splitlines():
+                        if line.lower().startswith("sitemap:"):
+                            sitemaps.append(line.split(":", 1)[1].strip())
+        except Exception as e:
+            print(f"Error reading robots.txt for {self.start_url}: {e}")
+        return sitemaps
+
+    async def _crawl_links(self, client: httpx.AsyncClient):
+        """Breadth-first crawl of same-host links starting at the root page."""
+        queue = deque([self.start_url])
+        # Links are deduplicated as they are queued, so the queue holds each page once
+        queued = SeenSet()
+        queued.add(self.start_url)
+        while queue and self.budget_left > 0:
+            url = queue.popleft()
+            body = b""
+            try:
+                async with self._fetch(client, url) as response:
+                    if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+                        continue
+                    if not await self._emit(str(response.url)):
+                        return
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) >= MAX_HTML_BYTES:
+                            break
+            except Exception as e:
+                print(f"Error crawling {url}: {e}")
+                continue
+
+            links = _LinkParser()
+            links.feed(body.decode("utf-8", "replace"))
+            for href in links.links:
+                link = urljoin(url, href).split("#", 1)[0]
+                if len(queue) < MAX_LINK_QUEUE and self._allowed(link) and queued.add(link):
+                    queue.append(link)
+
+    async def run(self) -> int:
+        """Crawl until the site is exhausted or max_pages is reached; returns pages found."""
+        client = self._client or httpx.AsyncClient(
+            timeout=30.0, follow_redirects=True, headers={"User-Agent": USER_AGENT}
+        )
+        try:
+            path = urlsplit(self.start_url).path.lower()
+            if path.endswith((".xml", ".xml.gz")):
+                sitemaps = [self.start_url]
+            else:
+                sitemaps = await self._sitemaps_from_robots(client) or [urljoin(self.start_url, "/sitemap.xml")]
+
+            found_sitemap = False
+            for sitemap_url in sitemaps:
+                found_sitemap = await self._crawl_sitemap(client, sitemap_url) or found_sitemap
+
+            if not found_sitemap or self.discovered == 0:
+                await self._crawl_links(client)
+        finally:
+            if self._client is None:
+                await client.aclose()
+        return self.discovered
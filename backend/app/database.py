@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, DateTime, Float, Index, Boolean
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 import os
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Iterator
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,12 +13,144 @@ load_dotenv()
 # Get database URL from environment or use default SQLite
 DB_URL = os.getenv("DB_URL", "sqlite:///./geo_data.db")
 
+# Connection pool sizing for server databases (Postgres, MySQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite: how long a writer waits for the lock before "database is locked", and
+# the fsync level (NORMAL is durable across crashes of the process in WAL mode)
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+# Async drivers the API routes use for each dialect; ASYNC_DB_URL overrides the derived URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL")
+
+
+def _apply_sqlite_pragmas(sqlite_engine, url: str):
+    in_memory = url.endswith("://") or url.endswith(":memory:")
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            # Readers no longer block the writer, and the writer no longer blocks readers
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-16000")
+        cursor.close()
+
+
+def make_engine(url: str):
+    """Engine tuned for the backend: WAL and pragmas on SQLite, a sized pool elsewhere."""
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+
+    sqlite_engine = create_engine(
+        url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
+    )
+    _apply_sqlite_pragmas(sqlite_engine, url)
+    return sqlite_engine
+
+
+def async_url(url: str) -> str:
+    """The async-driver form of a sync database URL (aiosqlite, asyncpg, aiomysql)."""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    driver = ASYNC_DRIVERS.get(dialect)
+    if driver is None:
+        return url
+    return f"{dialect}+{driver}://{rest}"
+
+
+def make_async_engine(url: str):
+    """Async counterpart of make_engine(), for the API routes."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_url(url)
+    if not url.startswith("sqlite"):
+        return create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+
+    sqlite_engine = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT})
+    _apply_sqlite_pragmas(sqlite_engine.sync_engine, url)
+    return sqlite_engine
+
+
 # Create SQLAlchemy engine
-engine = create_engine(DB_URL)
+engine = make_engine(DB_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessions for short units of work whose loaded rows are used after the session closes
+_ScopedSession = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    A session for one short unit of work: committed on success, rolled back on
+    error, and always closed, so no connection is held across awaits. Rows it
+    loaded stay readable afterwards as detached snapshots.
+    """
+    db = _ScopedSession()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# Async engine and sessions for the API routes, created on first use so that
+# worker processes and scripts don't need the async driver installed
+_async_engine = None
+_AsyncSession = None
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine(ASYNC_DB_URL or DB_URL)
+    return _async_engine
+
+
+def get_async_sessionmaker():
+    global _AsyncSession
+    if _AsyncSession is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _AsyncSession = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _AsyncSession
+
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSession
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _AsyncSession = None
+
+
 # Create base class for models
 Base = declarative_base()
 
@@ -28,8 +162,8 @@ class Analysis(Base):
     id = Column(Integer, primary_key=True, index=True)
     job_id = Column(String, unique=True, index=True)
     url = Column(String)
-    status = Column(String)  # pending, processing, completed, failed
-    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String)  # pending, processing, completed, failed, cancelled
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     completed_at = Column(DateTime, nullable=True)
     
     # Analysis scores
@@ -38,18 +172,186 @@ class Analysis(Base):
     saliency_score = Column(Float, nullable=True)
     geo_score = Column(Float, nullable=True)
     
+    # Result summary for list views, so they never read result.json
+    grade_level = Column(Float, nullable=True)
+    total_mentions = Column(Integer, nullable=True)
+    contrast_issue_count = Column(Integer, nullable=True)
+    suggestion_count = Column(Integer, nullable=True)
+    
     # Result paths
     result_json = Column(String, nullable=True)
     overlay_path = Column(String, nullable=True)
     salmap_path = Column(String, nullable=True)
     
+    # Parent batch for jobs submitted through /api/analyze/batch
+    batch_id = Column(String, nullable=True, index=True)
+    
+    # Analysis cache keys: normalized URL and fingerprint of the captured content
+    url_key = Column(String, nullable=True, index=True)
+    fingerprint = Column(String, nullable=True, index=True)
+    cached_from = Column(String, nullable=True)  # job_id the result was cloned from
+    
+    # Perceptual (dHash) hash of the above-the-fold screenshot, hex encoded
+    phash = Column(String, nullable=True)
+    
+    # Pipeline stage the job is in, or stopped in when cancelled / timed out
+    stage = Column(String, nullable=True)
+    
+    # Crash recovery: last stage whose output is on disk, runs started, and the
+    # options (JSON: prompts, max_age, force) needed to re-queue the job
+    checkpoint = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    options = Column(Text, nullable=True)
+    # Process queueing or running the job (host:pid:nonce) and its last heartbeat;
+    # a pending or processing job whose owner is dead is re-queued
+    owner = Column(String, nullable=True, index=True)
+    owner_heartbeat = Column(DateTime, nullable=True)
+    
     # Error information
     error = Column(Text, nullable=True)
+    
+    # JSON {file name: artifact digest} once the job's files moved to the artifact store
+    artifacts = Column(Text, nullable=True)
+    
+    # Tracing (sampled jobs only): trace id, and the span of the request that queued the job
+    trace_id = Column(String, nullable=True)
+    trace_parent_id = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Keyset-paginated listings, filtered by status or by URL
+        Index("ix_analyses_status_created", "status", "created_at"),
+        Index("ix_analyses_url_created", "url", "created_at"),
+    )
+
+
+class Batch(Base):
+    """Parent record for a set of analyses submitted together"""
+    __tablename__ = "batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String, unique=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    total = Column(Integer)
+    concurrency = Column(Integer)
+    options = Column(Text, nullable=True)  # JSON: prompts, max_age, force
+    source_url = Column(String, nullable=True)  # crawl root / sitemap, for crawled batches
+    discovering = Column(Boolean, default=False)  # crawler still adding jobs
+
+
+class Artifact(Base):
+    """Content-addressed blob in the artifact store, shared by every job that produced the same bytes"""
+    __tablename__ = "artifacts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String, unique=True, index=True)  # sha256 of the uncompressed bytes
+    size = Column(Integer)
+    stored_size = Column(Integer)
+    encoding = Column(String, nullable=True)  # zstd, gzip, or None when stored as-is
+    variants = Column(String, nullable=True)  # comma-separated extra encodings stored for HTTP (gzip, br)
+    media_type = Column(String, nullable=True)
+    refcount = Column(Integer, default=0)  # job files pointing at this blob
+    pending = Column(Boolean, default=False)  # row committed, blobs still being written
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed = Column(DateTime, default=datetime.utcnow, index=True)  # LRU order for retention
+
+
+class ArtifactRef(Base):
+    """One file of one job, pointing at its blob; retention policies apply per file kind"""
+    __tablename__ = "artifact_refs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, index=True)
+    name = Column(String)  # file name within the job, e.g. overlay.png
+    digest = Column(String, index=True)
+    kind = Column(String)  # screenshot, overlay, capture, summary, other
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_artifact_refs_kind_created", "kind", "created_at"),
+    )
+
+
+class StageRecord(Base):
+    """Input hash and stored output of one pipeline stage of one job"""
+    __tablename__ = "stage_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, index=True)
+    url_key = Column(String, index=True)
+    stage = Column(String)  # saliency, readability, contrast, prompts
+    input_hash = Column(String)
+    output_path = Column(String)
+    reused_from = Column(String, nullable=True)  # job_id whose output was reused
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_stage_records_lookup", "url_key", "stage", "input_hash"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Job an Idempotency-Key (scoped by customer) was answered with"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True)
+    job_id = Column(String)
+    request_hash = Column(String)  # normalized URL + options, to reject reuse for another request
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobLease(Base):
+    """Job in the distributed work queue, and the worker currently leasing it"""
+    __tablename__ = "job_leases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    payload = Column(Text)  # JSON: job_id, url, prompts, max_age, force
+    priority = Column(Integer, default=0)
+    enqueued_at = Column(Float)  # epoch seconds
+    status = Column(String, index=True)  # queued, leased
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(Float, nullable=True)  # epoch seconds
+    claims = Column(Integer, default=0)
+
+
+class WorkerRecord(Base):
+    """Liveness, capacity and load reported by an analysis worker"""
+    __tablename__ = "workers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    worker_id = Column(String, unique=True, index=True)
+    hostname = Column(String, nullable=True)
+    capacity = Column(Integer, default=0)
+    load = Column(Integer, default=0)
+    started_at = Column(Float)  # epoch seconds
+    last_heartbeat = Column(Float, nullable=True)
 
 
 # Create tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+
+def add_missing_columns():
+    """
+    create_all() never alters existing tables, so add any model columns (and
+    their indexes) that an older database file is missing.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        missing = [col for col in table.columns if col.name not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for col in missing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 # Get database session
@@ -58,4 +360,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Get an async database session (API routes): queries and commits await the
+# driver instead of blocking the event loop
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,151 @@
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, Analysis
+from app.metrics import track_stage
+
+# Seconds writes are collected before being committed together
+FLUSH_INTERVAL = float(os.getenv("DB_WRITE_FLUSH_INTERVAL", "0.05"))
+
+
+def _retrieve_exception(future: asyncio.Future):
+    # Fire-and-forget writes: failures are logged by the flush, not re-raised at GC
+    if not future.cancelled():
+        future.exception()
+
+
+def _job_update(job_id: str, fields: Dict[str, Any]) -> Callable[[Session], None]:
+    def write(db: Session):
+        db.query(Analysis).filter(Analysis.job_id == job_id).update(fields, synchronize_session=False)
+    return write
+
+
+class BatchedWriter:
+    """
+    Group commit for job bookkeeping. Status, stage and checkpoint updates and
+    row inserts from every running job are collected for FLUSH_INTERVAL and
+    written in one transaction on a worker thread, so hundreds of concurrent
+    jobs cost a handful of commits per second instead of one per transition.
+    Updates to the same job within a window are merged (later fields win).
+    Callers that need the write to be durable await the returned future. If
+    the batch fails, each write is retried in its own transaction so one bad
+    write only fails its own callers.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._job_updates: Dict[str, Dict[str, Any]] = {}
+        self._job_waiters: Dict[str, List[asyncio.Future]] = {}
+        self._writes: List[Tuple[Callable[[Session], None], asyncio.Future]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_tasks = set()
+        self.flushes = 0
+        self.writes = 0
+
+    def _enqueue(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_retrieve_exception)
+        self._waiters.append(future)
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.interval, self._start_flush)
+        return future
+
+    def _start_flush(self):
+        self._flush_handle = None
+        task = asyncio.ensure_future(self.flush())
+        # Keep a reference so the task isn't garbage collected mid-write
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def update_job(self, job_id: str, **fields) -> asyncio.Future:
+        """Set columns of the job's Analysis row."""
+        self._job_updates.setdefault(job_id, {}).update(fields)
+        future = self._enqueue()
+        self._job_waiters.setdefault(job_id, []).append(future)
+        return future
+
+    def submit(self, write: Callable[[Session], None]) -> asyncio.Future:
+        """Run write(session) inside the next batch's transaction (inserts, other tables)."""
+        future = self._enqueue()
+        self._writes.append((write, future))
+        return future
+
+    def _write(self, writes: List[Callable[[Session], None]]):
+        db = self.session_factory()
+        try:
+            with track_stage("db"):
+                for write in writes:
+                    write(db)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_each(self, writes: List[Callable[[Session], None]]) -> List[Optional[Exception]]:
+        """Retry a failed batch one transaction per write; returns each write's error, if any."""
+        errors: List[Optional[Exception]] = []
+        for write in writes:
+            try:
+                self._write([write])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    async def flush(self):
+        """Commit everything collected so far; batches are written strictly in order."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            job_updates, self._job_updates = self._job_updates, {}
+            job_waiters, self._job_waiters = self._job_waiters, {}
+            inserts, self._writes = self._writes, []
+            waiters, self._waiters = self._waiters, []
+            if not waiters:
+                return
+            # Inserts first: an update in the same batch may target a row inserted here
+            writes = [(write, [future]) for write, future in inserts] + [
+                (_job_update(job_id, fields), job_waiters.get(job_id, [])) for job_id, fields in job_updates.items()
+            ]
+            try:
+                await asyncio.to_thread(self._write, [write for write, _ in writes])
+                errors = [None] * len(writes)
+            except Exception as e:
+                print(f"Error writing job bookkeeping batch, retrying its writes one at a time: {e}")
+                errors = await asyncio.to_thread(self._write_each, [write for write, _ in writes])
+            self.flushes += 1
+            for (_, futures), error in zip(writes, errors):
+                if error is not None:
+                    print(f"Error writing job bookkeeping: {error}")
+                else:
+                    self.writes += len(futures)
+                for future in futures:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "pending": len(self._waiters),
+            "writes_per_flush": round(self.writes / self.flushes, 2) if self.flushes else 0.0
+        }
+
+
+db_writer = BatchedWriter()
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, AsyncIterator, Deque, Set
+
+# Stages after which no further events are published for a job
+TERMINAL_STAGES = ("completed", "failed", "cancelled")
+
+# Number of events kept per job so late subscribers can catch up
+HISTORY_SIZE = int(os.getenv("JOB_EVENTS_HISTORY", "200"))
+
+# How long finished jobs keep their event history around (seconds)
+HISTORY_TTL = int(os.getenv("JOB_EVENTS_TTL", "3600"))
+
+
+def make_event(job_id: str, seq: int, stage: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job_id,
+        "seq": seq,
+        "stage": stage,
+        "ts": time.time(),
+        "data": data
+    }
+
+
+def is_terminal(event: Dict[str, Any]) -> bool:
+    return event.get("stage") in TERMINAL_STAGES
+
+
+class InProcessBroker:
+    """Pub/sub for job progress events within a single API process."""
+
+    def __init__(self, history_size: int = HISTORY_SIZE, history_ttl: int = HISTORY_TTL):
+        self.history_size = history_size
+        self.history_ttl = history_ttl
+        self._history: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._seq: Dict[str, int] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def publish(self, job_id: str, stage: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        seq = self._seq.get(job_id, 0) + 1
+        self._seq[job_id] = seq
+        event = make_event(job_id, seq, stage, data or {})
+
+        history = self._history.setdefault(job_id, deque(maxlen=self.history_size))
+        history.append(event)
+        for queue in list(self._subscribers.get(job_id, ())):
+            queue.put_nowait(event)
+
+        if is_terminal(event):
+            asyncio.get_running_loop().call_later(self.history_ttl, self._forget, job_id)
+        return event
+
+    def _forget(self, job_id: str):
+        if self._subscribers.get(job_id):
+            # Someone is still replaying this job; try again later
+            asyncio.get_running_loop().call_later(self.history_ttl, self._forget, job_id)
+            return
+        self._history.pop(job_id, None)
+        self._seq.pop(job_id, None)
+        self._subscribers.pop(job_id, None)
+
+    async def history(self, job_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        return [e for e in self._history.get(job_id, ()) if e["seq"] > since]
+
+    async def subscribe(self, job_id: str, since: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield events with seq > since, replaying history first, until the job finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            last_seq = since
+            for event in await self.history(job_id, since):
+                last_seq = event["seq"]
+                yield event
+                if is_terminal(event):
+                    return
+            while True:
+                event = await queue.get()
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+                if is_terminal(event):
+                    return
+        finally:
+            self._subscribers.get(job_id, set()).discard(queue)
+
+
+class RedisBroker:
+    """Pub/sub for job progress events shared across processes and nodes through Redis."""
+
+    def __init__(self, redis_url: str, history_size: int = HISTORY_SIZE, history_ttl: int = HISTORY_TTL):
+        # Import here so the in-process broker works without redis installed
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(redis_url, decode_responses=True)
+        self.history_size = history_size
+        self.history_ttl = history_ttl
+
+    def _channel(self, job_id: str) -> str:
+        return f"vispectra:job:{job_id}:events"
+
+    async def publish(self, job_id: str, stage: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        channel = self._channel(job_id)
+        seq = await self.redis.incr(f"{channel}:seq")
+        event = make_event(job_id, seq, stage, data or {})
+        payload = json.dumps(event)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(f"{channel}:history", payload)
+            pipe.ltrim(f"{channel}:history", -self.history_size, -1)
+            pipe.expire(f"{channel}:history", self.history_ttl)
+            pipe.expire(f"{channel}:seq", self.history_ttl)
+            pipe.publish(channel, payload)
+            await pipe.execute()
+        return event
+
+    async def history(self, job_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        raw = await self.redis.lrange(f"{self._channel(job_id)}:history", 0, -1)
+        events = [json.loads(item) for item in raw]
+        return [e for e in events if e["seq"] > since]
+
+    async def subscribe(self, job_id: str, since: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield events with seq > since, replaying history first, until the job finishes."""
+        pubsub = self.redis.pubsub()
+        # Subscribe before reading history so nothing published in between is lost
+        await pubsub.subscribe(self._channel(job_id))
+        try:
+            last_seq = since
+            for event in await self.history(job_id, since):
+                last_seq = event["seq"]
+                yield event
+                if is_terminal(event):
+                    return
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                event = json.loads(message["data"])
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+                if is_terminal(event):
+                    return
+        finally:
+            await pubsub.unsubscribe(self._channel(job_id))
+            await pubsub.close()
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the process-wide broker: Redis when REDIS_URL is set, in-process otherwise."""
+    global _broker
+    if _broker is None:
+        redis_url = os.getenv("REDIS_URL")
+        _broker = RedisBroker(redis_url) if redis_url else InProcessBroker()
+    return _broker
+
+
+async def publish_event(job_id: str, stage: str, **data) -> Optional[Dict[str, Any]]:
+    """Publish a progress event; never let a broker failure break the job itself."""
+    try:
+        return await get_broker().publish(job_id, stage, data)
+    except Exception as e:
+        print(f"Error publishing event for job {job_id}: {e}")
+        return None
+
+
+async def wait_for_events(job_id: str, since: int = 0, timeout: float = 25.0) -> List[Dict[str, Any]]:
+    """
+    Long-poll helper: return every event after `since`, waiting up to `timeout`
+    seconds for the first one if none are available yet.
+    """
+    broker = get_broker()
+    events = await broker.history(job_id, since)
+    if events:
+        return events
+
+    async def first_event():
+        subscription = broker.subscribe(job_id, since)
+        try:
+            async for event in subscription:
+                return [event]
+            return []
+        finally:
+            await subscription.aclose()
+
+    try:
+        first = await asyncio.wait_for(first_event(), timeout)
+    except asyncio.TimeoutError:
+        return []
+    # Pick up anything published right after the first event
+    if not first:
+        return []
+    return first + await broker.history(job_id, first[-1]["seq"])
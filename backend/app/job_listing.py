@@ -0,0 +1,140 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import load_only
+
+from app.database import Analysis, session_scope
+from app.artifact_store import RESULTS_DIR, read_artifact
+
+# Page size of /api/list when none is given, and the largest one accepted
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "10"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "200"))
+
+# Columns a list view may ask for; all of them are served from the analyses table
+LIST_FIELDS = (
+    "job_id", "url", "status", "created_at", "completed_at", "batch_id", "error",
+    "geo_score", "readability_score", "contrast_score", "saliency_score",
+    "grade_level", "total_mentions", "contrast_issue_count", "suggestion_count",
+    "overlay_path", "result_json"
+)
+DEFAULT_LIST_FIELDS = (
+    "job_id", "url", "status", "created_at", "completed_at", "error",
+    "geo_score", "readability_score", "contrast_score", "saliency_score", "total_mentions"
+)
+# Not a column: loads result.json per row, for clients that still need the full document
+FULL_RESULT_FIELD = "result"
+
+
+def encode_cursor(analysis: Analysis) -> str:
+    """Opaque keyset cursor: position after this row in (created_at, id) descending order."""
+    raw = json.dumps([analysis.created_at.isoformat(), analysis.id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Comma-separated field projection; job_id is always included."""
+    if not fields:
+        return list(DEFAULT_LIST_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in LIST_FIELDS and f != FULL_RESULT_FIELD]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ["job_id"] + [f for f in dict.fromkeys(requested) if f != "job_id"]
+
+
+def list_query(fields: List[str], limit: int, cursor: Optional[str] = None, status: Optional[str] = None,
+               url: Optional[str] = None, batch_id: Optional[str] = None):
+    """
+    One page of analyses, newest first. Seeks past the cursor instead of
+    using OFFSET, so every page costs the same however deep it is, and loads
+    only the projected columns. Fetches limit + 1 rows to detect a next page.
+    """
+    columns = [getattr(Analysis, f) for f in fields if f in LIST_FIELDS]
+    if FULL_RESULT_FIELD in fields:
+        columns.append(Analysis.status)
+    query = select(Analysis).options(load_only(Analysis.id, Analysis.created_at, *columns))
+    if status:
+        statuses = [s.strip() for s in status.split(",") if s.strip()]
+        query = query.where(Analysis.status.in_(statuses))
+    if url:
+        query = query.where(Analysis.url == url)
+    if batch_id:
+        query = query.where(Analysis.batch_id == batch_id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Analysis.created_at < created_at,
+            and_(Analysis.created_at == created_at, Analysis.id < row_id)
+        ))
+    return query.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(limit + 1)
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    return max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+
+
+def summary_columns(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Denormalized list-view summary of a result.json document."""
+    readability = result.get("readability") or {}
+    geo_summary = result.get("geo_summary") or {}
+    return {
+        "geo_score": geo_summary.get("geo_score"),
+        "readability_score": readability.get("flesch_reading_ease"),
+        "grade_level": readability.get("flesch_kincaid_grade"),
+        "total_mentions": geo_summary.get("total_mentions", 0),
+        "contrast_issue_count": len(result.get("contrast_issues") or []),
+        "suggestion_count": len(result.get("suggestions") or [])
+    }
+
+
+def backfill_summaries(batch_size: int = 500) -> int:
+    """
+    Fill the summary columns of completed jobs analyzed before they existed,
+    from their result.json files. Returns the number of rows updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        with session_scope() as db:
+            rows = db.query(Analysis).filter(
+                Analysis.status == "completed", Analysis.total_mentions.is_(None), Analysis.id > last_id
+            ).order_by(Analysis.id).limit(batch_size).all()
+            if not rows:
+                return updated
+            for analysis in rows:
+                last_id = analysis.id
+                try:
+                    summary = summary_columns(json.loads(
+                        read_artifact(os.path.join(RESULTS_DIR, analysis.job_id, "result.json")) or b""
+                    ))
+                except ValueError:
+                    continue
+                for column, value in summary.items():
+                    # Scores already on the row are authoritative
+                    if getattr(analysis, column) is None:
+                        setattr(analysis, column, value)
+                updated += 1
+
+
+def serialize_row(analysis: Analysis, fields: List[str]) -> Dict[str, Any]:
+    item = {f: getattr(analysis, f) for f in fields if f in LIST_FIELDS}
+    if FULL_RESULT_FIELD in fields:
+        item[FULL_RESULT_FIELD] = None
+        if analysis.status == "completed":
+            result = read_artifact(os.path.join(RESULTS_DIR, analysis.job_id, "result.json"))
+            if result is not None:
+                item[FULL_RESULT_FIELD] = json.loads(result)
+    return item
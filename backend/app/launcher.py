@@ -0,0 +1,148 @@
+import importlib.util
+import math
+import os
+import tempfile
+import uuid
+from typing import Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every process is primary
+    fcntl = None
+
+# Address the API listens on
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+# API worker processes; 0 sizes the pool from the CPUs this container may use when
+# REDIS_URL is set, else runs one. Each worker runs its own scheduler and browser, so
+# the automatic size is capped
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+MAX_AUTO_WORKERS = int(os.getenv("MAX_AUTO_WORKERS", "8"))
+
+# Seconds an idle keep-alive connection stays open; keep it above the load balancer's idle timeout
+KEEP_ALIVE_SECONDS = int(os.getenv("KEEP_ALIVE_SECONDS", "75"))
+# Connections the listening socket queues while workers are busy
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+# On SIGTERM, seconds open requests (SSE streams included) get before they are closed;
+# running jobs then get SHUTDOWN_DRAIN_SECONDS (see app.scheduler)
+HTTP_DRAIN_SECONDS = int(os.getenv("HTTP_DRAIN_SECONDS", "20"))
+# Requests after which a worker is replaced, bounding slow leaks in native image code; 0 never
+MAX_REQUESTS_PER_WORKER = int(os.getenv("MAX_REQUESTS_PER_WORKER", "0"))
+# Proxies trusted for X-Forwarded-For/Proto
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Lock held by the primary worker of the host, which runs the once-per-host duties
+PRIMARY_LOCK_FILE = os.getenv("PRIMARY_LOCK_FILE", os.path.join("app", ".primary.lock"))
+# Set by the launcher for its workers, so a replacement worker knows it joins a running launch
+LAUNCH_ID_ENV = "VISPECTRA_LAUNCH_ID"
+
+_primary_lock = None
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: its affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def worker_count() -> int:
+    """
+    One worker unless REDIS_URL is set: without a shared broker, job events
+    and cancellations only reach the worker running the job.
+    """
+    if WEB_CONCURRENCY > 0:
+        return WEB_CONCURRENCY
+    if not os.getenv("REDIS_URL"):
+        return 1
+    return max(1, min(available_cpus(), MAX_AUTO_WORKERS))
+
+
+def claim_primary() -> Tuple[bool, bool]:
+    """
+    Try to become the host's primary worker, which alone recovers interrupted
+    jobs and runs retention. Returns (primary, fresh): fresh is True only for
+    the first primary of a launch, before any sibling can have started a
+    crawl. The lock is released when the process exits.
+    """
+    global _primary_lock
+    if fcntl is None:
+        return True, True
+    # Outside the launcher every process is its own launch
+    launch_id = os.getenv(LAUNCH_ID_ENV) or f"pid-{os.getpid()}"
+    lock_dir = os.path.dirname(PRIMARY_LOCK_FILE)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    f = open(PRIMARY_LOCK_FILE, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False, False
+    f.seek(0)
+    previous = f.read().strip()
+    f.seek(0)
+    f.truncate()
+    f.write(launch_id)
+    f.flush()
+    _primary_lock = f
+    return True, previous != launch_id
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def serve():
+    """Production: one uvicorn worker per CPU, uvloop/httptools when installed, graceful drain on SIGTERM."""
+    import uvicorn
+    from app.database import create_tables, engine
+
+    workers = worker_count()
+    # Migrate once here: workers starting together would race to create the same tables
+    create_tables()
+    engine.dispose()
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    # Inherited by every worker, including ones the supervisor restarts
+    os.environ[LAUNCH_ID_ENV] = uuid.uuid4().hex
+    if workers > 1:
+        # Workers share metrics through snapshot files, so any of them can answer /metrics
+        os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="vispectra-metrics-"))
+    if workers > 1 and not os.getenv("REDIS_URL"):
+        print("Warning: WEB_CONCURRENCY > 1 without REDIS_URL: job events and cancellations "
+              "only reach the worker running the job")
+    print(f"Starting {workers} API workers on {HOST}:{PORT} (loop={loop}, http={http})")
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=HTTP_DRAIN_SECONDS,
+        limit_max_requests=MAX_REQUESTS_PER_WORKER or None,
+        limit_max_requests_jitter=MAX_REQUESTS_PER_WORKER // 10,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        log_level="info"
+    )
+
+
+def serve_dev():
+    """Development: a single process that restarts when the code changes."""
+    import uvicorn
+
+    uvicorn.run("app.main:app", host=HOST, port=PORT, reload=True, reload_dirs=["app"], log_level="info")
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_
+
+from app.database import SessionLocal, JobLease, WorkerRecord
+
+# Seconds a claimed job stays invisible to other workers without a heartbeat
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "60"))
+# Seconds after its last heartbeat that a worker is considered dead
+WORKER_TTL = float(os.getenv("WORKER_TTL", "30"))
+# Claims of one job (initial run plus reclaims) before it is given up on
+MAX_CLAIMS = int(os.getenv("LEASE_MAX_CLAIMS", "3"))
+
+
+class SQLLeaseQueue:
+    """
+    Work queue with leases on the application database. Claims are an
+    optimistic compare-and-set UPDATE, so any number of workers on SQLite or
+    Postgres can claim safely; it is also the stand-in used without Redis.
+    Each method runs its queries in a thread, off the event loop.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    async def enqueue(self, job: Dict[str, Any], priority: int = 0) -> bool:
+        """Queue a job unless it is already queued or leased (enqueue is idempotent)."""
+        return await asyncio.to_thread(self._enqueue, job, priority)
+
+    def _enqueue(self, job: Dict[str, Any], priority: int = 0) -> bool:
+        db = self.session_factory()
+        try:
+            if db.query(JobLease.id).filter(JobLease.job_id == job["job_id"]).first():
+                return False
+            db.add(JobLease(job_id=job["job_id"], payload=json.dumps(job), priority=priority,
+                            enqueued_at=time.time(), status="queued", claims=0))
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease the most urgent queued job to worker_id; None when the queue is empty."""
+        return await asyncio.to_thread(self._claim, worker_id, lease_seconds)
+
+    def _claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            candidates = db.query(JobLease.job_id).filter(JobLease.status == "queued").order_by(
+                JobLease.priority, JobLease.enqueued_at
+            ).limit(8).all()
+            for (job_id,) in candidates:
+                claimed = db.query(JobLease).filter(
+                    JobLease.job_id == job_id, JobLease.status == "queued"
+                ).update({
+                    "status": "leased",
+                    "worker_id": worker_id,
+                    "lease_expires_at": time.time() + lease_seconds,
+                    "claims": JobLease.claims + 1
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    lease = db.query(JobLease).filter(JobLease.job_id == job_id).first()
+                    return dict(json.loads(lease.payload), claims=lease.claims)
+            return None
+        finally:
+            db.close()
+
+    async def heartbeat(self, worker_id: str, job_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extend the lease; False means the worker lost it (expired, reclaimed or cancelled)."""
+        return await asyncio.to_thread(self._heartbeat, worker_id, job_id, lease_seconds)
+
+    def _heartbeat(self, worker_id: str, job_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        db = self.session_factory()
+        try:
+            extended = db.query(JobLease).filter(
+                JobLease.job_id == job_id, JobLease.worker_id == worker_id, JobLease.status == "leased"
+            ).update({"lease_expires_at": time.time() + lease_seconds}, synchronize_session=False)
+            db.commit()
+            return bool(extended)
+        finally:
+            db.close()
+
+    async def complete(self, worker_id: str, job_id: str):
+        await asyncio.to_thread(self._complete, worker_id, job_id)
+
+    def _complete(self, worker_id: str, job_id: str):
+        db = self.session_factory()
+        try:
+            db.query(JobLease).filter(
+                JobLease.job_id == job_id, JobLease.worker_id == worker_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def cancel(self, job_id: str) -> bool:
+        """Drop a job whether queued or leased; its worker notices at the next heartbeat."""
+        return await asyncio.to_thread(self._cancel, job_id)
+
+    def _cancel(self, job_id: str) -> bool:
+        db = self.session_factory()
+        try:
+            removed = db.query(JobLease).filter(JobLease.job_id == job_id).delete(synchronize_session=False)
+            db.commit()
+            return bool(removed)
+        finally:
+            db.close()
+
+    async def contains(self, job_id: str) -> bool:
+        return await asyncio.to_thread(self._contains, job_id)
+
+    def _contains(self, job_id: str) -> bool:
+        db = self.session_factory()
+        try:
+            return db.query(JobLease.id).filter(JobLease.job_id == job_id).first() is not None
+        finally:
+            db.close()
+
+    async def reclaim_expired(self, max_claims: int = MAX_CLAIMS) -> Dict[str, List[str]]:
+        """Re-queue jobs whose lease ran out; drop those claimed max_claims times already."""
+        return await asyncio.to_thread(self._reclaim_expired, max_claims)
+
+    def _reclaim_expired(self, max_claims: int = MAX_CLAIMS) -> Dict[str, List[str]]:
+        db = self.session_factory()
+        try:
+            expired = db.query(JobLease).filter(
+                JobLease.status == "leased", JobLease.lease_expires_at < time.time()
+            ).all()
+            requeued, abandoned = [], []
+            for lease in expired:
+                if lease.claims >= max_claims:
+                    db.delete(lease)
+                    abandoned.append(lease.job_id)
+                else:
+                    lease.status = "queued"
+                    lease.worker_id = None
+                    lease.lease_expires_at = None
+                    requeued.append(lease.job_id)
+            db.commit()
+            return {"requeued": requeued, "abandoned": abandoned}
+        finally:
+            db.close()
+
+    async def register_worker(self, worker_id: str, info: Dict[str, Any]):
+        """Report a worker's liveness, capacity and current load."""
+        await asyncio.to_thread(self._register_worker, worker_id, info)
+
+    def _register_worker(self, worker_id: str, info: Dict[str, Any]):
+        db = self.session_factory()
+        try:
+            record = db.query(WorkerRecord).filter(WorkerRecord.worker_id == worker_id).first()
+            if record is None:
+                record = WorkerRecord(worker_id=worker_id, started_at=time.time())
+                db.add(record)
+            record.hostname = info.get("hostname")
+            record.capacity = info.get("capacity", 0)
+            record.load = info.get("load", 0)
+            record.last_heartbeat = time.time()
+            db.commit()
+        finally:
+            db.close()
+
+    async def deregister_worker(self, worker_id: str):
+        await asyncio.to_thread(self._deregister_worker, worker_id)
+
+    def _deregister_worker(self, worker_id: str):
+        db = self.session_factory()
+        try:
+            db.query(WorkerRecord).filter(WorkerRecord.worker_id == worker_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def workers(self, ttl: float = WORKER_TTL) -> List[Dict[str, Any]]:
+        """Live workers; records of workers silent for longer than ttl are pruned."""
+        return await asyncio.to_thread(self._workers, ttl)
+
+    def _workers(self, ttl: float = WORKER_TTL) -> List[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            cutoff = time.time() - ttl
+            db.query(WorkerRecord).filter(
+                or_(WorkerRecord.last_heartbeat.is_(None), WorkerRecord.last_heartbeat < cutoff)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return [{
+                "worker_id": w.worker_id,
+                "hostname": w.hostname,
+                "capacity": w.capacity,
+                "load": w.load,
+                "started_at": w.started_at,
+                "last_heartbeat": w.last_heartbeat
+            } for w in db.query(WorkerRecord).order_by(WorkerRecord.worker_id).all()]
+        finally:
+            db.close()
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
+
+    def _stats(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            return {
+                "queued": db.query(JobLease).filter(JobLease.status == "queued").count(),
+                "leased": db.query(JobLease).filter(JobLease.status == "leased").count()
+            }
+        finally:
+            db.close()
+
+
+# Atomic Redis operations: pop the most urgent job and lease it, extend a
+# lease only if still held by the caller, and re-queue expired leases
+_CLAIM_LUA = """
+local job_id = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+if not job_id then return nil end
+redis.call('ZREM', KEYS[1], job_id)
+redis.call('HSET', KEYS[2], job_id, ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[2], job_id)
+local claims = redis.call('HINCRBY', KEYS[5], job_id, 1)
+return {job_id, redis.call('HGET', KEYS[4], job_id), claims}
+"""
+
+_HEARTBEAT_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 1
+"""
+
+_RECLAIM_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local requeued, abandoned = {}, {}
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('HDEL', KEYS[2], job_id)
+    local claims = tonumber(redis.call('HGET', KEYS[5], job_id) or '0')
+    if claims >= tonumber(ARGV[2]) then
+        redis.call('HDEL', KEYS[4], job_id)
+        redis.call('HDEL', KEYS[5], job_id)
+        redis.call('HDEL', KEYS[6], job_id)
+        table.insert(abandoned, job_id)
+    else
+        redis.call('ZADD', KEYS[3], redis.call('HGET', KEYS[6], job_id) or ARGV[1], job_id)
+        table.insert(requeued, job_id)
+    end
+end
+return {requeued, abandoned}
+"""
+
+
+class RedisLeaseQueue:
+    """Work queue with leases in Redis, shared by the API and workers on every node."""
+
+    def __init__(self, redis_url: str, prefix: str = "vispectra:work"):
+        # Import here so the SQL queue works without redis installed
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(redis_url, decode_responses=True)
+        self.queue_key = f"{prefix}:queue"        # zset job_id -> priority score
+        self.owners_key = f"{prefix}:owners"      # hash job_id -> worker_id
+        self.expiry_key = f"{prefix}:expiry"      # zset job_id -> lease expiry
+        self.payload_key = f"{prefix}:payload"    # hash job_id -> job JSON
+        self.claims_key = f"{prefix}:claims"      # hash job_id -> times claimed
+        self.score_key = f"{prefix}:score"        # hash job_id -> queue score, for re-queueing
+        self.workers_key = f"{prefix}:workers"    # hash worker_id -> info JSON
+        self._claim = self.redis.register_script(_CLAIM_LUA)
+        self._heartbeat = self.redis.register_script(_HEARTBEAT_LUA)
+        self._reclaim = self.redis.register_script(_RECLAIM_LUA)
+
+    @staticmethod
+    def _score(priority: int) -> float:
+        # Priority class first, then FIFO within the class
+        return priority * 1e10 + time.time()
+
+    async def enqueue(self, job: Dict[str, Any], priority: int = 0) -> bool:
+        if not await self.redis.hsetnx(self.payload_key, job["job_id"], json.dumps(job)):
+            return False
+        score = self._score(priority)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.score_key, job["job_id"], score)
+            pipe.zadd(self.queue_key, {job["job_id"]: score})
+            await pipe.execute()
+        return True
+
+    async def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        result = await self._claim(
+            keys=[self.queue_key, self.owners_key, self.expiry_key, self.payload_key, self.claims_key],
+            args=[worker_id, time.time() + lease_seconds]
+        )
+        if not result:
+            return None
+        job_id, payload, claims = result
+        return dict(json.loads(payload), claims=int(claims))
+
+    async def heartbeat(self, worker_id: str, job_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        return bool(await self._heartbeat(
+            keys=[self.owners_key, self.expiry_key], args=[job_id, worker_id, time.time() + lease_seconds]
+        ))
+
+    async def _forget(self, job_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.queue_key, job_id)
+            pipe.zrem(self.expiry_key, job_id)
+            for key in (self.owners_key, self.payload_key, self.claims_key, self.score_key):
+                pipe.hdel(key, job_id)
+            results = await pipe.execute()
+        return any(results)
+
+    async def complete(self, worker_id: str, job_id: str):
+        if await self.redis.hget(self.owners_key, job_id) == worker_id:
+            await self._forget(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        return await self._forget(job_id)
+
+    async def contains(self, job_id: str) -> bool:
+        return bool(await self.redis.hexists(self.payload_key, job_id))
+
+    async def reclaim_expired(self, max_claims: int = MAX_CLAIMS) -> Dict[str, List[str]]:
+        requeued, abandoned = await self._reclaim(
+            keys=[self.expiry_key, self.owners_key, self.queue_key, self.payload_key, self.claims_key, self.score_key],
+            args=[time.time(), max_claims]
+        )
+        return {"requeued": list(requeued), "abandoned": list(abandoned)}
+
+    async def register_worker(self, worker_id: str, info: Dict[str, Any]):
+        existing = await self.redis.hget(self.workers_key, worker_id)
+        started_at = json.loads(existing)["started_at"] if existing else time.time()
+        await self.redis.hset(self.workers_key, worker_id, json.dumps({
+            "worker_id": worker_id,
+            "hostname": info.get("hostname"),
+            "capacity": info.get("capacity", 0),
+            "load": info.get("load", 0),
+            "started_at": started_at,
+            "last_heartbeat": time.time()
+        }))
+
+    async def deregister_worker(self, worker_id: str):
+        await self.redis.hdel(self.workers_key, worker_id)
+
+    async def workers(self, ttl: float = WORKER_TTL) -> List[Dict[str, Any]]:
+        cutoff = time.time() - ttl
+        live, dead = [], []
+        for worker_id, raw in (await self.redis.hgetall(self.workers_key)).items():
+            info = json.loads(raw)
+            if info["last_heartbeat"] >= cutoff:
+                live.append(info)
+            else:
+                dead.append(worker_id)
+        if dead:
+            await self.redis.hdel(self.workers_key, *dead)
+        return sorted(live, key=lambda w: w["worker_id"])
+
+    async def stats(self) -> Dict[str, int]:
+        return {
+            "queued": await self.redis.zcard(self.queue_key),
+            "leased": await self.redis.zcard(self.expiry_key)
+        }
+
+
+_lease_queue = None
+
+
+def get_lease_queue():
+    """Return the process-wide work queue: Redis when REDIS_URL is set, the database otherwise."""
+    global _lease_queue
+    if _lease_queue is None:
+        redis_url = os.getenv("REDIS_URL")
+        _lease_queue = RedisLeaseQueue(redis_url) if redis_url else SQLLeaseQueue()
+    return _lease_queue
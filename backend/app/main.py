@@ -1,5 +1,6 @@
 import os
-from fastapi import FastAPI, BackgroundTasks
+import asyncio
+from fastapi import FastAPI, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -11,17 +12,71 @@ load_dotenv()
 
 # Import routes and database
 from .routes.geo_routes import router as geo_router
-from .database import Base, engine, create_tables
+from .routes.results_routes import router as results_router
+from .database import Base, engine, create_tables, dispose_async_engine
+from .browser_pool import browser_pool
+from .scheduler import scheduler
+from .recovery import keep_jobs_owned, recover_forever
+from .worker import DISTRIBUTED, coordinate_cluster
+from .cpu_pool import cpu_pool, startup_sweep
+from .db_writer import db_writer
+from .job_listing import backfill_summaries
+from .retention import retention
+from .launcher import claim_primary
+from . import metrics, tracing
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Create tables and static directories on startup"""
+    """
+    Create tables and static directories on startup. Runs in every worker
+    process, so each builds its own browser pool, caches and scheduler;
+    host-wide duties run only in the primary worker.
+    """
     # Create database tables
     create_tables()
     
     # Create static directories if they don't exist
     os.makedirs("app/static/results", exist_ok=True)
+    startup_sweep()
+    
+    # List summaries for jobs that completed before they were stored on the row
+    backfilled = await asyncio.to_thread(backfill_summaries)
+    if backfilled:
+        print(f"Backfilled list summaries of {backfilled} analyses")
+    
+    primary, fresh_launch = claim_primary()
+    
+    # Keep this process's jobs marked as owned; the primary re-queues jobs whose owner died
+    owner_task = asyncio.create_task(keep_jobs_owned())
+    recovery_task = asyncio.create_task(recover_forever(fresh_launch)) if primary else None
+    
+    # In distributed mode workers run the jobs; reclaim their expired leases and track their capacity
+    coordinator = asyncio.create_task(coordinate_cluster()) if DISTRIBUTED else None
+    
+    # Expire and evict stored artifacts in the background
+    retention_task = asyncio.create_task(retention.run_forever()) if primary else None
+    
+    # Share this worker's metrics with its siblings' /metrics
+    metrics_task = asyncio.create_task(metrics.run_snapshots()) if metrics.METRICS_DIR else None
     yield
+    
+    # Requests have drained by now; let running jobs finish (or leave them for recovery), then close the shared browser
+    if coordinator is not None:
+        coordinator.cancel()
+    if retention_task is not None:
+        retention_task.cancel()
+    if recovery_task is not None:
+        recovery_task.cancel()
+    await scheduler.drain()
+    owner_task.cancel()
+    await db_writer.flush()
+    await asyncio.to_thread(tracing.exporter.shutdown)
+    if metrics_task is not None:
+        metrics_task.cancel()
+        metrics.write_snapshot()
+    await dispose_async_engine()
+    await browser_pool.close()
+    cpu_pool.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -40,6 +95,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Job result files resolve through the artifact store once a job is finished
+app.include_router(results_router)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -47,6 +105,13 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(geo_router, prefix="/api")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Stage latencies, job outcomes, queue depth, pool and cache state in Prometheus text format"""
+    families = await asyncio.to_thread(metrics.merged_snapshot)
+    return Response(metrics.render(families), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Vispectra API. Use /docs for API documentation."}
\ No newline at end of file
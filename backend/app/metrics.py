@@ -0,0 +1,315 @@
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from app import tracing
+
+# Directory where each API worker leaves a snapshot of its metrics, so /metrics
+# on any worker reports the whole host; unset for a single process
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# Seconds between snapshots of this worker's metrics
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+
+# Latency buckets (seconds): sub-millisecond DB batches up to multi-minute jobs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a count kept elsewhere (pool and cache statistics)."""
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name + "_total", key, value) for key, value in self._values.items()]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # Per label set: [count per bucket..., +Inf count, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    samples.append((self.name + "_bucket", key + (("le", repr(bound)),), count))
+                samples.append((self.name + "_bucket", key + (("le", "+Inf"),), state[-2]))
+                samples.append((self.name + "_count", key, state[-2]))
+                samples.append((self.name + "_sum", key, state[-1]))
+        return samples
+
+
+class Registry:
+    """Process-local metrics, plus collectors that refresh gauges from live state at scrape time."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def add_collector(self, collect: Callable[[], None]):
+        self._collectors.append(collect)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Every family as JSON-friendly data: {name: {type, help, samples: [[name, labels, value]]}}."""
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            m.name: {"type": m.kind, "help": m.help, "samples": [[n, list(k), v] for n, k, v in m.samples()]}
+            for m in metrics
+        }
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "vispectra_stage_duration_seconds", "Time spent in each job stage, by outcome (ok, error, cancelled)"
+)
+STAGE_ERRORS = registry.counter("vispectra_stage_errors", "Stage failures by exception type")
+STAGE_REUSED = registry.counter("vispectra_stage_reused", "Stages served from a checkpoint or a previous run")
+STAGE_FALLBACKS = registry.counter("vispectra_stage_fallbacks", "Stages that failed and used stand-in output")
+JOB_SECONDS = registry.histogram("vispectra_job_duration_seconds", "Time from start to end of a job, by outcome")
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Time a block as one run of `stage`, counting its failures by exception type; traced jobs get a span."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with tracing.span(f"stage.{stage}"):
+            yield
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except BaseException as e:
+        outcome = "error"
+        STAGE_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, outcome=outcome)
+
+
+def _collect_runtime():
+    """Refresh gauges from the scheduler, browser pool, caches and writers of this process."""
+    from app.analysis_cache import get_cache_stats
+    from app.browser_pool import browser_pool
+    from app.cpu_pool import cpu_pool
+    from app.db_writer import db_writer
+    from app.result_cache import result_cache
+    from app.scheduler import scheduler, PRIORITY_NAMES
+
+    gauge = registry.gauge
+    gauge("vispectra_scheduler_workers", "Job slots of the scheduler").set(scheduler.workers)
+    gauge("vispectra_scheduler_running", "Jobs running").set(scheduler.running)
+    queued = gauge("vispectra_scheduler_queued", "Jobs waiting for a slot, by priority class")
+    for priority, name in PRIORITY_NAMES.items():
+        queued.set(scheduler.queue_depth(priority), priority=name)
+    gauge("vispectra_scheduler_avg_job_seconds", "Moving average of job run time").set(scheduler.avg_job_seconds)
+    finished = registry.counter("vispectra_scheduler_jobs", "Jobs the scheduler finished, by outcome")
+    for outcome in ("completed", "failed", "cancelled", "timed_out"):
+        finished.set_total(getattr(scheduler, outcome), outcome=outcome)
+
+    browser = browser_pool.stats()
+    gauge("vispectra_browser_pages_in_use", "Browser pages open").set(browser["in_use"])
+    gauge("vispectra_browser_pages_max", "Browser pages allowed at once").set(browser["max_pages"])
+    registry.counter("vispectra_browser_launches", "Browser launches").set_total(browser["launches"])
+
+    results = result_cache.stats()
+    gauge("vispectra_result_cache_bytes", "Bytes of encoded responses cached").set(results["bytes"])
+    gauge("vispectra_result_cache_entries", "Encoded responses cached").set(results["entries"])
+    hits = registry.counter("vispectra_cache_hits", "Cache hits, by cache")
+    lookups = registry.counter("vispectra_cache_lookups", "Cache lookups, by cache")
+    hits.set_total(results["hits"], cache="result")
+    lookups.set_total(results["hits"] + results["misses"], cache="result")
+    analyses = get_cache_stats()
+    hits.set_total(analyses["hits"], cache="analysis")
+    lookups.set_total(analyses["lookups"], cache="analysis")
+
+    writer = db_writer.stats()
+    gauge("vispectra_db_writer_pending", "Bookkeeping writes waiting for the next batch").set(writer["pending"])
+    gauge("vispectra_db_writer_writes_per_flush", "Average writes committed per batch").set(writer["writes_per_flush"])
+
+    frames = cpu_pool.stats()
+    gauge("vispectra_cpu_pool_workers", "Analyzer processes (0: threads)").set(frames["workers"])
+    gauge("vispectra_shared_frame_bytes", "Bytes of screenshots held in shared memory").set(frames["bytes"])
+
+
+registry.add_collector(_collect_runtime)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families: Dict[str, Dict[str, Any]]) -> str:
+    """Prometheus text exposition format."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample_name, labels, value in family["samples"]:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{sample_name}{{{label_text}}} {value!r}" if label_text else f"{sample_name} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_snapshot():
+    """Leave this worker's metrics where its siblings' /metrics can read them."""
+    if not METRICS_DIR:
+        return
+    path = _snapshot_path(os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merged_snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    This process's metrics merged with its sibling workers' snapshots.
+    Counters and histograms are summed, including those of exited workers so
+    totals never go backwards; gauges get a `worker` label and are dropped
+    once their worker is gone.
+    """
+    own = registry.snapshot()
+    if not METRICS_DIR:
+        return own
+    snapshots = {os.getpid(): own}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        pid = int(os.path.basename(path).split(".")[0])
+        if pid == os.getpid():
+            continue
+        try:
+            with open(path) as f:
+                snapshots[pid] = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    for pid, families in snapshots.items():
+        alive = _pid_alive(pid)
+        for name, family in families.items():
+            target = merged.setdefault(name, {"type": family["type"], "help": family["help"], "values": {}})
+            for sample_name, labels, value in family["samples"]:
+                labels = tuple(tuple(pair) for pair in labels)
+                if family["type"] == "gauge":
+                    if alive:
+                        target["values"][(sample_name, labels + (("worker", str(pid)),))] = value
+                    continue
+                key = (sample_name, labels)
+                target["values"][key] = target["values"].get(key, 0.0) + value
+    return {
+        name: {"type": f["type"], "help": f["help"], "samples": [[n, list(k), v] for (n, k), v in f["values"].items()]}
+        for name, f in merged.items()
+    }
+
+
+async def run_snapshots(interval: float = METRICS_SNAPSHOT_SECONDS):
+    while True:
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except Exception as e:
+            print(f"Error writing metrics snapshot: {e}")
+        await asyncio.sleep(interval)
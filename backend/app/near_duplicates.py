@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import Analysis
+from app.artifact_store import RESULTS_DIR, artifact_exists
+from app.ai_analysis.phash import BKTree, hex_to_hash
+
+# Max Hamming distance (of 256 dHash bits) for two screenshots to count as the same template
+PHASH_THRESHOLD = int(os.getenv("SALIENCY_PHASH_THRESHOLD", "12"))
+# Jobs kept in each process's near-duplicate index (least recently added or matched are dropped)
+SALIENCY_INDEX_MAX_ENTRIES = int(os.getenv("SALIENCY_INDEX_MAX_ENTRIES", "50000"))
+
+
+def salmap_path_for(job_id: str) -> str:
+    return os.path.join(RESULTS_DIR, job_id, "salmap.png")
+
+
+class SaliencyIndex:
+    """
+    Process-wide BK-tree of screenshot perceptual hashes for jobs that have a
+    saliency map, loaded lazily from the analyses table. It holds at most
+    `max_entries` jobs, dropping the least recently added or matched, and
+    forgets jobs whose saliency map retention has evicted.
+    """
+
+    def __init__(self, max_entries: int = SALIENCY_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.tree = BKTree()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # job_id -> hash, least recent first
+        # Items removed since the tree was built: their nodes still take up room
+        self._removed = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self, db: Session):
+        rows = db.query(Analysis.job_id, Analysis.phash).filter(
+            Analysis.phash.isnot(None),
+            Analysis.salmap_path.isnot(None),
+            Analysis.status == "completed"
+        ).order_by(Analysis.created_at.desc()).limit(self.max_entries).all()
+        with self._lock:
+            for job_id, phash in reversed(rows):
+                self._add(hex_to_hash(phash), job_id)
+            self._loaded = True
+
+    def _add(self, value: int, job_id: str):
+        if job_id in self._entries:
+            self._remove(job_id)
+        self._entries[job_id] = value
+        self.tree.add(value, job_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, job_id: str):
+        value = self._entries.pop(job_id, None)
+        if value is None or not self.tree.remove(value, job_id):
+            return
+        self._removed += 1
+        # Rebuild once emptied nodes outnumber live entries, so the tree stays bounded too
+        if self._removed > max(len(self._entries), 1024):
+            self.tree = BKTree()
+            for entry_id, entry_value in self._entries.items():
+                self.tree.add(entry_value, entry_id)
+            self._removed = 0
+
+    def add(self, phash: str, job_id: str):
+        with self._lock:
+            self._add(hex_to_hash(phash), job_id)
+
+    def remove(self, job_id: str):
+        """Forget a job, e.g. once its saliency map is evicted."""
+        with self._lock:
+            self._remove(job_id)
+
+    def find(self, db: Session, phash: str, exclude_job_id: Optional[str] = None,
+             threshold: int = PHASH_THRESHOLD) -> Optional[Tuple[str, str, int]]:
+        """Closest near-duplicate with a stored saliency map: (job_id, salmap_path, distance)."""
+        if not self._loaded:
+            self._load(db)
+        with self._lock:
+            matches = self.tree.search(hex_to_hash(phash), threshold)
+        for distance, job_id in matches:
+            if job_id == exclude_job_id:
+                continue
+            path = salmap_path_for(job_id)
+            if artifact_exists(path):
+                with self._lock:
+                    if job_id in self._entries:
+                        self._entries.move_to_end(job_id)
+                return job_id, path, distance
+            # Evicted by another process's retention pass
+            self.remove(job_id)
+        return None
+
+
+saliency_index = SaliencyIndex()
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.database import Analysis, Batch, session_scope
+from app import worker
+from app.leasing import get_lease_queue
+from app.worker import run_job
+from app.events import publish_event
+from app.scheduler import scheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+# Runs a job may start before an interruption is treated as a crash loop and the job fails
+MAX_ATTEMPTS = int(os.getenv("RECOVERY_MAX_ATTEMPTS", "3"))
+# Re-queue interrupted jobs: at startup, then every RECOVERY_INTERVAL_SECONDS (primary worker only)
+RECOVER_ON_STARTUP = os.getenv("RECOVER_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+RECOVERY_INTERVAL = float(os.getenv("RECOVERY_INTERVAL_SECONDS", "30"))
+# Seconds between a process's heartbeats on the jobs it owns, and without one before its jobs are re-queued
+OWNER_HEARTBEAT_SECONDS = float(os.getenv("JOB_OWNER_HEARTBEAT_SECONDS", "10"))
+OWNER_TIMEOUT_SECONDS = float(os.getenv("JOB_OWNER_TIMEOUT_SECONDS", "60"))
+
+INTERRUPTED_STATUSES = ("pending", "processing")
+
+HOSTNAME = socket.gethostname()
+_owner: Optional[Tuple[int, str]] = None
+
+
+def owner_id() -> str:
+    """This process's owner id (host:pid:nonce), recorded on the jobs it queues and re-queues."""
+    global _owner
+    pid = os.getpid()
+    if _owner is None or _owner[0] != pid:
+        _owner = (pid, f"{HOSTNAME}:{pid}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def owner_fields() -> Dict[str, Any]:
+    """Columns that make this process the owner of a new Analysis row."""
+    return {"owner": owner_id(), "owner_heartbeat": datetime.utcnow()}
+
+
+def owner_alive(owner: Optional[str], heartbeat: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    """An owner is alive while it heartbeats and, when it is on this host, while its process exists."""
+    now = now or datetime.utcnow()
+    if not owner or heartbeat is None or now - heartbeat > timedelta(seconds=OWNER_TIMEOUT_SECONDS):
+        return False
+    host, pid, _ = owner.rsplit(":", 2)
+    if host == HOSTNAME and os.name == "posix" and owner != owner_id():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, ValueError):
+            pass
+    return True
+
+
+def heartbeat_owned_jobs() -> int:
+    with session_scope() as db:
+        return db.query(Analysis).filter(
+            Analysis.owner == owner_id(), Analysis.status.in_(INTERRUPTED_STATUSES)
+        ).update({Analysis.owner_heartbeat: datetime.utcnow()}, synchronize_session=False)
+
+
+async def keep_jobs_owned(interval: float = OWNER_HEARTBEAT_SECONDS):
+    """Every process: heartbeat the jobs it owns, so the primary doesn't take them for orphans."""
+    while True:
+        try:
+            await asyncio.to_thread(heartbeat_owned_jobs)
+        except Exception as e:
+            print(f"Error heartbeating owned jobs: {e}")
+        await asyncio.sleep(interval)
+
+
+def _dead_owners(db: Session) -> List[Optional[str]]:
+    """Owners of interrupted jobs whose process is gone (None: rows from before owners were recorded)."""
+    now = datetime.utcnow()
+    owners = db.query(Analysis.owner, func.max(Analysis.owner_heartbeat)).filter(
+        Analysis.status.in_(INTERRUPTED_STATUSES)
+    ).group_by(Analysis.owner).all()
+    return [owner for owner, heartbeat in owners if not owner_alive(owner, heartbeat, now)]
+
+
+def _requeue(analysis: Analysis, options: Dict[str, Any], batch: Optional[Batch]):
+    job_id, url = analysis.job_id, analysis.url
+    priority = PRIORITY_BULK if batch else PRIORITY_INTERACTIVE
+    scheduler.submit(
+        job_id, url,
+        lambda: run_job(
+            job_id, url, options.get("prompts"), options.get("max_age"), options.get("force", False), priority
+        ),
+        priority=priority,
+        group=batch.batch_id if batch else None,
+        group_limit=batch.concurrency if batch else None
+    )
+
+
+def _orphans(db: Session):
+    """Query of interrupted jobs whose owner is dead, or None when every owner is alive."""
+    dead = _dead_owners(db)
+    if not dead:
+        return None
+    owned_by_dead = [Analysis.owner.in_([owner for owner in dead if owner])]
+    if None in dead:
+        owned_by_dead.append(Analysis.owner.is_(None))
+    return db.query(Analysis).filter(Analysis.status.in_(INTERRUPTED_STATUSES), or_(*owned_by_dead))
+
+
+def _interrupted_job_ids(job_ids: Optional[List[str]]) -> List[str]:
+    """Jobs left pending or processing by dead owners (of `job_ids`, if given)."""
+    with session_scope() as db:
+        query = _orphans(db)
+        if query is None:
+            return []
+        if job_ids is not None:
+            query = query.filter(Analysis.job_id.in_(job_ids))
+        return [job_id for (job_id,) in query.with_entities(Analysis.job_id)]
+
+
+def _claim_interrupted(job_ids: Optional[List[str]]) -> Tuple[List[Analysis], Dict[str, Batch]]:
+    """Take over the interrupted jobs of dead owners, failing those out of attempts; returns them with their batches."""
+    with session_scope() as db:
+        query = _orphans(db)
+        if query is None:
+            return [], {}
+        if job_ids is not None:
+            query = query.filter(Analysis.job_id.in_(job_ids))
+        candidates = query.order_by(Analysis.created_at).all()
+
+        interrupted = []
+        for analysis in candidates:
+            fields = owner_fields()
+            if (analysis.attempts or 0) >= MAX_ATTEMPTS:
+                fields.update(status="failed",
+                              error=f"Interrupted {analysis.attempts} times during stage '{analysis.stage}'")
+            else:
+                fields.update(status="pending")
+            previous_owner = Analysis.owner.is_(None) if analysis.owner is None else Analysis.owner == analysis.owner
+            if db.query(Analysis).filter(
+                Analysis.job_id == analysis.job_id, Analysis.status.in_(INTERRUPTED_STATUSES), previous_owner
+            ).update(fields, synchronize_session=False):
+                db.expunge(analysis)
+                for name, value in fields.items():
+                    setattr(analysis, name, value)
+                interrupted.append(analysis)
+
+        batch_ids = {a.batch_id for a in interrupted if a.batch_id}
+        batches = {}
+        if batch_ids:
+            batches = {b.batch_id: b for b in db.query(Batch).filter(Batch.batch_id.in_(batch_ids))}
+        # Detached snapshots: the claims commit on leaving the scope
+        db.expunge_all()
+    return interrupted, batches
+
+
+async def recover_interrupted_jobs(job_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Re-queue jobs left pending or processing by a process that died (or just
+    those of `job_ids`). Each is claimed first, conditionally on its dead
+    owner, so concurrent recoveries never both run it; it then resumes from
+    its checkpoint: finished stages are read back instead of recomputed.
+    In distributed mode a job still in the work queue isn't orphaned: a
+    worker holds (or will reclaim) its lease, so it is left alone.
+    """
+    if worker.DISTRIBUTED:
+        queue = get_lease_queue()
+        orphans = await asyncio.to_thread(_interrupted_job_ids, job_ids)
+        job_ids = [job_id for job_id in orphans if not await queue.contains(job_id)]
+        if not job_ids:
+            return {"requeued": 0, "failed": 0}
+    interrupted, batches = await asyncio.to_thread(_claim_interrupted, job_ids)
+
+    requeued = failed = 0
+    for analysis in interrupted:
+        if analysis.status == "failed":
+            await publish_event(analysis.job_id, "failed", error=analysis.error)
+            failed += 1
+            continue
+        batch = batches.get(analysis.batch_id)
+        options = json.loads(analysis.options or (batch.options if batch else None) or "{}")
+        _requeue(analysis, options, batch)
+        requeued += 1
+
+    if requeued or failed:
+        print(f"Recovered interrupted jobs: {requeued} re-queued, {failed} failed after {MAX_ATTEMPTS} attempts")
+    return {"requeued": requeued, "failed": failed}
+
+
+async def recover_forever(fresh_launch: bool, interval: float = RECOVERY_INTERVAL):
+    """
+    Primary worker: re-queue the jobs of dead processes at startup and then
+    periodically, so jobs of a crashed or recycled sibling aren't stranded.
+    """
+    if not RECOVER_ON_STARTUP:
+        return
+    if fresh_launch:
+        # The crawls feeding batches died with the previous launch; those batches have all they will get
+        with session_scope() as db:
+            db.query(Batch).filter(Batch.discovering.is_(True)).update(
+                {"discovering": False}, synchronize_session=False
+            )
+    while True:
+        try:
+            await recover_interrupted_jobs()
+        except Exception as e:
+            print(f"Error recovering interrupted jobs: {e}")
+        await asyncio.sleep(interval)
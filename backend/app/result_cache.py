@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from fastapi.responses import Response
+
+from app.artifact_store import RESULTS_DIR, read_artifact
+from app.metrics import track_stage
+
+# Bytes of encoded job responses kept in memory; 0 disables the cache
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class RawJSONResponse(Response):
+    """Response whose body is already-encoded JSON: no validation, no re-serialization."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content
+
+
+class CachedResult(NamedTuple):
+    body: bytes
+    etag: str
+    # (mtime_ns, size) of result.json when the body was built; None once it lives in the artifact store
+    stamp: Optional[Tuple[int, int]]
+
+
+def result_path(job_id: str) -> str:
+    return os.path.join(RESULTS_DIR, job_id, "result.json")
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def encode_completed(job_id: str, result: bytes) -> bytes:
+    """
+    The JobResponse body of a completed job with result.json spliced in as-is:
+    the file is already JSON, so it is never parsed or re-serialized.
+    """
+    head = json.dumps({"job_id": job_id, "status": "completed"})[:-1].encode("utf-8")
+    tail = json.dumps({
+        "error": None, "queue_position": None, "estimated_wait_seconds": None,
+        "estimated_start_at": None, "coalesced": False
+    })[1:].encode("utf-8")
+    return head + b', "result": ' + result.strip() + b", " + tail
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+class ResultCache:
+    """
+    Size-bounded LRU of encoded /api/job responses for completed jobs, keyed
+    by job id. An entry is served only while result.json still has the
+    mtime and size it was built from (or, once published to the artifact
+    store, is still absent from disk), so rewrites by another process
+    invalidate it too; writers in this process call invalidate().
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, job_id: str) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(job_id)
+        if entry is not None and _file_stamp(result_path(job_id)) == entry.stamp:
+            with self._lock:
+                if job_id in self._entries:
+                    self._entries.move_to_end(job_id)
+                self.hits += 1
+            return entry
+        if entry is not None:
+            self.invalidate(job_id)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def load(self, job_id: str) -> Optional[CachedResult]:
+        """Read result.json, encode the response once and cache it. None if the result is gone."""
+        path = result_path(job_id)
+        stamp = _file_stamp(path)
+        result = read_artifact(path)
+        if result is None:
+            return None
+        with track_stage("encode_response"):
+            body = encode_completed(job_id, result)
+        entry = CachedResult(body, f'"{hashlib.sha1(body).hexdigest()}"', stamp)
+        self._put(job_id, entry)
+        return entry
+
+    def _put(self, job_id: str, entry: CachedResult):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(job_id, None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._entries[job_id] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+
+    def invalidate(self, job_id: str):
+        with self._lock:
+            entry = self._entries.pop(job_id, None)
+            if entry is not None:
+                self._bytes -= len(entry.body)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, or_
+
+from app.database import Analysis, Artifact, ArtifactRef, session_scope
+from app.near_duplicates import saliency_index
+from app.artifact_store import (
+    ARTIFACT_BACKEND, ARTIFACT_ROOT, ARTIFACT_STORE_ENABLED, RESULTS_DIR, artifact_store, read_artifact
+)
+
+# Days each kind of job file is kept; 0 keeps it forever
+RETENTION_TTL_DAYS = {
+    "screenshot": float(os.getenv("RETENTION_TTL_SCREENSHOT_DAYS", "30")),
+    "overlay": float(os.getenv("RETENTION_TTL_OVERLAY_DAYS", "7")),
+    "capture": float(os.getenv("RETENTION_TTL_CAPTURE_DAYS", "30")),
+    "summary": float(os.getenv("RETENTION_TTL_SUMMARY_DAYS", "0")),
+    "other": float(os.getenv("RETENTION_TTL_OTHER_DAYS", "30")),
+}
+# Kinds evicted (least recently accessed first) when the store is over budget, tier by tier:
+# regenerable overlays before the screenshots they are rebuilt from
+BUDGET_EVICTION_TIERS = (("overlay",), ("capture", "other"), ("screenshot",))
+# Seconds a referenced blob is safe from budget eviction, so a regenerated overlay isn't evicted again at once
+RETENTION_MIN_AGE_SECONDS = float(os.getenv("RETENTION_MIN_AGE_SECONDS", "3600"))
+
+# Total stored bytes allowed (0: no budget), and free disk space to keep under a local store
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(20 * 1024 ** 3)))
+RETENTION_MIN_FREE_BYTES = int(os.getenv("RETENTION_MIN_FREE_BYTES", str(1024 ** 3)))
+
+# Seconds between retention passes, and rows handled per step of a pass
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL_SECONDS", "60"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "200"))
+
+# Days the working directory of a failed or cancelled job is kept
+RETENTION_FAILED_DAYS = float(os.getenv("RETENTION_FAILED_DAYS", "3"))
+
+# Analysis columns pointing at files retention may evict; cleared once a file can't be served or rebuilt
+EVICTED_COLUMNS = {"overlay.png": "overlay_path", "salmap.png": "salmap_path"}
+
+# Files rebuilt on request from the job's screenshot after eviction
+REGENERABLE = ("overlay.png", "salmap.png")
+SCREENSHOT = "screenshot.png"
+
+
+class RetentionManager:
+    """
+    Keeps the artifact store within its TTLs and size budget. Each pass does
+    bounded, index-driven steps: expire references past their kind's TTL,
+    evict the least recently accessed heavy files while over budget, and
+    move leftover job directories (finished before the store existed, or of
+    failed jobs) out of the results directory. Nothing walks the filesystem.
+    """
+
+    def __init__(self, max_bytes: int = ARTIFACT_MAX_BYTES, batch_size: int = RETENTION_BATCH):
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        # Keyset positions of the job-directory sweeps, so each pass continues the last one
+        self._adopt_after = 0
+        self._failed_after = 0
+        self.expired = 0
+        self.evicted = 0
+        self.adopted = 0
+        self.removed_dirs = 0
+        self.regenerated = 0
+        self.last_pass: Optional[datetime] = None
+
+    def _drop(self, job_id: str, name: str) -> bool:
+        if not artifact_store.drop_job_file(job_id, name):
+            return False
+        if name == "salmap.png":
+            # Other processes notice on their next lookup of the job
+            saliency_index.remove(job_id)
+        if name == SCREENSHOT or name in EVICTED_COLUMNS:
+            # An evicted overlay is still served (rebuilt) while the screenshot is stored; after that it's gone
+            manifest = artifact_store.manifest(job_id)
+            columns = {} if SCREENSHOT in manifest else {
+                column: None for file, column in EVICTED_COLUMNS.items() if file not in manifest
+            }
+            if columns:
+                with session_scope() as db:
+                    db.query(Analysis).filter(Analysis.job_id == job_id).update(
+                        columns, synchronize_session=False
+                    )
+        return True
+
+    def expire(self) -> int:
+        """Drop job files older than their kind's TTL (one batch per kind)."""
+        dropped = 0
+        now = datetime.utcnow()
+        for kind, days in RETENTION_TTL_DAYS.items():
+            if days <= 0:
+                continue
+            with session_scope() as db:
+                refs = db.query(ArtifactRef.job_id, ArtifactRef.name).filter(
+                    ArtifactRef.kind == kind, ArtifactRef.created_at < now - timedelta(days=days)
+                ).limit(self.batch_size).all()
+            dropped += sum(self._drop(job_id, name) for job_id, name in refs)
+        self.expired += dropped
+        return dropped
+
+    def stored_bytes(self) -> int:
+        with session_scope() as db:
+            return db.query(func.coalesce(func.sum(Artifact.stored_size), 0)).scalar()
+
+    def over_budget(self) -> bool:
+        if self.max_bytes and self.stored_bytes() > self.max_bytes:
+            return True
+        if ARTIFACT_BACKEND == "local" and RETENTION_MIN_FREE_BYTES and os.path.isdir(ARTIFACT_ROOT):
+            return shutil.disk_usage(ARTIFACT_ROOT).free < RETENTION_MIN_FREE_BYTES
+        return False
+
+    def enforce_budget(self, max_steps: int = 10) -> int:
+        """
+        Evict least recently accessed heavy blobs, a batch at a time, until
+        within budget. Every reference to a chosen blob is dropped, since its
+        bytes are freed only with the last one. Screenshots go only once no
+        regenerable file is left, and blobs referenced within the last
+        RETENTION_MIN_AGE_SECONDS (e.g. just regenerated overlays) are kept.
+        """
+        dropped = 0
+        for _ in range(max_steps):
+            if not self.over_budget():
+                break
+            refs = []
+            young = datetime.utcnow() - timedelta(seconds=RETENTION_MIN_AGE_SECONDS)
+            with session_scope() as db:
+                evictable = ()
+                for kinds in BUDGET_EVICTION_TIERS:
+                    evictable += kinds
+                    # Blobs of this tier that no later tier's file or recent reference still holds
+                    held = db.query(ArtifactRef.digest).filter(
+                        or_(ArtifactRef.kind.notin_(evictable), ArtifactRef.created_at >= young)
+                    )
+                    digests = db.query(Artifact.digest).filter(
+                        Artifact.digest.in_(db.query(ArtifactRef.digest).filter(ArtifactRef.kind.in_(kinds))),
+                        Artifact.digest.notin_(held)
+                    ).order_by(Artifact.last_accessed).limit(self.batch_size)
+                    refs = db.query(ArtifactRef.job_id, ArtifactRef.name).filter(
+                        ArtifactRef.digest.in_(digests)
+                    ).all()
+                    if refs:
+                        break
+            if not refs:
+                break
+            dropped += sum(self._drop(job_id, name) for job_id, name in refs)
+        self.evicted += dropped
+        return dropped
+
+    def sweep_job_dirs(self) -> Dict[str, int]:
+        """
+        Publish directories of completed jobs that have no manifest yet, and
+        remove those of long-failed jobs. Walks the analyses table by id.
+        """
+        adopted = removed = 0
+        with session_scope() as db:
+            completed = db.query(Analysis.id, Analysis.job_id).filter(
+                Analysis.id > self._adopt_after, Analysis.status == "completed", Analysis.artifacts.is_(None)
+            ).order_by(Analysis.id).limit(self.batch_size).all()
+            failed = db.query(Analysis.id, Analysis.job_id).filter(
+                Analysis.id > self._failed_after, Analysis.status.in_(("failed", "cancelled")),
+                Analysis.completed_at < datetime.utcnow() - timedelta(days=RETENTION_FAILED_DAYS)
+            ).order_by(Analysis.id).limit(self.batch_size).all()
+
+        # Wrap around once the end of the table is reached
+        self._adopt_after = completed[-1][0] if completed else 0
+        self._failed_after = failed[-1][0] if failed else 0
+
+        if ARTIFACT_STORE_ENABLED:
+            for _, job_id in completed:
+                output_dir = os.path.join(RESULTS_DIR, job_id)
+                if not os.path.isdir(output_dir):
+                    continue
+                manifest = artifact_store.publish_job(job_id, output_dir)
+                with session_scope() as db:
+                    db.query(Analysis).filter(Analysis.job_id == job_id).update(
+                        {Analysis.artifacts: json.dumps(manifest)}, synchronize_session=False
+                    )
+                artifact_store.retire_job_dir(job_id, output_dir, manifest)
+                adopted += 1
+        for _, job_id in failed:
+            output_dir = os.path.join(RESULTS_DIR, job_id)
+            if os.path.isdir(output_dir):
+                shutil.rmtree(output_dir, ignore_errors=True)
+                removed += 1
+
+        self.adopted += adopted
+        self.removed_dirs += removed
+        return {"adopted": adopted, "removed_dirs": removed}
+
+    def run_pass(self) -> Dict[str, Any]:
+        artifact_store.flush_touches()
+        result = {"expired": self.expire(), "evicted": self.enforce_budget(), **self.sweep_job_dirs()}
+        self.last_pass = datetime.utcnow()
+        return result
+
+    async def run_forever(self, interval: float = RETENTION_INTERVAL):
+        while True:
+            try:
+                result = await asyncio.to_thread(self.run_pass)
+                if any(result.values()):
+                    print(f"Retention pass: {result}")
+            except Exception as e:
+                print(f"Error in retention pass: {e}")
+            await asyncio.sleep(interval)
+
+    def regenerate_saliency(self, job_id: str) -> bool:
+        """Rebuild an evicted overlay and saliency map from the job's stored screenshot."""
+        from app.ai_analysis import saliency
+
+        # Only finished jobs: a running job writes its own overlay
+        if not artifact_store.manifest(job_id):
+            return False
+        screenshot = read_artifact(os.path.join(RESULTS_DIR, job_id, SCREENSHOT))
+        if screenshot is None:
+            return False
+        with tempfile.TemporaryDirectory() as tmp:
+            screenshot_path = os.path.join(tmp, "screenshot.png")
+            with open(screenshot_path, "wb") as f:
+                f.write(screenshot)
+            paths = {name: os.path.join(tmp, name) for name in REGENERABLE}
+            saliency.generate_overlay_from_file(screenshot_path, paths["overlay.png"], paths["salmap.png"])
+            for name, path in paths.items():
+                with open(path, "rb") as f:
+                    artifact_store.add_job_file(job_id, name, f.read())
+        with session_scope() as db:
+            db.query(Analysis).filter(Analysis.job_id == job_id).update({
+                Analysis.overlay_path: f"/static/results/{job_id}/overlay.png",
+                Analysis.salmap_path: f"/static/results/{job_id}/salmap.png"
+            }, synchronize_session=False)
+        self.regenerated += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_bytes": self.max_bytes,
+            "stored_bytes": self.stored_bytes(),
+            "ttl_days": RETENTION_TTL_DAYS,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "adopted": self.adopted,
+            "removed_dirs": self.removed_dirs,
+            "regenerated": self.regenerated,
+            "last_pass": self.last_pass
+        }
+
+
+retention = RetentionManager()
@@ -1,4 +1,7 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from fastapi import (
+    APIRouter, BackgroundTasks, HTTPException, Depends, Request, Response, UploadFile, File, Form, Header
+)
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
@@ -7,173 +10,576 @@ import uuid
 from pathlib import Path
 import httpx
 import asyncio
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-# Import AI analysis modules
-from app.ai_analysis.saliency import generate_overlay_from_file
-from app.ai_analysis.readability import flesch_kincaid_readability
-from app.ai_analysis.contrast import contrast_ratio, wcag_pass_level
-from app.ai_analysis.summarizer import generate_suggestions
-from app.ai_analysis.website_analyzer import analyze_website
-from app.ai_analysis.prompt_tester import test_prompts
-from app.ai_analysis.citation_extractor import extract_citations
+# AI analysis modules, imported on first use so the API starts without cv2
+from app.ai_analysis import analyzer
 
 # Import database and background processing
-from app.database import get_db, Analysis
-from app.background import process_analysis_job
+from app.database import get_async_db, Analysis, Artifact, Batch
+from app import tracing
+from app.analysis_cache import get_cache_stats
+from app.worker import run_job, cancel_remote, DISTRIBUTED
+from app.leasing import get_lease_queue
+from app.cpu_pool import cpu_pool
+from app.db_writer import db_writer
+from app.scheduler import Reservation, scheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from app.single_flight import (
+    single_flight, request_hash, scoped_key, find_idempotency_key, remember_idempotency_key
+)
+from app.batches import (
+    MAX_BATCH_SIZE, batch_progress, clamp_concurrency, create_batch, create_crawl_batch, dedupe_urls,
+    parse_url_list, run_batch, run_crawl
+)
+from app.crawler import MAX_PAGES as CRAWL_MAX_PAGES
+from app.events import get_broker, is_terminal, publish_event, wait_for_events, TERMINAL_STAGES
+from app.result_cache import result_cache, RawJSONResponse, etag_matches
+from app.artifact_store import artifact_store
+from app.retention import retention
+from app.recovery import owner_fields
+from app.job_listing import (
+    FULL_RESULT_FIELD, clamp_limit, encode_cursor, list_query, parse_fields, serialize_row
+)
 
 # Create router
 router = APIRouter()
 
+saliency_analyzer = analyzer("saliency")
+readability_analyzer = analyzer("readability")
+contrast_analyzer = analyzer("contrast")
+prompt_tester = analyzer("prompt_tester")
+citation_extractor = analyzer("citation_extractor")
+
+# Seconds between SSE keep-alive comments, and the cap on a single long-poll
+SSE_KEEPALIVE_SECONDS = 15.0
+LONG_POLL_MAX_SECONDS = 60.0
+
 
 # Request models
 class AnalyzeRequest(BaseModel):
     url: str
     prompts: List[str] = []
+    # Reuse a result for identical page content analyzed within max_age seconds
+    max_age: Optional[int] = None
+    # Recompute every stage, ignoring cached results and unchanged stage inputs
+    force: bool = False
+    # Answer 202 "queued" with queue position and estimated start time
+    queued_ack: bool = False
+
+
+class BatchAnalyzeRequest(BaseModel):
+    urls: List[str]
+    prompts: List[str] = []
+    max_age: Optional[int] = None
+    force: bool = False
+    # Jobs of this batch running at once (capped by MAX_BATCH_CONCURRENCY)
+    concurrency: Optional[int] = None
+
+
+class CrawlRequest(BaseModel):
+    # Root URL of the site, or the URL of a sitemap.xml / sitemap index / .xml.gz
+    url: str
+    max_pages: int = 100
+    politeness_delay: Optional[float] = None
+    same_host_only: bool = True
+    prompts: List[str] = []
+    max_age: Optional[int] = None
+    force: bool = False
+    concurrency: Optional[int] = None
 
 
 # Response models
+class BatchResponse(BaseModel):
+    batch_id: str
+    total: int
+    concurrency: int
+    job_ids: List[str]
+
+
 class JobResponse(BaseModel):
     job_id: str
     status: str
     result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Filled for queued acknowledgements
+    queue_position: Optional[int] = None
+    estimated_wait_seconds: Optional[float] = None
+    estimated_start_at: Optional[datetime] = None
+    # True when the request was answered with an existing job (Idempotency-Key or in-flight duplicate)
+    coalesced: bool = False
+
+
+def _admit(priority: int, customer: Optional[str], count: int = 1):
+    """Refuse work beyond the queue's high-water mark with 429/503 and a computed Retry-After"""
+    rejection = scheduler.check_admission(priority, customer, count)
+    if rejection:
+        detail = "Too many queued jobs for this customer" if rejection["status_code"] == 429 \
+            else "Analysis queue is full, retry later"
+        raise HTTPException(
+            status_code=rejection["status_code"],
+            detail=detail,
+            headers={"Retry-After": str(rejection["retry_after"])}
+        )
+
+
+def _admit_bulk(customer: Optional[str], count: int) -> Reservation:
+    """
+    Admit bulk work that is queued later, from a background task, and hold its
+    queue room until then, so concurrent batch and crawl requests see each other.
+    """
+    _admit(PRIORITY_BULK, customer, count)
+    return scheduler.reserve(PRIORITY_BULK, count)
+
+
+async def _get_analysis(db: AsyncSession, job_id: str) -> Optional[Analysis]:
+    return await db.scalar(select(Analysis).where(Analysis.job_id == job_id))
+
+
+async def _existing_job_response(db: AsyncSession, job_id: str, coalesced: bool) -> JobResponse:
+    analysis = await _get_analysis(db, job_id)
+    status = analysis.status if analysis else "pending"
+    return JobResponse(job_id=job_id, status=status, error=analysis.error if analysis else None,
+                       coalesced=coalesced)
+
+
+async def _claim_idempotency_key(db: AsyncSession, key: str, job_id: str, req_hash: str) -> Optional[JobResponse]:
+    """
+    Tie the key to job_id, committing it with the rows already added to the
+    session; None if that worked, else (the session rolled back) the response
+    of the request that claimed the key first.
+    """
+    record = await remember_idempotency_key(db, key, job_id, req_hash)
+    if record is None or record.job_id == job_id:
+        return None
+    if record.request_hash != req_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return await _existing_job_response(db, record.job_id, coalesced=True)
 
 
 @router.post("/analyze", response_model=JobResponse)
-async def analyze_site(request: AnalyzeRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def analyze_site(request: AnalyzeRequest, response: Response, db: AsyncSession = Depends(get_async_db),
+                       x_customer_id: Optional[str] = Header(None),
+                       idempotency_key: Optional[str] = Header(None),
+                       traceparent: Optional[str] = Header(None)):
+    req_hash = request_hash(request.url, {
+        "prompts": request.prompts, "max_age": request.max_age, "force": request.force
+    })
+    
+    # A retried request with the same Idempotency-Key gets the job it was first answered with
+    key = scoped_key(idempotency_key, x_customer_id) if idempotency_key else None
+    if key:
+        record = await find_idempotency_key(db, key)
+        if record:
+            if record.request_hash != req_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            return await _existing_job_response(db, record.job_id, coalesced=True)
+    
+    # Identical URL + options already queued or running: join that job instead of starting another
+    leader = single_flight.leader(req_hash)
+    if leader:
+        single_flight.coalesced += 1
+        if key:
+            claimed = await _claim_idempotency_key(db, key, leader, req_hash)
+            if claimed:
+                return claimed
+        return await _existing_job_response(db, leader, coalesced=True)
+    
+    # Admission control before any work is created
+    _admit(PRIORITY_INTERACTIVE, x_customer_id)
+    
     # Generate job ID
     job_id = str(uuid.uuid4())
     
-    # Create job directory
-    results_dir = Path(f"app/static/results/{job_id}")
-    results_dir.mkdir(parents=True, exist_ok=True)
+    # Sampled jobs are traced from here; the job's spans hang off this request's span
+    with tracing.trace("POST /api/analyze", traceparent, job_id=job_id, url=request.url) as request_span:
+        # Create database record
+        analysis = Analysis(
+            job_id=job_id,
+            url=request.url,
+            status="pending",
+            options=json.dumps({"prompts": request.prompts, "max_age": request.max_age, "force": request.force}),
+            trace_id=request_span.trace_id if request_span else None,
+            trace_parent_id=request_span.span_id if request_span else None,
+            **owner_fields()
+        )
+        db.add(analysis)
+        with tracing.span("db.commit"):
+            if key:
+                # The key commits with the job, so it never points at a job that doesn't exist;
+                # of concurrent requests with one key, only the first starts a job
+                claimed = await _claim_idempotency_key(db, key, job_id, req_hash)
+                if claimed:
+                    return claimed
+            else:
+                await db.commit()
+        
+        # Create job directory
+        Path(f"app/static/results/{job_id}").mkdir(parents=True, exist_ok=True)
+        
+        # Queue as interactive work, ahead of bulk batches and crawls
+        single_flight.lead(req_hash, job_id)
+        future = scheduler.submit(
+            job_id, request.url,
+            lambda: run_job(job_id, request.url, request.prompts, request.max_age, request.force, PRIORITY_INTERACTIVE),
+            priority=PRIORITY_INTERACTIVE,
+            customer=x_customer_id
+        )
+        future.add_done_callback(lambda _: single_flight.land(req_hash, job_id))
+    if request_span:
+        response.headers["traceparent"] = tracing.format_traceparent(request_span)
     
-    # Create database record
-    analysis = Analysis(
-        job_id=job_id,
-        url=request.url,
-        status="pending"
-    )
-    db.add(analysis)
-    db.commit()
+    if request.queued_ack:
+        wait = scheduler.estimate_wait(PRIORITY_INTERACTIVE)
+        response.status_code = 202
+        return JobResponse(
+            job_id=job_id,
+            status="queued",
+            queue_position=scheduler.queue_depth(PRIORITY_INTERACTIVE),
+            estimated_wait_seconds=round(wait, 1),
+            estimated_start_at=datetime.utcnow() + timedelta(seconds=wait)
+        )
+    return JobResponse(job_id=job_id, status="pending")
+
+
+async def _start_batch(urls: List[str], prompts: List[str], max_age: Optional[int], force: bool,
+                       concurrency: Optional[int], customer: Optional[str],
+                       background_tasks: BackgroundTasks, db: AsyncSession) -> BatchResponse:
+    urls = dedupe_urls(urls)
+    if not urls:
+        raise HTTPException(status_code=400, detail="No URLs to analyze")
+    if len(urls) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} URLs")
+    reservation = _admit_bulk(customer, len(urls))
+    
+    concurrency = clamp_concurrency(concurrency)
+    options = {"prompts": prompts, "max_age": max_age, "force": force}
+    try:
+        batch_id, jobs = await db.run_sync(create_batch, urls, concurrency, options)
+    except BaseException:
+        reservation.release()
+        raise
     
     # Start background task
-    background_tasks.add_task(process_analysis_job, job_id, request.url, db)
+    background_tasks.add_task(run_batch, batch_id, jobs, options, concurrency, customer or "anonymous", reservation)
     
-    return JobResponse(job_id=job_id, status="pending")
+    return BatchResponse(
+        batch_id=batch_id,
+        total=len(jobs),
+        concurrency=concurrency,
+        job_ids=[job_id for job_id, _ in jobs]
+    )
 
 
-@router.get("/job/{job_id}", response_model=JobResponse)
-async def get_job_status(job_id: str, db: Session = Depends(get_db)):
-    # Query the database for the job
-    analysis = db.query(Analysis).filter(Analysis.job_id == job_id).first()
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Job not found")
+@router.post("/analyze/batch", response_model=BatchResponse)
+async def analyze_batch(request: BatchAnalyzeRequest, background_tasks: BackgroundTasks,
+                        db: AsyncSession = Depends(get_async_db), x_customer_id: Optional[str] = Header(None)):
+    """Analyze a list of URLs under one batch id with bounded concurrency"""
+    return await _start_batch(
+        request.urls, request.prompts, request.max_age, request.force,
+        request.concurrency, x_customer_id, background_tasks, db
+    )
+
+
+@router.post("/analyze/batch/upload", response_model=BatchResponse)
+async def analyze_batch_upload(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    concurrency: Optional[int] = Form(None),
+    max_age: Optional[int] = Form(None),
+    force: bool = Form(False),
+    db: AsyncSession = Depends(get_async_db),
+    x_customer_id: Optional[str] = Header(None)
+):
+    """Analyze the URLs of an uploaded text/CSV file (one URL per line or first column)"""
+    content = (await file.read()).decode("utf-8", "replace")
+    return await _start_batch(
+        parse_url_list(content), [], max_age, force, concurrency, x_customer_id, background_tasks, db
+    )
+
+
+@router.post("/crawl")
+async def crawl_site(request: CrawlRequest, background_tasks: BackgroundTasks,
+                     db: AsyncSession = Depends(get_async_db),
+                     x_customer_id: Optional[str] = Header(None)):
+    """Discover a site's pages from its sitemap (or links) and analyze them as a batch"""
+    max_pages = max(1, min(request.max_pages, CRAWL_MAX_PAGES))
+    reservation = _admit_bulk(x_customer_id, max_pages)
+    concurrency = clamp_concurrency(request.concurrency)
+    options = {"prompts": request.prompts, "max_age": request.max_age, "force": request.force}
+    try:
+        batch_id = await db.run_sync(create_crawl_batch, request.url, concurrency, options)
+    except BaseException:
+        reservation.release()
+        raise
     
-    # Check if job is already completed
-    if analysis.status == "completed":
-        # Load result from file if it exists
-        result_path = Path(f"app/static/results/{job_id}/result.json")
-        if result_path.exists():
-            with open(result_path, "r") as f:
-                result = json.load(f)
-            return JobResponse(job_id=job_id, status="completed", result=result)
+    # Start background task
+    background_tasks.add_task(
+        run_crawl, batch_id, request.url, options, concurrency,
+        max_pages, request.politeness_delay, request.same_host_only, x_customer_id or "anonymous", reservation
+    )
     
-    # For demo purposes, always return mock data after a short delay
-    # This simulates the job completing successfully
-    await asyncio.sleep(1)  # Simulate processing time
+    return {"batch_id": batch_id, "max_pages": max_pages, "concurrency": concurrency}
+
+
+@router.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Aggregate progress and score summary of a batch"""
+    batch = await db.scalar(select(Batch).where(Batch.batch_id == batch_id))
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return await db.run_sync(batch_progress, batch)
+
+
+@router.get("/job/{job_id}", response_model=JobResponse)
+async def get_job_status(job_id: str, if_none_match: Optional[str] = Header(None),
+                         db: AsyncSession = Depends(get_async_db)):
+    # Completed results are served pre-encoded from memory, without touching the database
+    cached = result_cache.get(job_id)
+    if cached is None:
+        # Query the database for the job
+        analysis = await _get_analysis(db, job_id)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if analysis.status == "completed":
+            cached = await asyncio.to_thread(result_cache.load, job_id)
     
-    # Update status to completed in database
-    analysis.status = "completed"
-    db.commit()
+    if cached is not None:
+        if etag_matches(if_none_match, cached.etag):
+            return Response(status_code=304, headers={"ETag": cached.etag})
+        return RawJSONResponse(cached.body, headers={"ETag": cached.etag})
     
-    # Create mock result data
-    mock_result = {
-        "url": analysis.url,
-        "screenshot_path": f"/static/results/{job_id}/screenshot.png",
-        "saliency_path": f"/static/results/{job_id}/saliency.png",
-        "readability": {
-            "score": 65.8,
-            "grade_level": "8th grade",
-            "reading_time": "2 minutes"
-        },
-        "contrast_issues": [
-            {"element": "header", "ratio": 3.2, "wcag_level": "AA"},
-            {"element": "footer", "ratio": 4.1, "wcag_level": "AAA"}
-        ],
-        "axe_violations": [
+    # Pending/processing jobs report their status straight away; clients that
+    # want progress should follow /job/{job_id}/events instead of polling
+    return JobResponse(job_id=job_id, status=analysis.status, error=analysis.error)
+
+
+@router.get("/job/{job_id}/artifacts")
+async def get_job_artifacts(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """A finished job's files with immutable, content-addressed URLs (empty while it runs)"""
+    analysis = await _get_analysis(db, job_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Job not found")
+    manifest = json.loads(analysis.artifacts) if analysis.artifacts else {}
+    rows = (await db.scalars(select(Artifact).where(Artifact.digest.in_(manifest.values())))).all()
+    by_digest = {row.digest: row for row in rows}
+    return {
+        "job_id": job_id,
+        "artifacts": [
             {
-                "id": "color-contrast",
-                "impact": "serious",
-                "description": "Elements must have sufficient color contrast",
-                "help": "Elements must have sufficient color contrast",
-                "nodes": [
-                    {
-                        "html": "<button class='btn-primary'>Submit</button>",
-                        "target": ["button.btn-primary"]
-                    }
-                ]
+                "name": name,
+                "digest": digest,
+                "size": by_digest[digest].size,
+                "media_type": by_digest[digest].media_type,
+                "url": f"/api/artifacts/{digest}"
             }
-        ],
-        "suggestions": [
-            "Improve contrast in header section",
-            "Add more descriptive alt text to images",
-            "Consider breaking long paragraphs into shorter ones"
-        ],
-        "citations": [
-            {"text": "According to research...", "source": "Citation needed"}
-        ],
-        "prompt_results": [
-            {"prompt": "What is this website about?", "response": "This website appears to be about data visualization and analytics."}
-        ],
-        "geo_score": 82
+            for name, digest in sorted(manifest.items()) if digest in by_digest
+        ]
     }
+
+
+@router.get("/job/{job_id}/trace")
+async def get_job_trace(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Timeline of a traced job: request, queue wait, each run, its stages and their sub-calls"""
+    analysis = await _get_analysis(db, job_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not analysis.trace_id:
+        raise HTTPException(status_code=404, detail="Job was not sampled for tracing (see TRACE_SAMPLE_RATE)")
+    spans = await asyncio.to_thread(tracing.find_trace, analysis.trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="No spans stored for this job's trace")
+    return {"job_id": job_id, "trace_id": analysis.trace_id, "status": analysis.status, **tracing.waterfall(spans)}
+
+
+@router.delete("/job/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Cancel a queued or running job; a running job stops at its next await and records where it stopped"""
+    analysis = await _get_analysis(db, job_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if analysis.status in TERMINAL_STAGES:
+        raise HTTPException(status_code=409, detail=f"Job already {analysis.status}")
+    
+    where = scheduler.cancel(job_id)
+    if where == "running":
+        # The pipeline records "cancelled" itself while unwinding
+        return JobResponse(job_id=job_id, status="cancelling")
+    
+    # Never started (or not owned by this process): record the cancellation here,
+    # and pull it from the worker pool in case a worker holds it
+    await cancel_remote(job_id)
+    analysis.status = "cancelled"
+    analysis.error = "Cancelled before it started"
+    analysis.completed_at = datetime.utcnow()
+    await db.commit()
+    await publish_event(job_id, "cancelled")
+    return JobResponse(job_id=job_id, status="cancelled", error=analysis.error)
+
+
+def _job_state_event(analysis: Analysis) -> Dict[str, Any]:
+    """Synthesize an event from the DB row for jobs whose event history is gone"""
+    data = {"geo_score": analysis.geo_score} if analysis.status == "completed" else {"error": analysis.error}
+    return {"job_id": analysis.job_id, "seq": 0, "stage": analysis.status, "ts": None, "data": data}
+
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _parse_event_id(value: Optional[str]) -> int:
+    """Last-Event-ID as a sequence number; anything unparsable replays from the start."""
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return 0
+
+
+@router.get("/job/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Stream job progress as Server-Sent Events until the job completes or fails"""
+    analysis = await _get_analysis(db, job_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    # Create results directory if it doesn't exist
-    results_dir = Path(f"app/static/results/{job_id}")
-    results_dir.mkdir(parents=True, exist_ok=True)
+    broker = get_broker()
+    since = _parse_event_id(request.headers.get("last-event-id"))
+    history = await broker.history(job_id)
+    # A client reconnecting after the terminal event (EventSource does so on its own)
+    # has seen the whole stream; 204 tells it to stop reconnecting
+    if any(is_terminal(event) and event["seq"] <= since for event in history):
+        return Response(status_code=204)
+    # Finished jobs whose history has expired get a single terminal event (id 0), once:
+    # a client reconnecting with any Last-Event-ID has already been sent it
+    finished_without_history = analysis.status in TERMINAL_STAGES and not history
+    if finished_without_history and request.headers.get("last-event-id") is not None:
+        return Response(status_code=204)
+    terminal_event = _job_state_event(analysis) if finished_without_history else None
+    # Don't hold a pooled connection for the lifetime of the stream
+    await db.close()
     
-    # Save mock result to file
-    result_path = results_dir / "result.json"
-    with open(result_path, "w") as f:
-        json.dump(mock_result, f)
+    async def event_stream():
+        if terminal_event:
+            yield _format_sse(terminal_event)
+            return
+        
+        # Pump the subscription into a queue so keep-alive timeouts never cancel it
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def pump():
+            async for event in broker.subscribe(job_id, since):
+                await queue.put(event)
+            await queue.put(None)
+        
+        pump_task = asyncio.create_task(pump())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield _format_sse(event)
+        finally:
+            pump_task.cancel()
     
-    return JobResponse(
-        job_id=job_id,
-        status="completed",
-        result=mock_result
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
+@router.get("/job/{job_id}/wait")
+async def wait_job_events(job_id: str, since: int = 0, timeout: float = 25.0,
+                          db: AsyncSession = Depends(get_async_db)):
+    """Long-poll variant: return events after `since`, waiting up to `timeout` seconds for new ones"""
+    analysis = await _get_analysis(db, job_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    broker = get_broker()
+    finished_without_history = analysis.status in TERMINAL_STAGES and not await broker.history(job_id)
+    terminal_event = _job_state_event(analysis) if finished_without_history else None
+    await db.close()
+    
+    if terminal_event:
+        events = [terminal_event] if since == 0 else []
+    else:
+        events = await wait_for_events(job_id, since, min(max(timeout, 0.0), LONG_POLL_MAX_SECONDS))
+    
+    last_seq = events[-1]["seq"] if events else since
+    return {"job_id": job_id, "events": events, "last_seq": last_seq}
+
+
+@router.get("/queue")
+async def queue_stats():
+    """Queue depth, running jobs, rejection counts and estimated wait per priority class"""
+    return {
+        **scheduler.stats(),
+        "single_flight": single_flight.stats(),
+        "db_writer": db_writer.stats(),
+        "result_cache": result_cache.stats()
+    }
+
+
+@router.get("/workers")
+async def worker_stats():
+    """Live analysis workers with their capacity and load, the shared work queue, and this process's CPU pool"""
+    queue = get_lease_queue()
+    return {
+        "distributed": DISTRIBUTED,
+        "workers": await queue.workers(),
+        "queue": await queue.stats(),
+        "cpu_pool": cpu_pool.stats()
+    }
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Analysis cache hit rate and bytes saved since startup, artifact store usage and retention"""
+    return {
+        **get_cache_stats(),
+        "artifacts": await asyncio.to_thread(artifact_store.stats),
+        "retention": await asyncio.to_thread(retention.stats)
+    }
+
+
 # Helper functions for processing analysis jobs
 
 
-@router.get("/list", response_model=Dict[str, List[Dict[str, Any]]])
-async def list_jobs(db: Session = Depends(get_db)):
-    """List all analysis jobs"""
-    # Get all jobs from database
-    analyses = db.query(Analysis).order_by(Analysis.created_at.desc()).limit(10).all()
+@router.get("/list")
+async def list_jobs(limit: Optional[int] = None, cursor: Optional[str] = None, status: Optional[str] = None,
+                    url: Optional[str] = None, batch_id: Optional[str] = None, fields: Optional[str] = None,
+                    db: AsyncSession = Depends(get_async_db)):
+    """
+    List analysis jobs newest first, one keyset page at a time. Filter by
+    status (comma-separated), exact url or batch_id; pass next_cursor back as
+    `cursor` for the following page. `fields` picks the columns returned;
+    "result" additionally loads each completed job's full result.json.
+    """
+    try:
+        projection = parse_fields(fields)
+        page_size = clamp_limit(limit)
+        query = list_query(projection, page_size, cursor, status, url, batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Convert to response format
-    jobs = []
-    for analysis in analyses:
-        job_data = {
-            "job_id": analysis.job_id,
-            "status": analysis.status,
-            "url": analysis.url,
-            "created_at": analysis.created_at
-        }
-        
-        # Check if result file exists
-        result_path = Path(f"app/static/results/{analysis.job_id}/result.json")
-        if analysis.status == "completed" and result_path.exists():
-            with open(result_path, "r") as f:
-                result = json.load(f)
-            job_data["result"] = result
-        
-        jobs.append(job_data)
+    analyses = (await db.scalars(query)).all()
+    page = analyses[:page_size]
+    next_cursor = encode_cursor(page[-1]) if len(analyses) > page_size else None
     
-    return {"jobs": jobs}
+    if FULL_RESULT_FIELD in projection:
+        jobs = await asyncio.to_thread(lambda: [serialize_row(a, projection) for a in page])
+    else:
+        jobs = [serialize_row(a, projection) for a in page]
+    return {"jobs": jobs, "next_cursor": next_cursor}
 
 
 async def take_screenshot_and_run_axe(url: str, screenshot_path: str, results_dir: Path):
@@ -257,7 +663,7 @@ async def generate_saliency(screenshot_path: str, results_dir: Path):
         overlay_path = str(results_dir / "saliency.png")
         salmap_path = str(results_dir / "salmap.png")
         
-        generate_overlay_from_file(screenshot_path, overlay_path, salmap_path)
+        saliency_analyzer.generate_overlay_from_file(screenshot_path, overlay_path, salmap_path)
         
         # Basic heuristic for CTA saliency (center area)
         from PIL import Image
@@ -302,7 +708,7 @@ async def compute_readability(url: str, results_dir: Path):
             text = "No text extracted from the page."
         
         # Compute readability
-        readability = flesch_kincaid_readability(text)
+        readability = readability_analyzer.flesch_kincaid_readability(text)
         
         # Save readability results
         readability_path = results_dir / "readability.json"
@@ -324,29 +730,7 @@ async def compute_contrast(url: str, results_dir: Path):
             styles = []
         
         # Compute contrast for each style
-        contrast_issues = []
-        for style in styles:
-            try:
-                fg = style.get("fg")
-                bg = style.get("bg")
-                if fg and bg and fg != "rgba(0, 0, 0, 0)" and bg != "rgba(0, 0, 0, 0)":
-                    # Convert rgba to hex
-                    fg_hex = rgba_to_hex(fg)
-                    bg_hex = rgba_to_hex(bg)
-                    
-                    ratio = contrast_ratio(fg_hex, bg_hex)
-                    wcag = wcag_pass_level(ratio)
-                    
-                    if wcag["normal_text"] == "fail":
-                        contrast_issues.append({
-                            "selector": style.get("selector"),
-                            "text": style.get("text"),
-                            "foreground": fg_hex,
-                            "background": bg_hex,
-                            "ratio": ratio
-                        })
-            except Exception as e:
-                print(f"Error computing contrast for style {style}: {e}")
+        contrast_issues = contrast_analyzer.find_contrast_issues(styles)
         
         # Save contrast results
         contrast_path = results_dir / "contrast.json"
@@ -363,19 +747,19 @@ async def test_prompts_and_extract_citations(url: str, prompts: List[str], resul
     try:
         domain = url.split("//")[-1].split("/")[0]
         
+        # Test prompts
+        responses = [await prompt_tester.test_prompts(prompt) for prompt in prompts]
+        
+        # Extract citations from all responses with one compiled matcher
+        citations = citation_extractor.extract_citations_batch(responses, [domain])
+        
         prompt_results = []
-        for prompt in prompts:
-            # Test prompt
-            response = await test_prompts(prompt)
-            
-            # Extract citations
-            citations = extract_citations(response, domain)
-            
+        for prompt, response, scan in zip(prompts, responses, citations["responses"]):
             prompt_results.append({
                 "prompt": prompt,
                 "response": response,
-                "citation_count": citations["count"],
-                "citations": citations["mentions"]
+                "citation_count": scan["count"],
+                "citations": [{"text": m["text"], "context": m["context"]} for m in scan["mentions"]]
             })
         
         # Save prompt results
@@ -388,27 +772,6 @@ async def test_prompts_and_extract_citations(url: str, prompts: List[str], resul
         return []
 
 
-def rgba_to_hex(rgba):
-    """Convert rgba string to hex color"""
-    try:
-        # Parse rgba string
-        rgba = rgba.strip().lower()
-        if rgba.startswith("rgba"):
-            rgba = rgba.replace("rgba(", "").replace(")", "")
-            r, g, b, a = [float(x.strip()) for x in rgba.split(",")]
-            r, g, b = int(r), int(g), int(b)
-        elif rgba.startswith("rgb"):
-            rgba = rgba.replace("rgb(", "").replace(")", "")
-            r, g, b = [int(x.strip()) for x in rgba.split(",")]
-        else:
-            # Assume it's already hex
-            return rgba
-        
-        return f"#{r:02x}{g:02x}{b:02x}"
-    except Exception:
-        return "#000000"  # Default to black on error
-
-
 def calculate_geo_score(saliency, readability, contrast, axe):
     """Calculate overall GEO score based on various metrics"""
     try:
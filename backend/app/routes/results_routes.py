@@ -0,0 +1,163 @@
+import asyncio
+import os
+from typing import Iterable, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.artifact_store import RESULTS_DIR, artifact_store, stored_encodings
+from app.database import Artifact
+from app.retention import retention, REGENERABLE
+from app.result_cache import etag_matches
+
+# Serves /static/results/{job_id}/{name} and /api/artifacts/{digest}: registered ahead of the /static mount
+router = APIRouter()
+
+# Content-addressed URLs never change; job file URLs revalidate with their ETag
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+JOB_FILE_CACHE_CONTROL = "public, no-cache"
+
+# Content-Encoding preference when a client accepts several stored encodings
+ENCODING_PREFERENCE = ("br", "zstd", "gzip")
+
+# One regeneration at a time: it's rare, CPU-heavy, and concurrent requests want the same files
+_regenerate_lock = asyncio.Lock()
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[Optional[str]]) -> Optional[str]:
+    """Best stored encoding the client accepts (q > 0), or None for the original bytes."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    for encoding in ENCODING_PREFERENCE:
+        if encoding in available and encoding in accepted:
+            return encoding
+    return None
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single "bytes=" range. None when the header
+    isn't one we honour (multiple ranges, other units): the whole body is
+    sent. ValueError when the range can't be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError("Malformed range")
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read_slice(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+async def serve_artifact(request: Request, row: Artifact, cache_control: str) -> Response:
+    """
+    Send a stored artifact: pre-compressed bytes when the client accepts
+    their encoding, a strong per-representation ETag with 304s, and single
+    byte ranges (If-Range aware) for large files.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), stored_encodings(row))
+    etag = f'"{row.digest}-{encoding}"' if encoding else f'"{row.digest}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if row.encoding or row.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = row.media_type or "application/octet-stream"
+    # Representations stored as-is can be sent straight from disk; others are decoded in memory
+    path = artifact_store.local_path(row, encoding) if encoding or row.encoding is None else None
+    data = None
+    if path:
+        size = os.path.getsize(path)
+    else:
+        try:
+            data = await asyncio.to_thread(artifact_store.get_encoded, row, encoding)
+        except KeyError:
+            if row.pending:
+                # Its blobs are still being written: not gone, just not there yet
+                raise HTTPException(status_code=503, detail="Artifact is being stored", headers={"Retry-After": "1"})
+            raise HTTPException(status_code=404, detail="Not found")
+        size = len(data)
+    artifact_store.touch(row.digest)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        if path:
+            return FileResponse(path, media_type=media_type, headers=headers)
+        return Response(data, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    body = await asyncio.to_thread(_read_slice, path, start, end) if path else data[start:end + 1]
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(body, status_code=206, media_type=media_type, headers=headers)
+
+
+@router.get("/api/artifacts/{digest}")
+async def get_artifact(digest: str, request: Request):
+    """A stored artifact by content hash; cacheable forever"""
+    row = await asyncio.to_thread(artifact_store.info, digest)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return await serve_artifact(request, row, IMMUTABLE_CACHE_CONTROL)
+
+
+async def _job_file_digest(job_id: str, name: str) -> Optional[str]:
+    return (await asyncio.to_thread(artifact_store.manifest, job_id)).get(name)
+
+
+@router.get("/static/results/{job_id}/{name}")
+async def get_result_file(job_id: str, name: str, request: Request):
+    """A job's file from its working directory while it runs, then from the artifact store"""
+    if job_id.startswith(".") or name.startswith("."):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(RESULTS_DIR, job_id, name)
+    if os.path.isfile(path):
+        return FileResponse(path)
+
+    digest = await _job_file_digest(job_id, name)
+    if digest is None and name in REGENERABLE:
+        # Evicted by retention: rebuild from the screenshot if that is still stored
+        async with _regenerate_lock:
+            digest = await _job_file_digest(job_id, name)
+            if digest is None and await asyncio.to_thread(retention.regenerate_saliency, job_id):
+                digest = await _job_file_digest(job_id, name)
+    row = await asyncio.to_thread(artifact_store.info, digest) if digest else None
+    if row is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return await serve_artifact(request, row, JOB_FILE_CACHE_CONTROL)
@@ -0,0 +1,458 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Priority classes: lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Jobs running at once in this process
+WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+# Worker slots bulk jobs may never take, so interactive jobs start without waiting
+RESERVED_INTERACTIVE = int(os.getenv("SCHEDULER_RESERVED_INTERACTIVE", "1"))
+# Concurrent jobs against one origin
+HOST_MAX_CONCURRENCY = int(os.getenv("HOST_MAX_CONCURRENCY", "2"))
+# Token bucket per origin: sustained job starts per second and burst size
+HOST_RATE = float(os.getenv("HOST_RATE_PER_SECOND", "0.5"))
+HOST_BURST = int(os.getenv("HOST_BURST", "3"))
+
+# Admission control: queued jobs per class beyond which new work is refused (503)
+INTERACTIVE_HIGH_WATER = int(os.getenv("QUEUE_HIGH_WATER", "100"))
+BULK_HIGH_WATER = int(os.getenv("BULK_QUEUE_HIGH_WATER", "10000"))
+# Queued interactive jobs one customer may have before getting 429
+CUSTOMER_MAX_QUEUED = int(os.getenv("CUSTOMER_MAX_QUEUED", "20"))
+# Hard ceiling on one job's run time, enforced by cancelling its task so a
+# stuck job can never hold a worker slot (jobs enforce their own, shorter deadline)
+JOB_HARD_TIMEOUT = float(os.getenv("SCHEDULER_JOB_TIMEOUT", "360"))
+# Starting guess for job duration (seconds) until real jobs have been timed
+INITIAL_JOB_SECONDS = float(os.getenv("SCHEDULER_INITIAL_JOB_SECONDS", "30"))
+# On shutdown, seconds running jobs get to finish before they are interrupted and left for recovery
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "60"))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1.0
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1.0
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available."""
+        self._refill()
+        if self.tokens >= 1.0 or self.rate <= 0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class ScheduledJob:
+    __slots__ = ("job_id", "url", "host", "run", "priority", "customer", "group", "group_limit",
+                 "future", "task", "submitted_at", "started_at")
+
+    def __init__(self, job_id: str, url: str, run: Callable[[], Awaitable[Any]], priority: int,
+                 customer: str, group: Optional[str], group_limit: Optional[int]):
+        self.job_id = job_id
+        self.url = url
+        self.host = (urlsplit(url if "//" in url else f"http://{url}").hostname or "").lower()
+        self.run = run
+        self.priority = priority
+        self.customer = customer
+        self.group = group
+        self.group_limit = group_limit
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+class Reservation:
+    """
+    Queue room held for jobs admitted now but queued later (batches, crawls),
+    so concurrent admissions can't all pass the same high-water check.
+    """
+
+    def __init__(self, scheduler: "JobScheduler", priority: int, count: int):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.remaining = count
+        scheduler._reserved[priority] = scheduler._reserved.get(priority, 0) + count
+
+    def consume(self, count: int = 1):
+        """Hand back room for jobs now in the queue (or no longer coming)."""
+        count = min(count, self.remaining)
+        self.remaining -= count
+        self.scheduler._reserved[self.priority] -= count
+
+    def release(self):
+        self.consume(self.remaining)
+
+
+class _FairQueue:
+    """Per-customer FIFO queues served round-robin, so one customer can't starve the rest."""
+
+    def __init__(self):
+        self.by_customer: Dict[str, Deque[ScheduledJob]] = {}
+        self.order: Deque[str] = deque()
+
+    def push(self, job: ScheduledJob):
+        if job.customer not in self.by_customer:
+            self.by_customer[job.customer] = deque()
+            self.order.append(job.customer)
+        self.by_customer[job.customer].append(job)
+
+    def pop_first(self, eligible: Callable[[ScheduledJob], bool]) -> Optional[ScheduledJob]:
+        """Pop the head job of the next customer (round-robin) whose head is eligible."""
+        for _ in range(len(self.order)):
+            customer = self.order[0]
+            self.order.rotate(-1)
+            jobs = self.by_customer[customer]
+            if eligible(jobs[0]):
+                job = jobs.popleft()
+                if not jobs:
+                    del self.by_customer[customer]
+                    self.order.remove(customer)
+                return job
+        return None
+
+    def remove(self, job_id: str) -> Optional[ScheduledJob]:
+        for customer, jobs in self.by_customer.items():
+            for job in jobs:
+                if job.job_id == job_id:
+                    jobs.remove(job)
+                    if not jobs:
+                        del self.by_customer[customer]
+                        self.order.remove(customer)
+                    return job
+        return None
+
+    def heads(self) -> List[ScheduledJob]:
+        return [jobs[0] for jobs in self.by_customer.values()]
+
+    def customer_depth(self, customer: str) -> int:
+        return len(self.by_customer.get(customer, ()))
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self.by_customer.values())
+
+
+class JobScheduler:
+    """
+    In-process scheduler in front of process_analysis_job: priority classes,
+    fair queuing between customers within a class, and per-host concurrency
+    caps plus token buckets so no origin gets hammered by concurrent browsers.
+    A job's `run` returns its outcome, and "failed" or "cancelled" is counted
+    as such. All of this state is per process: with WEB_CONCURRENCY=N each
+    origin can get up to N times HOST_MAX_CONCURRENCY and HOST_RATE_PER_SECOND.
+    """
+
+    def __init__(self, workers: int = WORKERS, reserved_interactive: int = RESERVED_INTERACTIVE,
+                 host_max_concurrency: int = HOST_MAX_CONCURRENCY, host_rate: float = HOST_RATE,
+                 host_burst: int = HOST_BURST, interactive_high_water: int = INTERACTIVE_HIGH_WATER,
+                 bulk_high_water: int = BULK_HIGH_WATER, customer_max_queued: int = CUSTOMER_MAX_QUEUED,
+                 job_timeout: float = JOB_HARD_TIMEOUT):
+        self.workers = workers
+        self.reserved_interactive = min(reserved_interactive, max(workers - 1, 0))
+        self.host_max_concurrency = host_max_concurrency
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.high_water = {PRIORITY_INTERACTIVE: interactive_high_water, PRIORITY_BULK: bulk_high_water}
+        self.customer_max_queued = customer_max_queued
+        self.job_timeout = job_timeout
+
+        self._queues: Dict[int, _FairQueue] = {}
+        # Admitted jobs not queued yet, per priority (see Reservation)
+        self._reserved: Dict[int, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._host_running: Dict[str, int] = {}
+        self._group_running: Dict[str, int] = {}
+        self._running: Dict[str, ScheduledJob] = {}
+        self._tasks = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Set by drain(): no job starts again in this process
+        self.draining = False
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.rejections: Dict[str, int] = {}
+        # Exponentially weighted average of job run time
+        self.avg_job_seconds = INITIAL_JOB_SECONDS
+
+    # -- public API --------------------------------------------------------
+
+    def start(self):
+        if self.draining:
+            return
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_SECONDS) -> int:
+        """
+        Graceful shutdown: start no more jobs, give running ones `timeout`
+        seconds to finish, then interrupt the rest. Interrupted and queued
+        jobs stay pending in the database, so the next process resumes them
+        from their checkpoints. Returns the number of jobs interrupted.
+        """
+        self.draining = True
+        await self.stop()
+        tasks = [job.task for job in self._running.values() if job.task is not None]
+        if not tasks:
+            return 0
+        print(f"Draining {len(tasks)} running jobs (up to {timeout:.0f}s)")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            print(f"Interrupted {len(pending)} jobs at shutdown; they resume on the next start")
+        return len(pending)
+
+    def submit(self, job_id: str, url: str, run: Callable[[], Awaitable[Any]],
+               priority: int = PRIORITY_INTERACTIVE, customer: str = "anonymous",
+               group: Optional[str] = None, group_limit: Optional[int] = None) -> asyncio.Future:
+        """Queue a job; the returned future resolves when the job has run."""
+        self.start()
+        job = ScheduledJob(job_id, url, run, priority, customer or "anonymous", group, group_limit)
+        self._queues.setdefault(priority, _FairQueue()).push(job)
+        self._wakeup.set()
+        return job.future
+
+    def resize(self, workers: int):
+        """Change the number of worker slots (in distributed mode: the cluster's live capacity)."""
+        if workers != self.workers:
+            self.workers = workers
+            self.reserved_interactive = min(RESERVED_INTERACTIVE, max(workers - 1, 0))
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job: a queued job is dropped before it starts ("queued"), a
+        running job has its task cancelled, which unwinds through the pipeline
+        and releases its browser context and HTTP calls ("running").
+        Returns None for jobs the scheduler doesn't know.
+        """
+        for queue in self._queues.values():
+            job = queue.remove(job_id)
+            if job is not None:
+                self.cancelled += 1
+                job.future.cancel()
+                self._wakeup.set()
+                return "queued"
+        job = self._running.get(job_id)
+        if job is not None and job.task is not None:
+            job.task.cancel()
+            return "running"
+        return None
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def queue_depth(self, priority: int) -> int:
+        queue = self._queues.get(priority)
+        return len(queue) if queue else 0
+
+    def _capacity(self, priority: int) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.workers
+        return max(self.workers - self.reserved_interactive, 1)
+
+    def estimate_wait(self, priority: int, count: int = 1) -> float:
+        """
+        Seconds until the last of `count` newly queued jobs would start: jobs
+        ahead of it (same or higher priority) drained by the class's worker
+        capacity at the average job duration.
+        """
+        ahead = sum(self.queue_depth(p) for p in self._queues if p <= priority) + count - 1
+        capacity = self._capacity(priority)
+        free = max(capacity - self.running, 0)
+        if ahead < free:
+            return 0.0
+        rounds = (ahead - free) // capacity + 1
+        return rounds * self.avg_job_seconds
+
+    def check_admission(self, priority: int, customer: Optional[str] = None, count: int = 1) -> Optional[Dict[str, Any]]:
+        """
+        Decide whether `count` new jobs may be queued. Returns None when
+        admitted, otherwise {status_code, reason, retry_after} with 429 for a
+        customer over its own queue share and 503 when the class is over its
+        high-water mark. retry_after is the time for the queue to drain enough.
+        """
+        customer = customer or "anonymous"
+        queue = self._queues.get(priority)
+        rejection = None
+
+        if priority == PRIORITY_INTERACTIVE and queue and \
+                queue.customer_depth(customer) + count > self.customer_max_queued:
+            excess = queue.customer_depth(customer) + count - self.customer_max_queued
+            rejection = {"status_code": 429, "reason": "customer_queue_full", "excess": excess}
+        else:
+            high_water = self.high_water.get(priority, self.high_water[PRIORITY_BULK])
+            excess = self.queue_depth(priority) + self._reserved.get(priority, 0) + count - high_water
+            if excess > 0:
+                rejection = {"status_code": 503, "reason": "queue_full", "excess": excess}
+
+        if rejection is None:
+            return None
+        # Jobs drain at roughly capacity / avg_job_seconds per second
+        drain_rate = self._capacity(priority) / max(self.avg_job_seconds, 0.001)
+        rejection["retry_after"] = max(1, math.ceil(rejection.pop("excess") / drain_rate))
+        self.rejections[rejection["reason"]] = self.rejections.get(rejection["reason"], 0) + 1
+        return rejection
+
+    def reserve(self, priority: int, count: int) -> Reservation:
+        """Hold queue room for `count` admitted jobs; call right after check_admission(), with no await between."""
+        return Reservation(self, priority, count)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "draining": self.draining,
+            "reserved_interactive": self.reserved_interactive,
+            "running": self.running,
+            "queued": {PRIORITY_NAMES.get(p, str(p)): len(q) for p, q in sorted(self._queues.items())},
+            "reserved": {PRIORITY_NAMES.get(p, str(p)): n for p, n in sorted(self._reserved.items()) if n},
+            "high_water": {PRIORITY_NAMES[p]: n for p, n in self.high_water.items()},
+            "hosts_running": {host: n for host, n in self._host_running.items() if n},
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "rejections": dict(self.rejections),
+            "avg_job_seconds": round(self.avg_job_seconds, 2),
+            "estimated_wait_seconds": {
+                PRIORITY_NAMES[p]: round(self.estimate_wait(p), 1) for p in (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+            }
+        }
+
+    # -- dispatching -------------------------------------------------------
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+        return bucket
+
+    def _eligible(self, job: ScheduledJob) -> bool:
+        if job.priority != PRIORITY_INTERACTIVE and self.running >= self.workers - self.reserved_interactive:
+            return False
+        if self._host_running.get(job.host, 0) >= self.host_max_concurrency:
+            return False
+        if job.group and job.group_limit and self._group_running.get(job.group, 0) >= job.group_limit:
+            return False
+        return self._bucket(job.host).available()
+
+    def _next_job(self) -> Optional[ScheduledJob]:
+        for priority in sorted(self._queues):
+            job = self._queues[priority].pop_first(self._eligible)
+            if job is not None:
+                return job
+        return None
+
+    def _retry_after(self) -> Optional[float]:
+        """Shortest wait until a token-starved head job could start, or None to wait for an event."""
+        waits = [self._bucket(job.host).wait_time()
+                 for queue in self._queues.values() for job in queue.heads()]
+        waits = [w for w in waits if w > 0]
+        return min(waits) if waits else None
+
+    def _start(self, job: ScheduledJob):
+        self._bucket(job.host).take()
+        self._host_running[job.host] = self._host_running.get(job.host, 0) + 1
+        if job.group:
+            self._group_running[job.group] = self._group_running.get(job.group, 0) + 1
+        self._running[job.job_id] = job
+        job.started_at = time.monotonic()
+        task = job.task = asyncio.create_task(self._run(job))
+        # Keep a reference so the task isn't garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: ScheduledJob):
+        try:
+            result = await asyncio.wait_for(job.run(), self.job_timeout)
+            # Jobs record their own failures and return the outcome
+            if result == "failed":
+                self.failed += 1
+            elif result == "cancelled":
+                self.cancelled += 1
+            else:
+                self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            job.future.cancel()
+        except asyncio.TimeoutError:
+            # wait_for cancelled the job; it recorded its own partial outcome
+            self.timed_out += 1
+            print(f"Job {job.job_id} exceeded {self.job_timeout:.0f}s and was cancelled")
+            if not job.future.done():
+                job.future.set_result(None)
+        except Exception as e:
+            self.failed += 1
+            print(f"Error running job {job.job_id}: {e}")
+            if not job.future.done():
+                job.future.set_result(None)
+        finally:
+            self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * (time.monotonic() - job.started_at)
+            self._running.pop(job.job_id, None)
+            self._host_running[job.host] -= 1
+            if not self._host_running[job.host]:
+                del self._host_running[job.host]
+            if job.group:
+                self._group_running[job.group] -= 1
+                if not self._group_running[job.group]:
+                    del self._group_running[job.group]
+            self._wakeup.set()
+
+    async def _dispatch_loop(self):
+        while True:
+            job = self._next_job() if self.running < self.workers else None
+            if job is not None:
+                self._start(job)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._retry_after())
+            except asyncio.TimeoutError:
+                pass
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import IdempotencyKey
+from app.analysis_cache import normalize_url
+
+# Seconds an Idempotency-Key keeps pointing at the job it created
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+
+def request_hash(url: str, options: Dict[str, Any]) -> str:
+    """Identity of an analyze request: normalized URL plus the options that change its result."""
+    payload = json.dumps({"url": normalize_url(url), "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def scoped_key(idempotency_key: str, customer: Optional[str]) -> str:
+    """Idempotency keys are only unique per client, so namespace them by customer."""
+    return f"{customer or 'anonymous'}:{idempotency_key}"
+
+
+async def find_idempotency_key(db: AsyncSession, key: str, ttl: int = IDEMPOTENCY_TTL) -> Optional[IdempotencyKey]:
+    """The record of an earlier request with this (scoped) key; expired records are dropped."""
+    record = await db.scalar(select(IdempotencyKey).where(IdempotencyKey.key == key))
+    if record and record.created_at < datetime.utcnow() - timedelta(seconds=ttl):
+        await db.delete(record)
+        await db.commit()
+        return None
+    return record
+
+
+async def remember_idempotency_key(db: AsyncSession, key: str, job_id: str, req_hash: str) -> IdempotencyKey:
+    """
+    Record the job a key is answered with, committed together with whatever
+    else the session holds. When a concurrent request with the same key (in
+    this process or another worker) recorded it first, the session is rolled
+    back and that request's record is returned instead.
+    """
+    record = IdempotencyKey(key=key, job_id=job_id, request_hash=req_hash)
+    db.add(record)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        record = await db.scalar(select(IdempotencyKey).where(IdempotencyKey.key == key))
+    return record
+
+
+class SingleFlight:
+    """
+    In-flight analyze requests by request hash. While a leader job for a given
+    URL+options is queued or running, identical submissions are handed the
+    leader's job id instead of starting another pipeline run.
+    """
+
+    def __init__(self):
+        self._leaders: Dict[str, str] = {}
+        self.coalesced = 0
+
+    def leader(self, key: str) -> Optional[str]:
+        return self._leaders.get(key)
+
+    def lead(self, key: str, job_id: str):
+        self._leaders[key] = job_id
+
+    def land(self, key: str, job_id: str):
+        """Forget the leader once its job finished, so later submissions run afresh."""
+        if self._leaders.get(key) == job_id:
+            del self._leaders[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._leaders), "coalesced": self.coalesced}
+
+
+single_flight = SingleFlight()
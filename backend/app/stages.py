@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Iterable, Optional, Set, Tuple, Union
+
+from app.database import Analysis, StageRecord, session_scope
+from app.db_writer import db_writer
+from app.artifact_store import artifact_exists, copy_artifact, read_artifact
+from app.ai_analysis.shared_frames import open_frame
+from app.metrics import STAGE_FALLBACKS, STAGE_REUSED
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()
+
+
+def hash_json(value: Any) -> str:
+    return hash_text(json.dumps(value, sort_keys=True))
+
+
+def hash_image_pixels(path: str) -> str:
+    """Hash decoded pixels, so re-encoded but visually identical screenshots match."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        digest = hashlib.sha256(f"{img.width}x{img.height}".encode("ascii"))
+        digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def hash_frame_pixels(frame) -> str:
+    """hash_image_pixels() of a screenshot already decoded into shared memory (RGB)."""
+    with open_frame(frame) as rgb:
+        height, width = rgb.shape[:2]
+        digest = hashlib.sha256(f"{width}x{height}".encode("ascii"))
+        digest.update(rgb)
+    return digest.hexdigest()
+
+
+class Fallback:
+    """Stand-in output of a stage that failed: used by this job, never recorded for reuse or as a checkpoint."""
+
+    def __init__(self, output: Any):
+        self.output = output
+
+
+class StageRunner:
+    """
+    Runs the pipeline stages of one job, recording each stage's input hash and
+    output location. A stage whose input hash matches a previous run of the
+    same URL reuses that run's stored output instead of recomputing.
+    The record doubles as the job's checkpoint: a job resumed after a crash
+    picks up its own finished stages, even with force=True.
+    """
+
+    def __init__(self, analysis: Analysis, output_dir: str, force: bool = False):
+        self.analysis = analysis
+        self.output_dir = output_dir
+        self.force = force
+        # Stages that returned a Fallback in this run
+        self.fallbacks: Set[str] = set()
+
+    def _previous(self, stage: str, input_hash: str, artifacts: Iterable[str] = (),
+                  max_age: Optional[float] = None) -> Optional[StageRecord]:
+        with session_scope() as db:
+            query = db.query(StageRecord).filter(
+                StageRecord.url_key == self.analysis.url_key,
+                StageRecord.stage == stage,
+                StageRecord.input_hash == input_hash,
+                StageRecord.job_id != self.analysis.job_id
+            )
+            if max_age is not None:
+                query = query.filter(StageRecord.created_at >= datetime.utcnow() - timedelta(seconds=max_age))
+            records = query.order_by(StageRecord.created_at.desc()).limit(5).all()
+        # Older runs may have had their results (or just their heavy artifacts) removed
+        for record in records:
+            if not record.output_path:
+                continue
+            source_dir = os.path.dirname(record.output_path)
+            paths = [record.output_path] + [os.path.join(source_dir, name) for name in artifacts]
+            if all(artifact_exists(path) for path in paths):
+                return record
+        return None
+
+    def _checkpoint(self, stage: str, input_hash: str) -> Optional[StageRecord]:
+        """This job's own output for the stage, from before an interruption."""
+        with session_scope() as db:
+            record = db.query(StageRecord).filter(
+                StageRecord.job_id == self.analysis.job_id,
+                StageRecord.stage == stage,
+                StageRecord.input_hash == input_hash
+            ).order_by(StageRecord.created_at.desc()).first()
+        if record and record.output_path and artifact_exists(record.output_path):
+            return record
+        return None
+
+    def _load_previous(self, previous: StageRecord, artifacts: Iterable[str]) -> str:
+        """Copy a previous run's artifacts into this job; returns its output, pointed at this job."""
+        source_dir = os.path.dirname(previous.output_path)
+        for name in artifacts:
+            copy_artifact(os.path.join(source_dir, name), os.path.join(self.output_dir, name))
+        # Stored outputs embed their job's paths; point them at this job
+        return read_artifact(previous.output_path).decode("utf-8").replace(previous.job_id, self.analysis.job_id)
+
+    async def run(self, stage: str, input_hash: str,
+                  compute: Callable[[], Union[Any, Awaitable[Any]]],
+                  artifacts: Iterable[str] = (), max_age: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Return (output, reused). `compute` produces the stage's JSON-serializable
+        output; `artifacts` names extra files in the job directory that belong
+        to the output and are carried over on reuse. With `max_age` (seconds),
+        only runs of other jobs that recent are reused (0: never; the job's own
+        checkpoint still is). A `Fallback` from `compute` is returned unrecorded.
+        """
+        output_path = os.path.join(self.output_dir, f"{stage}.json")
+        # Lookups and reads hit the database and the artifact store (possibly S3): keep them off the event loop
+        checkpoint = await asyncio.to_thread(self._checkpoint, stage, input_hash)
+        if checkpoint:
+            output = json.loads(await asyncio.to_thread(read_artifact, checkpoint.output_path))
+            self.analysis.checkpoint = stage
+            db_writer.update_job(self.analysis.job_id, checkpoint=stage)
+            STAGE_REUSED.inc(stage=stage, source="checkpoint")
+            return output, True
+
+        previous = None
+        if not self.force and max_age != 0:
+            previous = await asyncio.to_thread(self._previous, stage, input_hash, artifacts, max_age)
+
+        if previous:
+            output_text = await asyncio.to_thread(self._load_previous, previous, artifacts)
+            output = json.loads(output_text)
+            STAGE_REUSED.inc(stage=stage, source="previous_run")
+        else:
+            output = compute()
+            if inspect.isawaitable(output):
+                output = await output
+            if isinstance(output, Fallback):
+                STAGE_FALLBACKS.inc(stage=stage)
+                self.fallbacks.add(stage)
+                return output.output, False
+            output_text = json.dumps(output)
+
+        with open(output_path, "w") as f:
+            f.write(output_text)
+
+        record = StageRecord(
+            job_id=self.analysis.job_id,
+            url_key=self.analysis.url_key,
+            stage=stage,
+            input_hash=input_hash,
+            output_path=output_path,
+            reused_from=previous.job_id if previous else None
+        )
+        # Record and checkpoint are committed with the next batch of job bookkeeping
+        db_writer.submit(lambda db: db.add(record))
+        self.analysis.checkpoint = stage
+        db_writer.update_job(self.analysis.job_id, checkpoint=stage)
+        return output, previous is not None
+
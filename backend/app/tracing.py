@@ -0,0 +1,398 @@
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fraction of analysis jobs traced; 0 turns tracing off. Requests carrying a
+# sampled W3C traceparent header are always traced
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Span files, one per process, rotated by size
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join("app", "traces"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(20 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+# Span files of processes that stopped writing are deleted after this many hours
+TRACE_RETENTION_HOURS = float(os.getenv("TRACE_RETENTION_HOURS", "72"))
+# Set to false to send spans only to the collector
+TRACE_JSONL = os.getenv("TRACE_JSONL", "true").lower() == "true"
+# OTLP/HTTP (JSON) endpoint of a local collector, e.g. http://localhost:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "vispectra")
+# Seconds finished spans wait so the exporter writes them in batches
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "1"))
+# Recent traces kept in memory, so /api/job/{id}/trace seldom reads the files
+TRACE_MEMORY_TRACES = int(os.getenv("TRACE_MEMORY_TRACES", "500"))
+
+_MAX_BATCH = 512
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    """One timed operation of a trace. Times are epoch seconds."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, start: Optional[float] = None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None, end: Optional[float] = None):
+        """End the span (once) and hand it to the exporter."""
+        if self.end is not None:
+            return
+        if error is not None:
+            # CancelledError is a BaseException; a cancelled stage isn't a failed one
+            self.status = "error" if isinstance(error, Exception) else "cancelled"
+            self.error = f"{type(error).__name__}: {error}"
+        self.end = time.time() if end is None else end
+        exporter.export(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+            "pid": os.getpid(),
+        }
+
+
+# The span the running task is inside of; None (the default) means untraced
+_current: ContextVar[Optional[Span]] = ContextVar("vispectra_current_span", default=None)
+
+# Shared by every untraced with-block: entering it costs one context variable lookup
+_NOOP = nullcontext()
+
+
+class _Scope:
+    """Makes a span current for a with-block and finishes it on exit."""
+
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        self.span.finish(exc)
+        return False
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def span(name: str, **attributes):
+    """
+    Trace a with-block as a child of the current span (`as` gives the Span).
+    Untraced work gets a shared no-op (`as` gives None). Tasks created inside
+    a span inherit it, so a span that already ended adopts nothing.
+    """
+    parent = _current.get()
+    if parent is None or parent.end is not None:
+        return _NOOP
+    return _Scope(Span(name, parent.trace_id, parent.span_id, attributes))
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) of a W3C traceparent header, or None if malformed."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def format_traceparent(s: Span) -> str:
+    return f"00-{s.trace_id}-{s.span_id}-01"
+
+
+def sample_trace_id() -> Optional[str]:
+    """A new trace id for a job picked by TRACE_SAMPLE_RATE, else None."""
+    if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    return _new_id(16)
+
+
+def trace(name: str, traceparent: Optional[str] = None, **attributes):
+    """
+    Start a trace for a with-block: the block becomes the root span, or a child
+    of the caller's span when a sampled traceparent header is given. Unsampled
+    work gets the shared no-op.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        if not sampled:
+            return _NOOP
+    else:
+        trace_id, parent_id = sample_trace_id(), None
+        if trace_id is None:
+            return _NOOP
+    return _Scope(Span(name, trace_id, parent_id, attributes))
+
+
+def attach(s: Optional[Span]) -> Token:
+    """Make `s` (None: nothing) the current span of this task until detach()."""
+    return _current.set(s)
+
+
+def detach(token: Token):
+    _current.reset(token)
+
+
+def _prune_files():
+    cutoff = time.time() - TRACE_RETENTION_HOURS * 3600
+    for path in glob.glob(os.path.join(TRACE_DIR, "spans-*.jsonl*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """ExportTraceServiceRequest in the OTLP/HTTP JSON encoding."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+        ]},
+        "scopeSpans": [{
+            "scope": {"name": "app.tracing"},
+            "spans": [{
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "parentSpanId": s["parent_id"] or "",
+                "name": s["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(s["start"] * 1e9)),
+                "endTimeUnixNano": str(int(s["end"] * 1e9)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                "status": {"code": 2, "message": s["error"] or ""} if s["status"] == "error" else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """
+    Finished spans go to a background thread, which appends them in batches to
+    this process's JSONL file and/or posts them to an OTLP collector. The most
+    recent traces also stay in memory for /api/job/{id}/trace.
+    """
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._client = None
+        self._collector_ok = True
+        self.exported = 0
+        self.failed = 0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(TRACE_DIR, f"spans-{os.getpid()}.jsonl")
+
+    def export(self, record: Dict[str, Any]):
+        with self._lock:
+            spans = self._recent.get(record["trace_id"])
+            if spans is None:
+                spans = self._recent[record["trace_id"]] = []
+                while len(self._recent) > TRACE_MEMORY_TRACES:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(record["trace_id"])
+            spans.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+
+    def recent(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent.get(trace_id, ()))
+
+    def shutdown(self, timeout: float = 5.0):
+        """Write out the spans still queued. A later export starts a new writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        if TRACE_JSONL:
+            try:
+                os.makedirs(TRACE_DIR, exist_ok=True)
+                _prune_files()
+            except OSError as e:
+                print(f"Error preparing trace directory {TRACE_DIR}: {e}")
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while batch[-1] is not None and len(batch) < _MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if TRACE_JSONL:
+            try:
+                self._append(batch)
+            except OSError as e:
+                self.failed += len(batch)
+                print(f"Error writing spans to {self.path}: {e}")
+        if TRACE_OTLP_ENDPOINT:
+            self._post(batch)
+        self.exported += len(batch)
+
+    def _append(self, batch: List[Dict[str, Any]]):
+        path = self.path
+        if os.path.exists(path) and os.path.getsize(path) >= TRACE_FILE_MAX_BYTES:
+            for i in range(TRACE_FILE_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{path}.{i}"):
+                    os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+            if TRACE_FILE_BACKUPS > 0:
+                os.replace(path, f"{path}.1")
+            else:
+                os.remove(path)
+        with open(path, "a") as f:
+            f.write("".join(json.dumps(record, default=str) + "\n" for record in batch))
+
+    def _post(self, batch: List[Dict[str, Any]]):
+        import httpx
+
+        try:
+            if self._client is None:
+                self._client = httpx.Client(timeout=5.0)
+            response = self._client.post(TRACE_OTLP_ENDPOINT, json=_otlp_payload(batch))
+            response.raise_for_status()
+            if not self._collector_ok:
+                print(f"Trace collector at {TRACE_OTLP_ENDPOINT} is reachable again")
+            self._collector_ok = True
+        except Exception as e:
+            self.failed += len(batch)
+            # Report once per outage, not once per batch
+            if self._collector_ok:
+                print(f"Error exporting spans to {TRACE_OTLP_ENDPOINT}: {e}")
+            self._collector_ok = False
+
+
+exporter = SpanExporter()
+
+
+def find_trace(trace_id: str) -> List[Dict[str, Any]]:
+    """
+    Spans of a trace, merged from this process's memory and every process's
+    span files: a job's spans may come from several workers.
+    """
+    spans = exporter.recent(trace_id)
+    seen = {span["span_id"] for span in spans}
+    for path in glob.glob(os.path.join(TRACE_DIR, "spans-*.jsonl*")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    # Cheap substring test before parsing
+                    if trace_id not in line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("trace_id") == trace_id and record["span_id"] not in seen:
+                        seen.add(record["span_id"])
+                        spans.append(record)
+        except OSError:
+            continue
+    return spans
+
+
+def waterfall(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Spans ordered by start, with offsets from the trace start and nesting depth, for a timeline view."""
+    spans = sorted(spans, key=lambda s: s["start"])
+    if not spans:
+        return {"duration_ms": 0.0, "spans": []}
+    by_id = {s["span_id"]: s for s in spans}
+    origin = spans[0]["start"]
+    end = max(s["end"] for s in spans)
+
+    def depth(s: Dict[str, Any]) -> int:
+        level = 0
+        # Parents outside this trace's records (e.g. an upstream caller) count as the root
+        while s["parent_id"] in by_id and level < len(spans):
+            s = by_id[s["parent_id"]]
+            level += 1
+        return level
+
+    return {
+        "duration_ms": round((end - origin) * 1000, 3),
+        "spans": [{
+            "span_id": s["span_id"],
+            "parent_id": s["parent_id"],
+            "name": s["name"],
+            "depth": depth(s),
+            "offset_ms": round((s["start"] - origin) * 1000, 3),
+            "duration_ms": round((s["end"] - s["start"]) * 1000, 3),
+            "status": s["status"],
+            "error": s["error"],
+            "attributes": s["attributes"],
+            "pid": s["pid"],
+        } for s in spans],
+    }
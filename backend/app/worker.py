@@ -0,0 +1,215 @@
+import asyncio
+import os
+import signal
+import socket
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app import tracing
+from app.database import SessionLocal, Analysis, create_tables, session_scope
+from app.background import hand_over, run_analysis_job
+from app.events import publish_event
+from app.leasing import get_lease_queue, LEASE_SECONDS
+from app.scheduler import scheduler, PRIORITY_INTERACTIVE
+from app.cpu_pool import cpu_pool, startup_sweep
+from app.db_writer import db_writer
+
+# Hand jobs to worker processes (python -m app.worker) instead of running them in the API process
+DISTRIBUTED = os.getenv("DISTRIBUTED_WORKERS", "false").lower() in ("1", "true", "yes")
+# Jobs one worker process runs at once
+WORKER_CAPACITY = int(os.getenv("WORKER_CAPACITY", "2"))
+# Seconds between heartbeats; keep well under LEASE_SECONDS
+HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "10"))
+# Seconds between polls of an empty queue, and of a job handed to the workers
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+
+
+async def run_job(job_id: str, url: str, prompts: Optional[List[str]] = None, max_age: Optional[int] = None,
+                  force: bool = False, priority: int = PRIORITY_INTERACTIVE):
+    """
+    Run a job in this process, or in distributed mode enqueue it for the
+    worker pool and wait until a worker has finished it. Cancelling the wait
+    cancels the job on whichever worker holds it. Returns the job's outcome.
+    """
+    if not DISTRIBUTED:
+        return await run_analysis_job(job_id, url, prompts, max_age, force)
+
+    queue = get_lease_queue()
+    await queue.enqueue(
+        {"job_id": job_id, "url": url, "prompts": prompts, "max_age": max_age, "force": force}, priority
+    )
+    try:
+        while await queue.contains(job_id):
+            await asyncio.sleep(POLL_SECONDS)
+    except asyncio.CancelledError:
+        # At shutdown the job stays with its worker; otherwise cancel it there too
+        if not scheduler.draining:
+            await queue.cancel(job_id)
+        raise
+    return await asyncio.to_thread(_job_status, job_id)
+
+
+def _job_status(job_id: str) -> Optional[str]:
+    with session_scope() as db:
+        return db.query(Analysis.status).filter(Analysis.job_id == job_id).scalar()
+
+
+async def cancel_remote(job_id: str) -> bool:
+    """Withdraw a job from the worker pool (for jobs whose waiting API process is gone)."""
+    if not DISTRIBUTED:
+        return False
+    return await get_lease_queue().cancel(job_id)
+
+
+def _mark_abandoned(job_ids: List[str]):
+    db = SessionLocal()
+    try:
+        for analysis in db.query(Analysis).filter(Analysis.job_id.in_(job_ids)):
+            analysis.status = "failed"
+            analysis.error = f"Worker lease expired repeatedly during stage '{analysis.stage}'"
+            analysis.completed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def fail_abandoned(job_ids: List[str]):
+    """Jobs whose lease expired too many times: their workers keep dying on them."""
+    if not job_ids:
+        return
+    await asyncio.to_thread(_mark_abandoned, job_ids)
+    for job_id in job_ids:
+        await publish_event(job_id, "failed", error="Worker lease expired repeatedly")
+
+
+async def coordinate_cluster():
+    """
+    API-side loop in distributed mode: reclaim expired leases and size the
+    scheduler to the capacity the live workers report.
+    """
+    queue = get_lease_queue()
+    while True:
+        try:
+            reclaimed = await queue.reclaim_expired()
+            await fail_abandoned(reclaimed["abandoned"])
+            workers = await queue.workers()
+            scheduler.resize(max(sum(w["capacity"] for w in workers), 1))
+        except Exception as e:
+            print(f"Error coordinating workers: {e}")
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+
+class Worker:
+    """
+    Claims jobs from the shared work queue under a lease, runs up to
+    `capacity` of them at once, and heartbeats both its registry entry and
+    each lease. A job whose lease is lost is stopped here: a cancelled job
+    records its cancellation, an expired one is left to the worker that
+    resumes it from its checkpoints.
+    """
+
+    def __init__(self, queue=None, worker_id: Optional[str] = None, capacity: int = WORKER_CAPACITY,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.queue = queue or get_lease_queue()
+        self.hostname = socket.gethostname()
+        self.worker_id = worker_id or f"{self.hostname}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.capacity = capacity
+        self.lease_seconds = lease_seconds
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._slot_freed: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def info(self) -> Dict[str, Any]:
+        return {"hostname": self.hostname, "capacity": self.capacity, "load": len(self._tasks)}
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.queue.register_worker(self.worker_id, self.info())
+                for job_id, task in list(self._tasks.items()):
+                    if not await self.queue.heartbeat(self.worker_id, job_id, self.lease_seconds):
+                        if task.done():
+                            continue
+                        if await self.queue.contains(job_id):
+                            # Expired and re-queued: don't report a cancellation the new run would contradict
+                            print(f"Lease on job {job_id} lost; another worker resumes it")
+                            hand_over(job_id)
+                        else:
+                            print(f"Job {job_id} was cancelled; stopping it")
+                        task.cancel()
+                reclaimed = await self.queue.reclaim_expired()
+                await fail_abandoned(reclaimed["abandoned"])
+            except Exception as e:
+                print(f"Error sending worker heartbeat: {e}")
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        try:
+            await run_analysis_job(job_id, job["url"], job.get("prompts"), job.get("max_age"), job.get("force", False))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._tasks.pop(job_id, None)
+            try:
+                await self.queue.complete(self.worker_id, job_id)
+            except Exception as e:
+                print(f"Error completing lease on job {job_id}: {e}")
+            self._slot_freed.set()
+
+    async def run(self):
+        self._slot_freed = asyncio.Event()
+        heartbeats = asyncio.create_task(self._heartbeat_loop())
+        print(f"Worker {self.worker_id} started with capacity {self.capacity}")
+        try:
+            while not self._stopping:
+                if len(self._tasks) >= self.capacity:
+                    self._slot_freed.clear()
+                    await self._slot_freed.wait()
+                    continue
+                try:
+                    job = await self.queue.claim(self.worker_id, self.lease_seconds)
+                except Exception as e:
+                    print(f"Error claiming job: {e}")
+                    job = None
+                if job is None:
+                    await asyncio.sleep(POLL_SECONDS)
+                    continue
+                self._tasks[job["job_id"]] = asyncio.create_task(self._run(job))
+                await self.queue.register_worker(self.worker_id, self.info())
+
+            # Draining: finish what was claimed, heartbeating until the end
+            if self._tasks:
+                await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            heartbeats.cancel()
+            await self.queue.deregister_worker(self.worker_id)
+
+    def stop(self):
+        """Stop claiming new jobs; run() returns once the claimed ones finish."""
+        self._stopping = True
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+
+
+async def main():
+    load_dotenv()
+    create_tables()
+    startup_sweep()
+    worker = Worker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await db_writer.flush()
+        await asyncio.to_thread(tracing.exporter.shutdown)
+        cpu_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Startup import benchmark: imports the API in fresh interpreters under
+`python -X importtime`, prints the slowest imports, and fails when the
+import exceeds its time budget or loads a module API processes must not.
+
+    python import_benchmark.py [--module app.main] [--runs 5] [--budget-ms 1500] [--top 20]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Median wall time allowed for importing the API, in milliseconds
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+# Heavy analyzer dependencies loaded on first use, never at API startup
+FORBIDDEN_MODULES = ("cv2", "numpy", "PIL", "playwright")
+
+CHECK_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = (time.perf_counter() - start) * 1000\n"
+    "print(elapsed)\n"
+    "print(','.join(m for m in {forbidden!r} if m in sys.modules))\n"
+)
+
+
+def run_once(module: str) -> Tuple[float, List[str], Dict[str, Tuple[int, int]]]:
+    """Import `module` in a new interpreter: (wall ms, forbidden modules loaded, importtime table)."""
+    script = CHECK_SCRIPT.format(module=module, forbidden=FORBIDDEN_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        raise SystemExit(f"Importing {module} failed")
+    elapsed, loaded = proc.stdout.split("\n")[-3:-1]
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    table = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        table[name.strip()] = (int(self_us), int(cumulative_us))
+    return float(elapsed), [m for m in loaded.split(",") if m], table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and budget the API's import time")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    timings = []
+    table: Dict[str, Tuple[int, int]] = {}
+    loaded: List[str] = []
+    for _ in range(args.runs):
+        elapsed, loaded, table = run_once(args.module)
+        timings.append(elapsed)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.0f} ms, min {min(timings):.0f} ms over {args.runs} runs")
+    print("\nSlowest imports by cumulative time (last run):")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in sorted(table.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL: {args.module} imports {', '.join(loaded)}; load them lazily (see app.ai_analysis.ANALYZERS)")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: median import time {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print(f"\nOK: within the {args.budget_ms:.0f} ms budget, no heavy analyzer dependencies loaded")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,18 @@
-import uvicorn
-import os
+import argparse
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+from app.launcher import serve, serve_dev
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Vispectra API")
+    parser.add_argument("--reload", action="store_true", help="development mode: one process, reload on code changes")
+    args = parser.parse_args()
+
     # Run the FastAPI application with uvicorn
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=5000,
-        reload=True,  # Enable auto-reload during development
-        log_level="info"
-    )
\ No newline at end of file
+    if args.reload:
+        serve_dev()
+    else:
+        serve()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+# The app keeps its database, results and artifacts under the working directory:
+# the suite uses a scratch one. Settings are read at import, so set them up first
+_workdir = tempfile.mkdtemp(prefix="vispectra-tests-")
+os.makedirs(os.path.join(_workdir, "app", "static", "results"))
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["RECOVER_ON_STARTUP"] = "false"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    from app.database import create_tables
+
+    previous = os.getcwd()
+    os.chdir(_workdir)
+    create_tables()
+    yield _workdir
+    os.chdir(previous)
+
+
+async def fake_capture(url: str, path: str, *args, **kwargs):
+    """Stands in for the browser: a small screenshot that differs by URL, and some page text."""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.random.RandomState(len(url)).rand(120, 160, 3) * 255
+    Image.fromarray(pixels.astype("uint8")).save(path)
+    return "Plain words for a test page. " * 40 + url, []
+
+
+@pytest.fixture(scope="session")
+def client(workdir):
+    from fastapi.testclient import TestClient
+    from app import background
+    from app.main import app
+
+    background.capture_screenshot = fake_capture
+    with TestClient(app) as c:
+        yield c
+
+
+def wait_for_job(client, job_id: str, timeout: float = 15.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/job/{job_id}").json()
+        if job["status"] in ("completed", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
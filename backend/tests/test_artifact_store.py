@@ -0,0 +1,65 @@
+import hashlib
+import threading
+
+import pytest
+
+from app.artifact_store import ArtifactStore, MemoryBackend, blob_key
+from app.database import Artifact, session_scope
+
+
+class FailingBackend(MemoryBackend):
+    def put(self, key, data):
+        raise OSError("disk full")
+
+
+def test_references_are_counted_and_the_last_release_deletes_the_blob():
+    store = ArtifactStore(MemoryBackend())
+    digest = store.put(b"shared bytes", "a.bin")
+    assert store.put(b"shared bytes", "b.bin") == digest
+    assert store.info(digest).refcount == 2
+
+    store.release(digest)
+    assert store.get(digest) == b"shared bytes"
+    store.release(digest)
+    assert store.info(digest) is None
+    assert not store.backend.objects
+
+
+def test_failed_blob_write_drops_the_reference():
+    store = ArtifactStore(FailingBackend())
+    with pytest.raises(OSError):
+        store.put(b"never stored", "a.bin")
+    assert store.info(hashlib.sha256(b"never stored").hexdigest()) is None
+
+
+def test_put_onto_a_pending_row_writes_the_blobs_itself():
+    store = ArtifactStore(MemoryBackend())
+    digest = store.put(b"first writer died", "a.bin")
+    # As if the first publisher committed its row and then failed before writing
+    store.backend.objects.clear()
+    with session_scope() as db:
+        db.query(Artifact).filter(Artifact.digest == digest).update({Artifact.pending: True})
+
+    assert store.put(b"first writer died", "b.bin") == digest
+    assert store.get(digest) == b"first writer died"
+    assert not store.info(digest).pending
+
+
+def test_readers_wait_for_a_pending_blob():
+    store = ArtifactStore(MemoryBackend())
+    digest = store.put(b"written late", "a.bin")
+    blob = store.backend.objects.pop(blob_key(digest, None))
+    with session_scope() as db:
+        db.query(Artifact).filter(Artifact.digest == digest).update({Artifact.pending: True})
+
+    def finish_writing():
+        store.backend.put(blob_key(digest, None), blob)
+        with session_scope() as db:
+            db.query(Artifact).filter(Artifact.digest == digest).update({Artifact.pending: False})
+
+    writer = threading.Timer(0.2, finish_writing)
+    writer.start()
+    try:
+        assert store.get(digest) == b"written late"
+    finally:
+        writer.join()
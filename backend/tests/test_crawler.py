@@ -0,0 +1,152 @@
+import asyncio
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import pytest
+
+from app import crawler
+from app.crawler import SiteCrawler
+
+
+def _urlset(urls: List[str]) -> bytes:
+    entries = "".join(f"<url><loc>{url}</loc></url>" for url in urls)
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+
+def _sitemap_index(urls: List[str]) -> bytes:
+    entries = "".join(f"<sitemap><loc>{url}</loc></sitemap>" for url in urls)
+    return f'<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'.encode()
+
+
+def _html(links: List[str]) -> bytes:
+    return ("<html><body>" + "".join(f'<a href="{href}">x</a>' for href in links) + "</body></html>").encode()
+
+
+class StaticSite:
+    """A local HTTP server answering from a {path: (content type, body)} table and logging each request."""
+
+    def __init__(self):
+        self.pages: Dict[str, Tuple[str, bytes]] = {}
+        self.requests: List[Tuple[float, str]] = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append((time.monotonic(), self.path))
+                page = site.pages.get(self.path)
+                if page is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                content_type, body = page
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def add(self, path: str, body: bytes, content_type: str = "text/html"):
+        self.pages[path] = (content_type, body)
+
+
+@pytest.fixture
+def site():
+    site = StaticSite()
+    site.thread.start()
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_politeness(monkeypatch):
+    # Keep the floor low so the tests choose their own delay
+    monkeypatch.setattr(crawler, "MIN_POLITENESS_DELAY", 0.0)
+
+
+def _crawl(start_url: str, **kwargs) -> List[str]:
+    found: List[str] = []
+
+    async def on_page(url: str):
+        found.append(url)
+
+    kwargs.setdefault("politeness_delay", 0.0)
+    asyncio.run(SiteCrawler(start_url, on_page, **kwargs).run())
+    return found
+
+
+def _add_sitemaps(site: StaticSite):
+    base = site.url
+    site.add("/robots.txt", f"User-agent: *\nSitemap: {base}/sitemap_index.xml\n".encode(), "text/plain")
+    site.add("/sitemap_index.xml", _sitemap_index([f"{base}/pages.xml.gz", f"{base}/more.xml"]), "application/xml")
+    site.add("/pages.xml.gz", gzip.compress(_urlset([
+        f"{base}/a",
+        f"{base}/b",
+        f"{base}/a/",                        # same page as /a
+        f"{base}/b?utm_source=newsletter",   # same page as /b
+        "http://other.example/c",            # another host
+        f"{base}/logo.png",                  # not a page
+    ])), "application/gzip")
+    site.add("/more.xml", _urlset([f"{base}/c", f"{base}/a#top"]), "application/xml")
+
+
+def test_sitemap_index_and_gzipped_sitemap_are_deduplicated_and_filtered(site):
+    _add_sitemaps(site)
+    found = _crawl(site.url)
+    assert found == [f"{site.url}/a", f"{site.url}/b", f"{site.url}/c"]
+
+
+def test_other_hosts_are_kept_when_same_host_only_is_off(site):
+    _add_sitemaps(site)
+    found = _crawl(site.url, same_host_only=False)
+    assert "http://other.example/c" in found
+
+
+def test_max_pages_stops_discovery(site):
+    _add_sitemaps(site)
+    found = _crawl(site.url, max_pages=2)
+    assert found == [f"{site.url}/a", f"{site.url}/b"]
+    # The budget ran out in the first sitemap; the second is never fetched
+    assert "/more.xml" not in [path for _, path in site.requests]
+
+
+def test_link_crawl_without_sitemap(site):
+    site.add("/", _html(["/a", "/a/", "/b#section", "http://other.example/x", "/style.css"]))
+    site.add("/a", _html(["/", "/b", "/c"]))
+    site.add("/b", _html(["/a"]))
+    site.add("/c", _html([]))
+    found = _crawl(site.url + "/")
+    assert sorted(found) == sorted([f"{site.url}/", f"{site.url}/a", f"{site.url}/b", f"{site.url}/c"])
+    # Each page is fetched once, however many times it is linked
+    paths = [path for _, path in site.requests if path not in ("/robots.txt", "/sitemap.xml")]
+    assert sorted(paths) == ["/", "/a", "/b", "/c"]
+
+
+def test_requests_to_a_host_are_spaced_by_the_politeness_delay(site):
+    _add_sitemaps(site)
+    _crawl(site.url, politeness_delay=0.2, fetch_concurrency=4)
+    times = [t for t, _ in site.requests]
+    assert len(times) >= 4
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert min(gaps) >= 0.18
+
+
+def test_politeness_delay_is_floored(monkeypatch):
+    monkeypatch.setattr(crawler, "MIN_POLITENESS_DELAY", 0.5)
+
+    async def on_page(url: str):
+        pass
+
+    assert SiteCrawler("https://example.com", on_page, politeness_delay=0).throttle.delay == 0.5
+    assert SiteCrawler("https://example.com", on_page, politeness_delay=-3).throttle.delay == 0.5
+    assert SiteCrawler("https://example.com", on_page, politeness_delay=2).throttle.delay == 2
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.database import Analysis, session_scope
+from app.db_writer import BatchedWriter
+
+
+def test_updates_within_a_window_share_one_commit():
+    with session_scope() as db:
+        db.add(Analysis(job_id="writer-merge", url="https://example.com", status="pending"))
+
+    async def scenario():
+        writer = BatchedWriter(interval=0.01)
+        writer.update_job("writer-merge", status="processing", stage="capture")
+        await writer.update_job("writer-merge", stage="saliency")
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert writer.flushes == 1
+    with session_scope() as db:
+        row = db.query(Analysis).filter(Analysis.job_id == "writer-merge").one()
+        assert (row.status, row.stage) == ("processing", "saliency")
+
+
+def test_a_failing_write_fails_only_its_own_callers():
+    with session_scope() as db:
+        db.add(Analysis(job_id="writer-survivor", url="https://example.com", status="pending"))
+
+    def broken(db):
+        raise ValueError("bad write")
+
+    async def scenario():
+        writer = BatchedWriter(interval=0.01)
+        bad = writer.submit(broken)
+        good = writer.update_job("writer-survivor", status="completed")
+        await asyncio.gather(bad, good, return_exceptions=True)
+        return bad, good
+
+    bad, good = asyncio.run(scenario())
+    with pytest.raises(ValueError):
+        bad.result()
+    assert good.result() is True
+    with session_scope() as db:
+        assert db.query(Analysis.status).filter(Analysis.job_id == "writer-survivor").scalar() == "completed"
@@ -0,0 +1,35 @@
+import asyncio
+
+from app.database import Analysis, session_scope
+from app.events import InProcessBroker
+
+
+def test_reconnect_after_the_synthesized_terminal_event_gets_204(client):
+    with session_scope() as db:
+        db.add(Analysis(job_id="sse-expired", url="https://example.com", status="completed", geo_score=80.0))
+
+    first = client.get("/api/job/sse-expired/events")
+    assert first.status_code == 200
+    assert "id: 0\nevent: completed" in first.text
+
+    # EventSource reconnects on its own, sending the last id it saw
+    again = client.get("/api/job/sse-expired/events", headers={"Last-Event-ID": "0"})
+    assert again.status_code == 204
+
+
+def test_history_outlives_subscribers_then_is_forgotten():
+    async def scenario():
+        broker = InProcessBroker(history_ttl=0.01)
+        subscriber: asyncio.Queue = asyncio.Queue()
+        broker._subscribers["job"] = {subscriber}
+        await broker.publish("job", "completed")
+
+        await asyncio.sleep(0.05)
+        assert await broker.history("job")
+
+        broker._subscribers["job"].clear()
+        await asyncio.sleep(0.05)
+        assert await broker.history("job") == []
+        assert "job" not in broker._seq
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import Analysis, IdempotencyKey, session_scope
+from conftest import wait_for_job
+
+
+def _post(client, url: str, key: str, **options):
+    return client.post("/api/analyze", json={"url": url, **options}, headers={"Idempotency-Key": key})
+
+
+def test_concurrent_requests_with_one_key_share_one_job(client):
+    url = "https://idempotent.example/page"
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda _: _post(client, url, "key-race"), range(8)))
+
+    assert all(r.status_code == 200 for r in responses)
+    job_ids = {r.json()["job_id"] for r in responses}
+    assert len(job_ids) == 1
+    with session_scope() as db:
+        assert db.query(Analysis).filter(Analysis.url == url).count() == 1
+    assert wait_for_job(client, job_ids.pop())["status"] == "completed"
+
+
+def test_key_reused_for_a_different_request_is_rejected(client):
+    assert _post(client, "https://idempotent.example/a", "key-mismatch").status_code == 200
+    assert _post(client, "https://idempotent.example/b", "key-mismatch").status_code == 422
+
+
+def test_key_always_points_at_an_existing_job(client):
+    job_id = _post(client, "https://idempotent.example/c", "key-atomic").json()["job_id"]
+    with session_scope() as db:
+        record = db.query(IdempotencyKey).filter(IdempotencyKey.job_id == job_id).one()
+        assert db.query(Analysis).filter(Analysis.job_id == record.job_id).count() == 1
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from app.database import Analysis, SessionLocal, session_scope
+from app.leasing import SQLLeaseQueue
+from app.recovery import MAX_ATTEMPTS, recover_interrupted_jobs
+
+
+def test_lease_claim_heartbeat_and_reclaim():
+    async def scenario():
+        queue = SQLLeaseQueue()
+        assert await queue.enqueue({"job_id": "lease-a"}, priority=1)
+        assert await queue.enqueue({"job_id": "lease-b"}, priority=0)
+        assert not await queue.enqueue({"job_id": "lease-a"})
+
+        first = await queue.claim("worker-1")
+        assert first["job_id"] == "lease-b" and first["claims"] == 1
+        assert await queue.heartbeat("worker-1", "lease-b")
+        assert not await queue.heartbeat("worker-2", "lease-b")
+
+        second = await queue.claim("worker-2", lease_seconds=-1)
+        assert second["job_id"] == "lease-a"
+        assert await queue.reclaim_expired(max_claims=1) == {"requeued": [], "abandoned": ["lease-a"]}
+        assert not await queue.contains("lease-a")
+
+        await queue.complete("worker-1", "lease-b")
+        assert await queue.stats() == {"queued": 0, "leased": 0}
+
+    asyncio.run(scenario())
+
+
+def test_lease_queries_run_off_the_event_loop():
+    threads = set()
+
+    def session_factory():
+        threads.add(threading.get_ident())
+        return SessionLocal()
+
+    async def scenario():
+        queue = SQLLeaseQueue(session_factory)
+        await queue.enqueue({"job_id": "lease-thread"})
+        await queue.claim("worker-1")
+        await queue.cancel("lease-thread")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
+
+
+def test_recovery_fails_jobs_out_of_attempts_and_leaves_live_owners_alone():
+    stale = datetime.utcnow() - timedelta(hours=1)
+    with session_scope() as db:
+        db.add(Analysis(job_id="recover-dead", url="https://example.com/dead", status="processing",
+                        attempts=MAX_ATTEMPTS, owner="gone-host:1:dead", owner_heartbeat=stale))
+        db.add(Analysis(job_id="recover-live", url="https://example.com/live", status="processing",
+                        attempts=MAX_ATTEMPTS, owner="other-host:1:live", owner_heartbeat=datetime.utcnow()))
+
+    result = asyncio.run(recover_interrupted_jobs(["recover-dead", "recover-live"]))
+    assert result == {"requeued": 0, "failed": 1}
+    with session_scope() as db:
+        statuses = dict(db.query(Analysis.job_id, Analysis.status).filter(
+            Analysis.job_id.in_(["recover-dead", "recover-live"])
+        ))
+    assert statuses == {"recover-dead": "failed", "recover-live": "processing"}
+
+
+def test_distributed_recovery_leaves_leased_jobs_to_their_worker(monkeypatch):
+    from app import worker
+    from app.leasing import get_lease_queue
+
+    monkeypatch.setattr(worker, "DISTRIBUTED", True)
+    stale = datetime.utcnow() - timedelta(hours=1)
+    with session_scope() as db:
+        db.add(Analysis(job_id="recover-leased", url="https://example.com/leased", status="processing",
+                        attempts=MAX_ATTEMPTS, owner="gone-host:2:api", owner_heartbeat=stale))
+
+    async def scenario():
+        queue = get_lease_queue()
+        await queue.enqueue({"job_id": "recover-leased"})
+        await queue.claim("worker-1")
+        result = await recover_interrupted_jobs(["recover-leased"])
+        await queue.cancel("recover-leased")
+        return result
+
+    assert asyncio.run(scenario()) == {"requeued": 0, "failed": 0}
+    with session_scope() as db:
+        assert db.query(Analysis.status).filter(Analysis.job_id == "recover-leased").scalar() == "processing"
@@ -0,0 +1,18 @@
+from app.near_duplicates import SaliencyIndex
+
+
+def _indexed(index: SaliencyIndex):
+    return {job_id for _, job_id in index.tree.search(0, 256)}
+
+
+def test_index_keeps_the_most_recent_jobs_and_forgets_evicted_ones():
+    index = SaliencyIndex(max_entries=2)
+    index._loaded = True
+    index.add("00" * 32, "job-1")
+    index.add("01" * 32, "job-2")
+    index.add("03" * 32, "job-3")
+    assert _indexed(index) == {"job-2", "job-3"}
+
+    index.remove("job-3")
+    assert _indexed(index) == {"job-2"}
+    assert index.tree.size == 1
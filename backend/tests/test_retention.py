@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from app.artifact_store import artifact_store
+from app.database import ArtifactRef, session_scope
+from app.retention import RetentionManager
+
+
+class OverBudget(RetentionManager):
+    def over_budget(self) -> bool:
+        return True
+
+
+def _publish(job_id: str, name: str, data: bytes, age: timedelta) -> str:
+    digest = artifact_store.add_job_file(job_id, name, data)
+    with session_scope() as db:
+        db.query(ArtifactRef).filter(ArtifactRef.job_id == job_id, ArtifactRef.name == name).update(
+            {ArtifactRef.created_at: datetime.utcnow() - age}
+        )
+    return digest
+
+
+def test_budget_eviction_frees_whole_blobs_and_spares_fresh_overlays():
+    old = timedelta(days=2)
+    shared = _publish("evict-a", "overlay.png", b"overlay shared by two jobs", old)
+    assert _publish("evict-b", "overlay.png", b"overlay shared by two jobs", old) == shared
+    regenerated = _publish("evict-c", "overlay.png", b"overlay rebuilt a moment ago", timedelta(0))
+    screenshot = _publish("evict-a", "screenshot.png", b"screenshot of job a", old)
+
+    # One blob per step: both of its references go, so its bytes do too
+    OverBudget(batch_size=1).enforce_budget(max_steps=1)
+
+    assert artifact_store.info(shared) is None
+    assert "overlay.png" not in artifact_store.manifest("evict-b")
+    assert artifact_store.info(regenerated) is not None
+    assert artifact_store.info(screenshot) is not None
+
+
+def test_screenshots_are_evicted_only_after_overlays():
+    old = timedelta(days=2)
+    overlay = _publish("evict-d", "overlay.png", b"overlay of job d", old)
+    screenshot = _publish("evict-d", "screenshot.png", b"screenshot of job d", old)
+
+    manager = OverBudget(batch_size=1000)
+    manager.enforce_budget(max_steps=1)
+    assert artifact_store.info(overlay) is None
+    assert artifact_store.info(screenshot) is not None
+
+    manager.enforce_budget(max_steps=1)
+    assert artifact_store.info(screenshot) is None
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from app import background
+from app.scheduler import JobScheduler
+from conftest import wait_for_job
+
+
+def test_outcomes_returned_by_jobs_are_counted():
+    async def boom():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        scheduler = JobScheduler(workers=2, host_rate=100, host_burst=100)
+        outcomes = ["completed", "failed", "cached", "cancelled"]
+        futures = [scheduler.submit(f"job-{i}", "https://example.com", lambda o=o: asyncio.sleep(0, o))
+                   for i, o in enumerate(outcomes)]
+        futures.append(scheduler.submit("job-raises", "https://example.com", boom))
+        await asyncio.gather(*futures, return_exceptions=True)
+        await scheduler.stop()
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["completed"], stats["failed"], stats["cancelled"]) == (2, 2, 1)
+
+
+def test_failed_job_shows_in_queue_stats(client, monkeypatch):
+    async def unreachable(url, path, *args, **kwargs):
+        raise ConnectionError("net::ERR_NAME_NOT_RESOLVED")
+
+    monkeypatch.setattr(background, "capture_screenshot", unreachable)
+    before = client.get("/api/queue").json()
+    job_id = client.post("/api/analyze", json={"url": "https://unreachable.example"}).json()["job_id"]
+    assert wait_for_job(client, job_id)["status"] == "failed"
+
+    # The scheduler counts the job just after it has recorded its status
+    deadline = time.monotonic() + 2
+    while client.get("/api/queue").json()["failed"] == before["failed"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert client.get("/api/queue").json()["failed"] == before["failed"] + 1
@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+from app.database import Analysis, StageRecord, session_scope
+from app.db_writer import db_writer
+from app.stages import Fallback, StageRunner
+
+
+def _run(runner: StageRunner, compute):
+    async def scenario():
+        result = await runner.run("saliency", "pixels-hash", compute)
+        await db_writer.flush()
+        return result
+    return asyncio.run(scenario())
+
+
+def _runner(job_id: str) -> StageRunner:
+    output_dir = os.path.join("app", "static", "results", job_id)
+    os.makedirs(output_dir, exist_ok=True)
+    with session_scope() as db:
+        db.add(Analysis(job_id=job_id, url="https://example.com", status="processing"))
+    return StageRunner(Analysis(job_id=job_id, url_key="example.com/"), output_dir)
+
+
+def test_fallback_output_is_used_but_never_reused():
+    first = _runner("fallback-1")
+    output, reused = _run(first, lambda: Fallback({"cta_saliency": 0.5}))
+    assert output == {"cta_saliency": 0.5} and not reused
+    assert first.fallbacks == {"saliency"}
+    with session_scope() as db:
+        assert db.query(StageRecord).filter(StageRecord.job_id == "fallback-1").count() == 0
+
+    # The next job with the same pixels computes for real
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"cta_saliency": 0.8}
+
+    output, reused = _run(_runner("fallback-2"), compute)
+    assert output == {"cta_saliency": 0.8} and not reused and calls == [1]
+
+    # ...and that real result is what later jobs reuse
+    output, reused = _run(_runner("fallback-3"), compute)
+    assert output == {"cta_saliency": 0.8} and reused and calls == [1]